@@ -25,6 +25,8 @@ from api.mod_auth.controllers import mod_auth
 from api.mod_frontend.controllers import mod_frontend
 from api.mod_guild.controllers import mod_guild
 from api.mod_event.controllers import mod_event
+from api.mod_event.signals import events_changed
+from api.mod_outbox.outbox import forward_events_changed
 from api.mod_user.controllers import mod_user
 from api.mod_wow.controllers import mod_wow
 
@@ -36,6 +38,9 @@ app.register_blueprint(mod_event)
 app.register_blueprint(mod_user)
 app.register_blueprint(mod_wow)
 
+# The bot runs in its own processes, notify it through the outbox.
+events_changed.connect(forward_events_changed)
+
 
 @app.route('/')
 def root():
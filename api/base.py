@@ -23,9 +23,13 @@ limitations under the License.
 
 import wtforms_json
 
+from datetime import datetime
 from flask import Flask
 from flask_sqlalchemy import SQLAlchemy
+from pytz import utc
+from sqlalchemy.types import DateTime, TypeDecorator
 from sqlalchemy_serializer import SerializerMixin
+from typing import Optional
 
 from config.flask import secret_key, database_uri
 
@@ -42,6 +46,36 @@ class BaseSerializerMixin(SerializerMixin):
     )
 
 
+class UtcDateTime(TypeDecorator):
+    """Column type storing aware dates as UTC.
+
+    Dates are converted to UTC when sent to the database and are returned as
+    aware UTC dates when loaded, so the models never deal with naive dates.
+    Comparing the column against aware dates is therefore done in the
+    database, whatever their timezone.
+    """
+    impl = DateTime
+    cache_ok = True
+
+    def process_bind_param(self, value: Optional[datetime],
+                           dialect) -> Optional[datetime]:
+        """Converts the aware date to a naive UTC date."""
+        if value is None:
+            return None
+        if value.tzinfo is None:
+            raise ValueError(
+                'The provided date is not associated with a timezone '
+                'which may create side effects; associate a pytz.timezone.')
+        return value.astimezone(utc).replace(tzinfo=None)
+
+    def process_result_value(self, value: Optional[datetime],
+                             dialect) -> Optional[datetime]:
+        """Associates the UTC timezone to the stored date."""
+        if value is None:
+            return None
+        return utc.localize(value)
+
+
 db = SQLAlchemy()
 
 app = Flask(__name__)
@@ -0,0 +1,42 @@
+"""Utilities to run blocking calls, such as Blizzard API requests, in parallel."""
+
+from __future__ import annotations
+
+__LICENSE__ = """
+Copyright 2019 Google LLC
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+    https://www.apache.org/licenses/LICENSE-2.0
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable, Dict, Hashable, Iterable, TypeVar
+
+# Most calls made at once, to stay polite with the remote API.
+MAX_CONCURRENT_CALLS = 8
+
+T = TypeVar('T', bound=Hashable)
+R = TypeVar('R')
+
+
+def call_concurrently(function: Callable[[T], R], items: Iterable[T],
+                      max_workers: int = MAX_CONCURRENT_CALLS
+                      ) -> Dict[T, 'Future[R]']:
+    """Calls function once per distinct item, from a bounded thread pool.
+
+    Returns once all the calls are done, with the future of each item
+    holding its result or exception. The calls run outside of the Flask
+    application context, hence must not use the database.
+    """
+    distinct = list(dict.fromkeys(items))
+    if not distinct:
+        return {}
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(distinct)),
+                            thread_name_prefix='api-call') as executor:
+        return {item: executor.submit(function, item) for item in distinct}
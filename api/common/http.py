@@ -0,0 +1,90 @@
+"""Utilities to manage HTTP caching of the API responses."""
+
+from __future__ import annotations
+
+__LICENSE__ = """
+Copyright 2019 Google LLC
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+    https://www.apache.org/licenses/LICENSE-2.0
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+import hashlib
+
+from datetime import datetime
+from flask import Response, make_response, request
+from flask_sqlalchemy import BaseQuery
+from sqlalchemy import func
+from typing import Any, Callable, Optional, Sequence, Tuple
+
+
+def _scopes_version(scopes: Sequence[BaseQuery],
+                    key: Any = None) -> Tuple[str, Optional[datetime]]:
+    """Returns an ETag and the last modification date of the queried rows.
+
+    The rows themselves are never loaded: a single aggregate query returns
+    the amount of rows and their last modification date for each scope.
+    """
+    aggregates = []
+    for scope in scopes:
+        entity = scope.column_descriptions[0]['entity']
+        aggregates.append(scope.order_by(None).with_entities(
+            func.count(), func.max(entity.date_modified)))
+    query = aggregates[0]
+    if len(aggregates) > 1:
+        query = query.union_all(*aggregates[1:])
+    rows = query.all()
+
+    last_modified = max((date for _, date in rows if date is not None),
+                        default=None)
+    version = repr((request.full_path, key, [tuple(row) for row in rows]))
+    return hashlib.sha1(version.encode()).hexdigest(), last_modified
+
+
+def _current_second() -> datetime:
+    """Returns the current UTC date, truncated to the second."""
+    return datetime.utcnow().replace(microsecond=0)
+
+
+def conditional_response(scopes: Sequence[BaseQuery],
+                         build: Callable[[], Any],
+                         key: Any = None) -> Response:
+    """Returns a 304 response if the rows in scope did not change.
+
+    The ETag of the response is derived from the amount of rows matched by
+    each scope and their last modification date, so a matching
+    If-None-Match header skips the build of the response altogether.
+    Clients are asked to always revalidate, as Last-Modified is informative
+    only: it cannot reflect deleted rows.
+
+    This assumes date_modified is set by the database in UTC.
+
+    :param scopes: Queries matching all the rows the response depends on.
+        Their models must have a date_modified column.
+    :param build: Builds the response if the rows changed.
+    :param key: Values the response depends on, besides the request path.
+    """
+    etag, last_modified = _scopes_version(scopes, key)
+    if last_modified is not None and last_modified >= _current_second():
+        # Modification dates have a precision of one second: rows modified
+        # during the current second may still change without altering the
+        # ETag. Do not hand out an ETag until that second is over.
+        response = make_response(build())
+        response.cache_control.no_cache = True
+        return response
+    if request.if_none_match.contains(etag):
+        response = Response(status=304)
+    else:
+        response = make_response(build())
+        if response.status_code != 200:
+            return response
+    response.set_etag(etag)
+    response.last_modified = last_modified
+    response.cache_control.no_cache = True
+    return response
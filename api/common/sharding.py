@@ -0,0 +1,39 @@
+"""Utilities to split the guilds between the bot shards."""
+
+from __future__ import annotations
+
+__LICENSE__ = """
+Copyright 2019 Google LLC
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+    https://www.apache.org/licenses/LICENSE-2.0
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+from typing import NamedTuple, Union
+
+from sqlalchemy import Integer, cast
+from sqlalchemy.sql import ColumnElement
+
+
+class Shard(NamedTuple):
+    """A shard of the bot, owning a subset of the guilds.
+
+    Guilds are assigned to shards as Discord does: the shard of a guild is
+    (guild_id >> 22) % count, i.e. based on the guild creation timestamp.
+    """
+    id: int
+    count: int
+
+    def owns(self, guild_id: Union[int, str]) -> bool:
+        """Whether the guild is handled by this shard."""
+        return (int(guild_id) >> 22) % self.count == self.id
+
+    def filter(self, column) -> ColumnElement:
+        """Returns a SQL condition matching the guild IDs of this shard."""
+        return cast(column, Integer).op('>>')(22) % self.count == self.id
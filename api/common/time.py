@@ -0,0 +1,36 @@
+"""Utilities to manage dates sent to the backend."""
+
+from __future__ import annotations
+
+__LICENSE__ = """
+Copyright 2019 Google LLC
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+    https://www.apache.org/licenses/LICENSE-2.0
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+from datetime import datetime
+from dateutil.parser import isoparse
+from pytz import utc
+from typing import Optional
+
+
+def parse_instant(value: Optional[str],
+                  default: Optional[datetime] = None) -> Optional[datetime]:
+    """Parses an ISO 8601 date, typically from a query parameter.
+
+    Dates without timezone are considered to be UTC. Raises ValueError if the
+    provided value is not a valid date.
+    """
+    if not value:
+        return default
+    date = isoparse(value)
+    if date.tzinfo is None:
+        date = utc.localize(date)
+    return date
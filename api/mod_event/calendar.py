@@ -0,0 +1,190 @@
+"""Export of events in the iCalendar format (RFC 5545)."""
+
+from __future__ import annotations
+
+__LICENSE__ = """
+Copyright 2019 Google LLC
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+    https://www.apache.org/licenses/LICENSE-2.0
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+from datetime import datetime, timedelta
+from pytz import utc, timezone
+from typing import Iterable, Iterator, List, Optional, Set
+
+from api.mod_event.event import Event, EventRepetitionFrequency
+
+# Product identifier of the generated calendars.
+PRODID = '-//discord-event-manager//EN'
+
+# Conversion of the repetition frequencies to iCalendar recurrence rules.
+_RRULE_FREQUENCIES = {
+    EventRepetitionFrequency.daily: 'DAILY',
+    EventRepetitionFrequency.weekly: 'WEEKLY',
+}
+
+# Maximum length of a content line, in octets, before being folded.
+_MAX_LINE_LENGTH = 75
+
+# Timezone definitions describe the offset changes since this date, the
+# application not holding earlier events.
+_VTIMEZONE_SINCE = datetime(2019, 1, 1)
+
+
+def _escape_text(text: str) -> str:
+    """Escapes a text value as required by the iCalendar format."""
+    return (text.replace('\\', '\\\\').replace(';', '\\;')
+            .replace(',', '\\,').replace('\r\n', '\\n').replace('\n', '\\n'))
+
+
+def _fold(line: str) -> str:
+    """Folds a content line longer than 75 octets, terminated by CRLF."""
+    encoded = line.encode('utf-8')
+    if len(encoded) <= _MAX_LINE_LENGTH:
+        return line + '\r\n'
+    chunks: List[str] = []
+    current = ''
+    for char in line:
+        # Continuation lines start with a space, which counts in the limit.
+        limit = _MAX_LINE_LENGTH - (1 if chunks else 0)
+        if len((current + char).encode('utf-8')) > limit:
+            chunks.append(current)
+            current = ''
+        current += char
+    chunks.append(current)
+    return '\r\n '.join(chunks) + '\r\n'
+
+
+def _format_offset(offset: timedelta) -> str:
+    """Formats a UTC offset as required by TZOFFSETFROM and TZOFFSETTO."""
+    minutes = int(offset.total_seconds()) // 60
+    sign = '-' if minutes < 0 else '+'
+    return '%s%02d%02d' % (sign, abs(minutes) // 60, abs(minutes) % 60)
+
+
+def _vtimezone(zone: str) -> List[str]:
+    """Returns the lines of a VTIMEZONE block defining a timezone.
+
+    Each offset change since _VTIMEZONE_SINCE is described by its own
+    observance, starting with the one in force at this date.
+    """
+    tz = timezone(zone)
+    block = ['BEGIN:VTIMEZONE', 'TZID:' + zone]
+    # Fixed offset timezones have no transitions.
+    transitions = list(zip(getattr(tz, '_utc_transition_times', []),
+                           getattr(tz, '_transition_info', [])))
+    if not transitions:
+        offset = tz.utcoffset(_VTIMEZONE_SINCE)
+        transitions = [(datetime.min, (offset, timedelta(0), tz.tzname(_VTIMEZONE_SINCE)))]
+    first = max(index for index, (when, _) in enumerate(transitions)
+                if when <= _VTIMEZONE_SINCE)
+    for index in range(first, len(transitions)):
+        when, (offset, dst, name) = transitions[index]
+        if index:
+            previous_offset = transitions[index - 1][1][0]
+            # Observances start at the local time in force before the change.
+            start = when + previous_offset
+        else:
+            previous_offset, start = offset, datetime(1970, 1, 1)
+        kind = 'DAYLIGHT' if dst else 'STANDARD'
+        block.extend(('BEGIN:' + kind,
+                      'DTSTART:' + start.strftime('%Y%m%dT%H%M%S'),
+                      'TZOFFSETFROM:' + _format_offset(previous_offset),
+                      'TZOFFSETTO:' + _format_offset(offset),
+                      'TZNAME:' + name,
+                      'END:' + kind))
+    block.append('END:VTIMEZONE')
+    return block
+
+
+def _format_date(date: datetime, prop: str, zones: Set[str]) -> str:
+    """Formats a date property in the timezone of the date.
+
+    Dates are expressed in their original timezone so the local hour of
+    repeated events remains stable across daylight saving time changes. The
+    timezones referenced are added to zones, as they must be defined by a
+    VTIMEZONE block of the calendar.
+    """
+    zone = getattr(date.tzinfo, 'zone', 'UTC')
+    if zone == 'UTC':
+        return '%s:%s' % (prop, date.astimezone(utc).strftime('%Y%m%dT%H%M%SZ'))
+    zones.add(zone)
+    return '%s;TZID=%s:%s' % (prop, zone, date.strftime('%Y%m%dT%H%M%S'))
+
+
+def _vevent(event: Event, lines: List[str], zones: Set[str],
+            recurrence_id: Optional[datetime] = None) -> List[str]:
+    """Returns the lines of a VEVENT block, with the given extra lines."""
+    uid = 'event-%s@discord-event-manager' % event.id
+    stamp = event.date_modified or datetime.utcnow()
+    block = ['BEGIN:VEVENT',
+             'UID:' + uid,
+             'DTSTAMP:' + stamp.strftime('%Y%m%dT%H%M%SZ')]
+    if recurrence_id is not None:
+        block.append(_format_date(recurrence_id, 'RECURRENCE-ID', zones))
+    block.append('SUMMARY:' + _escape_text(event.title or ''))
+    if event.description:
+        block.append('DESCRIPTION:' + _escape_text(event.description))
+    block.extend(lines)
+    block.append('END:VEVENT')
+    return block
+
+
+def event_to_ical(event: Event, zones: Optional[Set[str]] = None) -> str:
+    """Returns the iCalendar blocks describing an event.
+
+    Repeated events are described by a single recurrence rule. Cancelled
+    occurrences are excluded from it, and moved occurrences are described by
+    an additional VEVENT overriding the original occurrence.
+
+    The timezones referenced by the blocks are added to zones, if given.
+    """
+    zones = zones if zones is not None else set()
+    lines = [_format_date(event.date, 'DTSTART', zones)]
+    frequency = _RRULE_FREQUENCIES.get(event.repetition)
+    overrides = []
+    if frequency is not None:
+        lines.append('RRULE:FREQ=%s' % frequency)
+        overrides = sorted(event.overrides, key=lambda o: o.position)
+        for override in overrides:
+            if override.cancelled:
+                lines.append(_format_date(
+                    event.date_at(override.position), 'EXDATE', zones))
+
+    blocks = _vevent(event, lines, zones)
+    for override in overrides:
+        if override.cancelled or override.date is None:
+            continue
+        blocks.extend(_vevent(
+            event, [_format_date(override.date, 'DTSTART', zones)], zones,
+            recurrence_id=event.date_at(override.position)))
+    return ''.join(_fold(line) for line in blocks)
+
+
+def events_to_ical(events: Iterable[Event], name: str) -> Iterator[str]:
+    """Yields a complete calendar containing the provided events.
+
+    Events are consumed lazily, allowing to stream the calendar. Timezones
+    are defined right before the first event referencing them.
+    """
+    yield ''.join(_fold(line) for line in (
+        'BEGIN:VCALENDAR',
+        'VERSION:2.0',
+        'PRODID:' + PRODID,
+        'X-WR-CALNAME:' + _escape_text(name)))
+    defined: Set[str] = set()
+    for event in events:
+        zones: Set[str] = set()
+        blocks = event_to_ical(event, zones)
+        for zone in sorted(zones - defined):
+            yield ''.join(_fold(line) for line in _vtimezone(zone))
+        defined |= zones
+        yield blocks
+    yield _fold('END:VCALENDAR')
@@ -0,0 +1,101 @@
+import unittest
+
+__LICENSE__ = """
+Copyright 2019 Google LLC
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    https://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+from datetime import datetime
+from pytz import utc, timezone
+
+from api.common.testing import DatabaseTestFixture
+from api.mod_event.calendar import event_to_ical, events_to_ical
+from api.mod_event.event import Event, EventRepetitionFrequency
+from api.mod_guild.guild import Guild
+
+
+class TestCalendarExport(DatabaseTestFixture, unittest.TestCase):
+    """Checks events are exported in the iCalendar format."""
+
+    def test_single_event(self):
+        """Checks a non-repeated event is a simple VEVENT."""
+        event = Event(Guild(12345), 'Raid; bring food',
+                      datetime(2020, 10, 10, 20, 0, tzinfo=utc))
+        self.db.session.add(event)
+        self.db.session.commit()
+
+        lines = event_to_ical(event).split('\r\n')
+
+        self.assertIn('DTSTART:20201010T200000Z', lines)
+        self.assertIn('SUMMARY:Raid\\; bring food', lines)
+        self.assertFalse(any(l.startswith('RRULE') for l in lines))
+
+    def test_repeated_event_uses_recurrence_rule(self):
+        """Checks a repeated event is exported once with its changes."""
+        paris = timezone('Europe/Paris')
+        event = Event(Guild(12345), 'Raid',
+                      paris.localize(datetime(2020, 10, 7, 21, 0)),
+                      repetition=EventRepetitionFrequency.weekly)
+        self.db.session.add(event)
+        event.override_occurrence(1).cancelled = True
+        event.override_occurrence(2).date = paris.localize(
+            datetime(2020, 10, 22, 20, 0))
+        self.db.session.commit()
+
+        lines = event_to_ical(event).split('\r\n')
+
+        self.assertIn('DTSTART;TZID=Europe/Paris:20201007T210000', lines)
+        self.assertIn('RRULE:FREQ=WEEKLY', lines)
+        self.assertIn('EXDATE;TZID=Europe/Paris:20201014T210000', lines)
+        self.assertIn('RECURRENCE-ID;TZID=Europe/Paris:20201021T210000', lines)
+        self.assertIn('DTSTART;TZID=Europe/Paris:20201022T200000', lines)
+        self.assertEqual(lines.count('BEGIN:VEVENT'), 2)
+
+    def test_timezones_are_defined(self):
+        """Checks each timezone referenced is defined once, before its use."""
+        paris = timezone('Europe/Paris')
+        guild = Guild(12345)
+        events = [Event(guild, title, paris.localize(datetime(2020, 10, 7, 21, 0)),
+                        repetition=EventRepetitionFrequency.weekly)
+                  for title in ('Raid', 'Dungeon')]
+        events.append(Event(guild, 'Mythic', datetime(2020, 10, 9, tzinfo=utc)))
+        self.db.session.add_all(events)
+        self.db.session.commit()
+
+        lines = ''.join(events_to_ical(events, 'Guild')).split('\r\n')
+
+        self.assertEqual(lines.count('BEGIN:VTIMEZONE'), 1)
+        self.assertLess(lines.index('TZID:Europe/Paris'), lines.index('BEGIN:VEVENT'))
+        start = lines.index('DTSTART:20200329T020000')
+        self.assertEqual(lines[start - 1:start + 4], [
+            'BEGIN:DAYLIGHT', 'DTSTART:20200329T020000', 'TZOFFSETFROM:+0100',
+            'TZOFFSETTO:+0200', 'TZNAME:CEST'])
+
+    def test_long_lines_are_folded(self):
+        """Checks content lines never exceed 75 octets."""
+        event = Event(Guild(12345), 'Raid',
+                      datetime(2020, 10, 10, 20, 0, tzinfo=utc),
+                      description='é' * 100)
+        self.db.session.add(event)
+        self.db.session.commit()
+
+        calendar = ''.join(events_to_ical([event], 'Guild'))
+
+        for line in calendar.split('\r\n'):
+            self.assertLessEqual(len(line.encode('utf-8')), 75)
+        self.assertIn('é' * 100, calendar.replace('\r\n ', ''))
+
+
+if __name__ == '__main__':
+    unittest.main()
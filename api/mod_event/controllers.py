@@ -15,34 +15,65 @@ See the License for the specific language governing permissions and
 limitations under the License.
 """
 
-from flask import Blueprint, jsonify
-from datetime import timedelta
+from flask import Blueprint, jsonify, request
+from datetime import datetime, timedelta
+from pytz import utc
 
 from api.base import db
-from api.mod_event.event import Event
+from api.common.http import conditional_response
+from api.common.time import parse_instant
+from api.mod_event.event import Event, EventOccurrence, EventOccurrenceOverride
+from api.mod_event.forms import EventListingForm, OccurrenceUpdateForm
+from api.mod_event.signals import events_changed
+from api.mod_outbox.outbox import OutboxMessage, OutboxMessageKind
 
 mod_event = Blueprint('event', __name__, url_prefix='/api/events')
 
 # The maximum amount of generation period possible when creating new events.
 MAX_TIMEDELTA_EVENT_GENERATION = timedelta(weeks=4)
 
+# The maximum time window occurrences can be computed on in a single request.
+MAX_TIMEDELTA_OCCURRENCES = timedelta(weeks=53)
+
+# Granularity of the start of the default occurrences window. The window only
+# moves once per period, so clients polling it can be answered with a 304.
+OCCURRENCES_WINDOW_STEP = timedelta(hours=1)
+
 
 @mod_event.route('/')
 def get_all_events():
-    """Returns all events in the database."""
+    """Returns a page of the events in the database, ordered by date.
+
+    The listing is filtered through the `from`, `to` and `guild` query
+    parameters. Pages are requested by providing the `next_cursor` returned
+    by the previous page as the `after` parameter, and sized with `limit`.
+    """
     # TODO(funkysayu): Implement the user visibility limit.
-    events = Event.query.all()
-    return jsonify(events=[e.to_dict() for e in events])
+    form = EventListingForm.from_args(request.args)
+    if not form.validate():
+        return jsonify(error='Invalid request', form_errors=form.errors), 400
+
+    def build():
+        events, next_cursor = form.query_page()
+        return jsonify(events=[e.to_dict() for e in events],
+                       next_cursor=next_cursor)
+
+    return conditional_response([form.query_scope()], build)
 
 
 @mod_event.route('/<int:event_id>')
 def get_event(event_id: int):
     """Returns one event."""
     # TODO(funkysayu): Implement the user visibility limit.
-    event = Event.query.filter_by(id=event_id).one_or_none()
-    if event is None:
-        return jsonify(error='Event %r not found' % event_id), 404
-    return jsonify(event.to_dict())
+    scope = Event.query.filter_by(id=event_id)
+
+    def build():
+        event = scope.one_or_none()
+        if event is None:
+            return jsonify(error='Event %r not found' % event_id), 404
+        return jsonify(event.to_dict())
+
+    return conditional_response([scope], build)
 
 
 @mod_event.route('/<int:event_id>:next')
@@ -77,5 +108,100 @@ def get_next_event(event_id: int):
 
     db.session.add(next_event)
     db.session.commit()
+    events_changed.send(next_event.guild_id)
 
     return jsonify(next_event.to_dict())
+
+
+@mod_event.route('/<int:event_id>/occurrences')
+def get_event_occurrences(event_id: int):
+    """Returns the occurrences of an event within a time window.
+
+    The window is set through the `from` and `to` ISO 8601 query parameters
+    and defaults to the MAX_TIMEDELTA_EVENT_GENERATION starting at the current
+    OCCURRENCES_WINDOW_STEP. Occurrences are computed from the event
+    repetition, without creating any event.
+    """
+    # TODO(funkysayu): Implement the user visibility limit.
+    elapsed = datetime.now(utc) - datetime(1970, 1, 1, tzinfo=utc)
+    window_start = datetime(1970, 1, 1, tzinfo=utc) + (
+        elapsed - elapsed % OCCURRENCES_WINDOW_STEP)
+    try:
+        start = parse_instant(request.args.get('from'), window_start)
+        end = parse_instant(request.args.get('to'),
+                            start + MAX_TIMEDELTA_EVENT_GENERATION)
+    except ValueError:
+        return jsonify(error='Invalid from/to date provided'), 400
+    if end - start > MAX_TIMEDELTA_OCCURRENCES:
+        return jsonify(
+            error='Time window is over the maximum occurrences period',
+            max_period=str(MAX_TIMEDELTA_OCCURRENCES)), 400
+
+    scopes = [Event.query.filter_by(id=event_id),
+              EventOccurrenceOverride.query.filter_by(event_id=event_id)]
+
+    def build():
+        event = scopes[0].one_or_none()
+        if event is None:
+            return jsonify(error='Event %r not found' % event_id), 404
+        occurrences = event.occurrences_between(start, end)
+        return jsonify(occurrences=[o.to_dict() for o in occurrences])
+
+    # The range depends on the current time step when not provided.
+    return conditional_response(scopes, build, key=(start, end))
+
+
+@mod_event.route('/<int:event_id>/occurrences/<int:position>',
+                 methods=['PUT'])
+def update_event_occurrence(event_id: int, position: int):
+    """Cancels or moves a single occurrence of a repeated event."""
+    # TODO(funkysayu): Implement the visibility limit.
+    form = OccurrenceUpdateForm.from_json(request.get_json())
+    if not form.validate():
+        return jsonify(error='Invalid request', form_errors=form.errors), 400
+    event = Event.query.filter_by(id=event_id).one_or_none()
+    if event is None:
+        return jsonify(error='Event %r not found' % event_id), 404
+
+    try:
+        override = form.apply_to_occurrence(event, position)
+    except ValueError:
+        return jsonify(
+            error='Cannot change the occurrence of a non-repeated event.'), 412
+    db.session.add(override)
+    db.session.commit()
+    events_changed.send(event.guild_id)
+
+    occurrence = EventOccurrence(
+        event, position, event.date_at(position), override)
+    return jsonify(occurrence.to_dict())
+
+
+@mod_event.route('/<int:event_id>/reminders', methods=['POST'])
+def send_event_reminder(event_id: int):
+    """Asks the bot to remind the guild of the next occurrence of an event.
+
+    The bot runs in another process: the request is accepted once stored,
+    and handled by the bot shortly after.
+    """
+    # TODO(funkysayu): Implement the visibility limit.
+    event = Event.query.filter_by(id=event_id).one_or_none()
+    if event is None:
+        return jsonify(error='Event %r not found' % event_id), 404
+
+    now = datetime.now(utc)
+    occurrences = [o for o in event.occurrences_between(
+        now, now + MAX_TIMEDELTA_EVENT_GENERATION) if not o.cancelled]
+    if not occurrences:
+        return jsonify(error='Event %r has no upcoming occurrence' % event_id), 412
+
+    occurrence = occurrences[0]
+    message = OutboxMessage(event.guild_id, OutboxMessageKind.reminder, {
+        'event_id': event.id,
+        'position': occurrence.position,
+        'title': event.title,
+        'date': occurrence.date.astimezone(event.timezone).isoformat(),
+    })
+    db.session.add(message)
+    db.session.commit()
+    return jsonify(id=message.id), 202
@@ -17,11 +17,13 @@ import unittest
 
 from datetime import datetime
 from pytz import utc
+from sqlalchemy import update
 
 from api.common.testing import ControllerTestFixture
 from api.mod_event.controllers import mod_event
 from api.mod_event.event import Event, EventRepetitionFrequency
 from api.mod_guild.guild import Guild
+from api.mod_outbox.outbox import OutboxMessage, OutboxMessageKind
 
 
 class TestEventControllers(ControllerTestFixture, unittest.TestCase):
@@ -52,6 +54,37 @@ class TestEventControllers(ControllerTestFixture, unittest.TestCase):
         self.assertEqual(len(results.json.get('events')), 2)
         self.assertEqual(set(e.get('id') for e in events), {1, 2})
 
+    def test_get_all_events_is_paginated(self):
+        """Ensure events are listed page by page, ordered by date."""
+        with self.client as client:
+            first = client.get('/api/events/?limit=1')
+            second = client.get(
+                '/api/events/?limit=1&after=' + first.json['next_cursor'])
+
+        self.assertEqual([e['title'] for e in first.json['events']], ['One'])
+        self.assertEqual([e['title'] for e in second.json['events']], ['Two'])
+        self.assertIsNone(second.json['next_cursor'])
+
+    def test_get_all_events_filters(self):
+        """Ensure events can be filtered by date range and guild."""
+        with self.client as client:
+            in_range = client.get('/api/events/?from=2020-10-10T10:30:00Z'
+                                  '&to=2020-10-11')
+            other_guild = client.get('/api/events/?guild=54321')
+
+        self.assertEqual([e['title'] for e in in_range.json['events']],
+                         ['Two'])
+        self.assertEqual(other_guild.json['events'], [])
+
+    def test_get_all_events_rejects_invalid_parameters(self):
+        """Ensure invalid listing parameters are reported."""
+        with self.client as client:
+            results = client.get('/api/events/?limit=0&after=nope&from=x')
+
+        self.assertEqual(results.status_code, 400)
+        self.assertEqual(set(results.json['form_errors']),
+                         {'limit', 'after', 'start'})
+
     def test_get_event(self):
         """Ensure we can retrieve a single event with its basic info."""
         with self.client as client:
@@ -63,6 +96,56 @@ class TestEventControllers(ControllerTestFixture, unittest.TestCase):
         self.assertEqual(results.json['timezone_name'], 'UTC')
         self.assertEqual(results.json['timezone_offset'], '+0000')
 
+    def mark_events_as_old(self):
+        """Moves the modification date of all events in the past.
+
+        Rows modified during the current second are never cached.
+        """
+        self.db.session.execute(update(Event).values(
+            date_modified=datetime(2020, 1, 1)))
+        self.db.session.commit()
+
+    def test_get_event_is_conditional(self):
+        """Ensure unchanged events are not sent twice."""
+        self.mark_events_as_old()
+        with self.client as client:
+            first = client.get('/api/events/1')
+            second = client.get('/api/events/1', headers={
+                'If-None-Match': first.headers['ETag']})
+            Event.query.filter_by(id=1).one().title = 'Changed'
+            self.db.session.commit()
+            third = client.get('/api/events/1', headers={
+                'If-None-Match': first.headers['ETag']})
+
+        self.assertEqual(first.status_code, 200)
+        self.assertEqual(second.status_code, 304)
+        self.assertEqual(third.status_code, 200)
+        self.assertEqual(third.json['title'], 'Changed')
+
+    def test_get_all_events_is_conditional(self):
+        """Ensure the listing changes when an event is removed."""
+        self.mark_events_as_old()
+        with self.client as client:
+            first = client.get('/api/events/')
+            second = client.get('/api/events/', headers={
+                'If-None-Match': first.headers['ETag']})
+            self.db.session.delete(Event.query.filter_by(id=2).one())
+            self.db.session.commit()
+            third = client.get('/api/events/', headers={
+                'If-None-Match': first.headers['ETag']})
+
+        self.assertEqual(second.status_code, 304)
+        self.assertEqual(third.status_code, 200)
+        self.assertEqual(len(third.json['events']), 1)
+
+    def test_recently_modified_events_are_not_cached(self):
+        """Ensure no ETag is returned for rows modified this second."""
+        with self.client as client:
+            results = client.get('/api/events/1')
+
+        self.assertEqual(results.status_code, 200)
+        self.assertNotIn('ETag', results.headers)
+
     def test_get_next_event(self):
         """Ensure we can get the next event, if repeated."""
         with self.client as client:
@@ -92,3 +175,47 @@ class TestEventControllers(ControllerTestFixture, unittest.TestCase):
                 event_id = results.json['id']
             else:
                 self.fail('Event were still generated after 10 tries.')
+
+    def test_get_event_occurrences(self):
+        """Ensure occurrences are computed over the requested range."""
+        with self.client as client:
+            results = client.get('/api/events/2/occurrences'
+                                 '?from=2020-10-01T00:00:00Z'
+                                 '&to=2020-10-25T00:00:00Z')
+
+        occurrences = results.json['occurrences']
+        self.assertEqual([o['position'] for o in occurrences], [0, 1, 2])
+        self.assertTrue(occurrences[2]['date'].startswith('2020-10-24 11:00'))
+        self.assertEqual(Event.query.count(), 2)
+
+    def test_get_event_occurrences_is_conditional(self):
+        """Ensure clients polling the default window can get a 304."""
+        self.mark_events_as_old()
+        with self.client as client:
+            first = client.get('/api/events/2/occurrences')
+            second = client.get('/api/events/2/occurrences', headers={
+                'If-None-Match': first.headers['ETag']})
+
+        self.assertEqual(first.status_code, 200)
+        self.assertEqual(second.status_code, 304)
+
+    def test_get_event_occurrences_has_a_limit(self):
+        """Ensure the occurrences cannot be computed over a huge range."""
+        with self.client as client:
+            results = client.get('/api/events/2/occurrences'
+                                 '?from=2020-01-01&to=2030-01-01')
+
+        self.assertEqual(results.status_code, 400)
+
+    def test_update_event_occurrence(self):
+        """Ensure an occurrence can be cancelled without creating events."""
+        with self.client as client:
+            client.put('/api/events/2/occurrences/1',
+                       json={'cancelled': True})
+            results = client.get('/api/events/2/occurrences'
+                                 '?from=2020-10-01&to=2020-10-25')
+
+        occurrences = results.json['occurrences']
+        self.assertEqual([o['cancelled'] for o in occurrences],
+                         [False, True, False])
+        self.assertEqual(Event.query.count(), 2)
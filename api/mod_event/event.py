@@ -18,18 +18,33 @@ See the License for the specific language governing permissions and
 limitations under the License.
 """
 
+import base64
+import itertools
 import logging
+import math
 
 from enum import Enum
 from datetime import datetime, timedelta
 from flask_sqlalchemy import BaseQuery
-from typing import Optional, Any
+from sqlalchemy import and_, bindparam, event as sa_event, or_, select
+from sqlalchemy.ext.hybrid import hybrid_property
+from sqlalchemy.orm import selectinload
+from typing import Optional, Any, Dict, List, Tuple
 from pytz import utc, timezone, tzfile
 
-from api.base import db, BaseSerializerMixin
+from api.base import db, BaseSerializerMixin, UtcDateTime
+from api.common.sharding import Shard
 from api.mod_guild.guild import Guild
 
 
+# Origin of the cursors used to paginate events.
+_EPOCH = datetime(1970, 1, 1, tzinfo=utc)
+
+# Largest shift of the UTC time of day of a repeated event between two of
+# its occurrences, due to the changes of the offset of its timezone.
+_SERIES_MARGIN = timedelta(hours=3)
+
+
 class EventRepetitionFrequency(Enum):
     """Frequency at which an event should be repeated."""
     not_repeated = 'NOT_REPEATED'
@@ -70,6 +85,14 @@ class Event(db.Model, BaseSerializerMixin):
     :attr repetition: A frequency at which the event should be repeated.
     """
     __tablename__ = 'event'
+    __table_args__ = (
+        # Most queries list the events of a guild within a time range.
+        db.Index('ix_event_guild_id_date_utc', 'guild_id', '_date_utc'),
+        # Listing of all events is paginated on (date, id).
+        db.Index('ix_event_date_utc_id', '_date_utc', 'id'),
+        # Repeated events are looked up by time of the day or of the week.
+        db.Index('ix_event_repetition_minute', 'repetition', '_minute_of_period'),
+    )
 
     # Automatically created by db.Model but clarifying existence for mypy.
     query: BaseQuery
@@ -79,9 +102,11 @@ class Event(db.Model, BaseSerializerMixin):
         # Add the timezone informations
         'date', 'timezone_offset',
         # Remove internal representation of the date, which would be confusing
-        '-_date_utc',
+        '-_date_utc', '-_minute_of_period',
         # Remove circular dependency from the relationships
         '-guild', '-guild_id',
+        # Occurrence overrides are exposed through the occurrences route.
+        '-overrides',
     )
 
     id = db.Column(db.Integer, primary_key=True)
@@ -97,13 +122,24 @@ class Event(db.Model, BaseSerializerMixin):
     title = db.Column(db.String)
     description = db.Column(db.String)
 
-    _date_utc = db.Column(db.DateTime)
+    _date_utc = db.Column(UtcDateTime)
     timezone_name = db.Column(db.String)
     repetition = db.Column(db.Enum(EventRepetitionFrequency))
+    # Minute of the repetition period the event starts at, in UTC. Kept up
+    # to date from the date and repetition, see minute_of_period.
+    _minute_of_period = db.Column(db.Integer)
 
     # Relationships
     guild_id = db.Column(db.Integer, db.ForeignKey('guild.id'))
     guild = db.relationship('Guild', uselist=False, back_populates='events')
+    overrides = db.relationship('EventOccurrenceOverride', uselist=True,
+                                back_populates='event',
+                                cascade='all, delete-orphan')
+
+    # Per-instance memoization of the date in its timezone, keyed by the
+    # stored values it was computed from. Not persisted.
+    _date_cache: Optional[Tuple[datetime, str, datetime]] = None
+    _timezone_cache: Optional[Tuple[str, tzfile]] = None
 
     def __init__(self, guild: Guild,
                  title: str, date: datetime, description: str = "",
@@ -123,12 +159,21 @@ class Event(db.Model, BaseSerializerMixin):
         """Returns a debugging representation of the event."""
         return f'<Event "{self.title}" {self.date.isoformat()}>'
 
-    @property
+    @hybrid_property
     def date(self):
-        """Returns the date normalized on the original timezone."""
-        if self._date_utc.tzinfo is None:
-            self._date_utc = utc.localize(self._date_utc)
-        return self.timezone.normalize(self._date_utc)
+        """Returns the date normalized on the original timezone.
+
+        The normalized date is memoized until the stored date or timezone
+        changes. Reading the date never modifies the record.
+        """
+        date_utc, timezone_name = self._date_utc, self.timezone_name
+        cache = self._date_cache
+        if (cache is None or cache[0] != date_utc
+                or cache[1] != timezone_name):
+            cache = (date_utc, timezone_name,
+                     self.timezone.normalize(date_utc))
+            self._date_cache = cache
+        return cache[2]
 
     @date.setter
     def date(self, date: datetime):
@@ -144,17 +189,280 @@ class Event(db.Model, BaseSerializerMixin):
             date = utc.normalize(date)
         self._date_utc = utc.normalize(date)
         self.timezone_name = date.tzinfo.zone
+        self._date_cache = None
+
+    @date.expression
+    def date(cls):
+        """Allows to filter events on their date from the database.
+
+        The column type converts the compared dates to UTC.
+        """
+        return cls._date_utc
+
+    @classmethod
+    def query_range(cls, start: Optional[datetime] = None,
+                    end: Optional[datetime] = None,
+                    guild_id: Optional[str] = None) -> BaseQuery:
+        """Returns the events starting within [start, end), ordered by date.
+
+        The filtering is done by the database, leveraging the (guild_id, date)
+        index. Note repeated events are only matched on their first
+        occurrence; see occurrences_in_range to include their repetitions.
+        """
+        query = cls.query
+        if guild_id is not None:
+            query = query.filter(cls.guild_id == guild_id)
+        if start is not None:
+            query = query.filter(cls.date >= start)
+        if end is not None:
+            query = query.filter(cls.date < end)
+        return query.order_by(cls._date_utc, cls.id)
+
+    @property
+    def cursor(self) -> str:
+        """Returns an opaque position of this event in the listing order."""
+        delta = self._date_utc - _EPOCH
+        position = '%d.%d' % (delta // timedelta(microseconds=1), self.id)
+        return base64.urlsafe_b64encode(position.encode()).decode()
+
+    @staticmethod
+    def decode_cursor(cursor: str) -> Tuple[datetime, int]:
+        """Returns the (date, id) position encoded in a cursor.
+
+        Raises ValueError if the cursor is invalid.
+        """
+        try:
+            position = base64.urlsafe_b64decode(cursor.encode()).decode()
+            microseconds, event_id = position.split('.')
+            return (_EPOCH + timedelta(microseconds=int(microseconds)),
+                    int(event_id))
+        except (TypeError, ValueError) as e:
+            raise ValueError('Invalid cursor %r' % cursor) from e
+
+    @classmethod
+    def query_page(cls, limit: int, after: Optional[str] = None,
+                   start: Optional[datetime] = None,
+                   end: Optional[datetime] = None,
+                   guild_id: Optional[str] = None
+                   ) -> Tuple[List[Event], Optional[str]]:
+        """Returns a page of events ordered by date and the next page cursor.
+
+        Pages are delimited by the (date, id) of their last event rather than
+        by an offset, so fetching any page costs the same whatever the amount
+        of events before it. The next cursor is None on the last page.
+        """
+        query = cls.query_range(start, end, guild_id=guild_id)
+        if after is not None:
+            after_date, after_id = cls.decode_cursor(after)
+            query = query.filter(or_(
+                cls._date_utc > after_date,
+                and_(cls._date_utc == after_date, cls.id > after_id)))
+        events = query.limit(limit + 1).all()
+        if len(events) <= limit:
+            return events, None
+        events = events[:limit]
+        return events, events[-1].cursor
+
+    @classmethod
+    def query_series(cls, guild_id: str) -> BaseQuery:
+        """Returns the events of a guild along with their occurrence changes.
+
+        Events generated from a parent through create_next_event are
+        excluded, as the repetition of their parent already describes them.
+        """
+        return cls.query.filter(
+            cls.guild_id == guild_id,
+            cls.parent_id.is_(None),
+        ).options(
+            selectinload(cls.overrides),
+        ).order_by(cls._date_utc, cls.id)
+
+    @staticmethod
+    def minute_of_period(date: datetime,
+                         repetition: Optional[EventRepetitionFrequency]
+                         ) -> Optional[int]:
+        """Returns the minute of its repetition period a date falls at, in
+        UTC, e.g. the minute of the week for a weekly event.
+        """
+        period = repetition and EventRepetitionFrequency(repetition).to_timedelta()
+        if period is None or date is None:
+            return None
+        return (date - _EPOCH) // timedelta(minutes=1) % (period // timedelta(minutes=1))
+
+    @classmethod
+    def _series_in_range(cls, start: datetime, end: datetime):
+        """Returns a filter on the repeated events which may occur within
+        [start, end), from their time of the day or of the week.
+        """
+        clauses = []
+        for repetition in EventRepetitionFrequency:
+            period = repetition.to_timedelta()
+            if period is None:
+                continue
+            clause = cls.repetition == repetition
+            if end - start + 2 * _SERIES_MARGIN < period:
+                low = cls.minute_of_period(start - _SERIES_MARGIN, repetition)
+                high = cls.minute_of_period(end + _SERIES_MARGIN, repetition)
+                minute = cls._minute_of_period
+                within = (minute.between(low, high) if low <= high
+                          else or_(minute >= low, minute <= high))
+                clause = and_(clause, or_(minute.is_(None), within))
+            clauses.append(clause)
+        return or_(*clauses)
+
+    @classmethod
+    def occurrences_in_range(
+            cls, start: datetime, end: datetime,
+            guild_id: Optional[str] = None,
+            shard: Optional[Shard] = None) -> List[EventOccurrence]:
+        """Returns all occurrences of events happening within [start, end).
+
+        Only the events starting in the range, the repeated events started
+        before its end whose time of the day or week is close to the range,
+        and the events with an occurrence moved into the range are loaded from
+        the database. Events generated from
+        a parent through create_next_event are not loaded, as their parent
+        occurrences already cover them.
+
+        Occurrences can be limited to a single guild, or to the guilds of a
+        bot shard.
+        """
+        moved = select(EventOccurrenceOverride.event_id).where(
+            EventOccurrenceOverride._date_utc >= start,
+            EventOccurrenceOverride._date_utc < end)
+        query = cls.query.filter(
+            cls.parent_id.is_(None),
+            cls.date < end,
+            or_(cls.date >= start,
+                cls._series_in_range(start, end),
+                cls.id.in_(moved)))
+        if guild_id is not None:
+            query = query.filter(cls.guild_id == guild_id)
+        if shard is not None:
+            query = query.filter(shard.filter(cls.guild_id))
+        occurrences: List[EventOccurrence] = []
+        for event in query:
+            occurrences.extend(event.occurrences_between(start, end))
+        return sorted(occurrences, key=lambda o: (o.date, o.event.id))
+
+    @classmethod
+    def bulk_write(cls, values: List[Dict[str, Any]]) -> Tuple[int, int]:
+        """Writes events from their column values, without loading them.
+
+        Values holding an id update the matching event, the others create a
+        new one. Each kind is sent as a single executemany statement within
+        the current transaction; committing is left to the caller.
+
+        Returns the amount of created and updated events.
+        """
+        table = cls.__table__
+        created = [v for v in values if 'id' not in v]
+        updated = [dict(v, event_id=v['id']) for v in values if 'id' in v]
+        for v in updated:
+            del v['id']
+        for v in created + updated:
+            if '_date_utc' in v:
+                v['_minute_of_period'] = cls.minute_of_period(
+                    v['_date_utc'], v.get('repetition'))
+        if created:
+            db.session.execute(table.insert(), created)
+        if updated:
+            db.session.execute(
+                table.update().where(table.c.id == bindparam('event_id')),
+                updated)
+        return len(created), len(updated)
 
     @property
     def timezone(self) -> tzfile:
-        """Returns the timezone name of the date."""
-        return timezone(self.timezone_name)
+        """Returns the timezone of the date."""
+        timezone_name = self.timezone_name
+        cache = self._timezone_cache
+        if cache is None or cache[0] != timezone_name:
+            cache = (timezone_name, timezone(timezone_name))
+            self._timezone_cache = cache
+        return cache[1]
 
     @property
     def timezone_offset(self) -> str:
         """Returns the timezone offset from UTC of the date."""
         return self.date.strftime('%z')
 
+    def date_at(self, position: int) -> datetime:
+        """Returns the date of the n-th occurrence of this event.
+
+        The local hour of the event remains stable across daylight saving
+        time changes, i.e. a weekly event at 21:00 Europe/Paris stays at
+        21:00 local time even if its UTC offset changed in between.
+        """
+        if position == 0:
+            return self.date
+        delta = self.repetition and self.repetition.to_timedelta()
+        if delta is None:
+            raise ValueError(
+                "Event %r is not repeated and has a single occurrence." % self)
+        local_date = self.date.replace(tzinfo=None) + position * delta
+        return self.timezone.localize(local_date)
+
+    def occurrences_between(self, start: datetime,
+                            end: datetime) -> List[EventOccurrence]:
+        """Computes the occurrences of this event within [start, end).
+
+        Occurrences are computed in a single pass from the repetition
+        frequency without creating any record. Only the occurrences that
+        diverge from the series are stored, as EventOccurrenceOverride.
+        """
+        if start.tzinfo is None or end.tzinfo is None:
+            raise ValueError(
+                'The provided range is not associated with a timezone.')
+        overrides = {o.position: o for o in self.overrides}
+        delta = self.repetition and self.repetition.to_timedelta()
+
+        if delta is None:
+            positions = iter([0])
+        else:
+            # Jump directly to the occurrence preceding the range. Daylight
+            # saving time may shift the estimation by an hour, which is
+            # absorbed by starting one occurrence early.
+            first = max(0, math.floor((start - self.date) / delta) - 1)
+            positions = itertools.count(first)
+
+        occurrences: List[EventOccurrence] = []
+        seen = set()
+        for position in positions:
+            original_date = self.date_at(position)
+            if original_date >= end:
+                break
+            seen.add(position)
+            occurrence = EventOccurrence(
+                self, position, original_date, overrides.get(position))
+            if start <= occurrence.date < end:
+                occurrences.append(occurrence)
+
+        # Occurrences moved into the range from outside of it.
+        for position, override in overrides.items():
+            if position in seen or override.date is None:
+                continue
+            if start <= override.date < end:
+                occurrences.append(EventOccurrence(
+                    self, position, self.date_at(position), override))
+
+        return sorted(occurrences, key=lambda o: (o.date, o.position))
+
+    def override_occurrence(self, position: int) -> EventOccurrenceOverride:
+        """Returns the stored changes of an occurrence, creating them if needed.
+
+        Note the override is not added to the database session.
+        """
+        if position < 0:
+            raise ValueError('Occurrence position must be positive.')
+        if position > 0:
+            # Raises if the event is not repeated.
+            self.date_at(position)
+        for override in self.overrides:
+            if override.position == position:
+                return override
+        return EventOccurrenceOverride(self, position)
+
     def create_next_event(self) -> Event:
         """Returns the next event occurring after this one.
 
@@ -172,11 +480,129 @@ class Event(db.Model, BaseSerializerMixin):
             raise ValueError(
                 "Cannot create the next event of a non-repeated event.")
 
-        # As per datetime documentation, no time zone adjustments are done
-        # even if the input is an aware object (i.e. has a timezone
-        # associated). This operation will not modify the original hour of the
-        # event.
-        next_date = self.date + delta
-
-        return Event(self.guild, self.title, next_date,
+        return Event(self.guild, self.title, self.date_at(1),
                      self.description, self.repetition, parent=self)
+
+
+class EventOccurrenceOverride(db.Model, BaseSerializerMixin):
+    """Stored changes of a single occurrence of a repeated event.
+
+    Occurrences of a repeated event are not stored in the database: they are
+    computed from the event date and its repetition frequency. This record is
+    only created when an occurrence diverges from its series.
+
+    :attr event: The repeated event this occurrence belongs to.
+    :attr position: Position of the occurrence in the series, 0 being the
+        event itself.
+    :attr cancelled: Whether the occurrence was cancelled.
+    :attr date: The date the occurrence was moved to, if any.
+    """
+    __tablename__ = 'event_occurrence_override'
+    __table_args__ = (db.UniqueConstraint('event_id', 'position'),)
+
+    # Automatically created by db.Model but clarifying existence for mypy.
+    query: BaseQuery
+
+    # Serialization options
+    serialize_rules = (
+        # The moved date, in the event timezone, rather than its UTC value.
+        'date', '-_date_utc',
+        '-event',
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    date_created = db.Column(
+        db.DateTime,
+        default=db.func.current_timestamp())
+    date_modified = db.Column(
+        db.DateTime,
+        default=db.func.current_timestamp(),
+        onupdate=db.func.current_timestamp())
+
+    position = db.Column(db.Integer, nullable=False)
+    cancelled = db.Column(db.Boolean, default=False, nullable=False)
+    _date_utc = db.Column(UtcDateTime)
+
+    # Relationships
+    event_id = db.Column(db.Integer, db.ForeignKey('event.id'), nullable=False)
+    event = db.relationship('Event', uselist=False, back_populates='overrides')
+
+    def __init__(self, event: Event, position: int):
+        self.event = event
+        self.position = position
+        self.cancelled = False
+
+    @property
+    def date(self) -> Optional[datetime]:
+        """Returns the moved date normalized on the event timezone, if any."""
+        if self._date_utc is None:
+            return None
+        return self.event.timezone.normalize(self._date_utc)
+
+    @date.setter
+    def date(self, date: Optional[datetime]):
+        """Moves the occurrence to another date, or resets it if None."""
+        if date is None:
+            self._date_utc = None
+            return
+        if date.tzinfo is None:
+            raise ValueError(
+                'The provided date is not associated with a timezone '
+                'which may create side effects; associate a pytz.timezone.')
+        self._date_utc = utc.normalize(date)
+
+
+class EventOccurrence:
+    """A single occurrence of an event, computed from its repetition.
+
+    :attr event: The event this is an occurrence of.
+    :attr position: Position of the occurrence in the series.
+    :attr original_date: The date of the occurrence as per the series.
+    :attr override: The stored changes of this occurrence, if any.
+    """
+
+    def __init__(self, event: Event, position: int, original_date: datetime,
+                 override: Optional[EventOccurrenceOverride] = None):
+        self.event = event
+        self.position = position
+        self.original_date = original_date
+        self.override = override
+
+    def __repr__(self):
+        """Returns a debugging representation of the occurrence."""
+        return f'<EventOccurrence #{self.position} of {self.event!r}>'
+
+    @property
+    def date(self) -> datetime:
+        """Returns the actual date of the occurrence."""
+        if self.override is not None and self.override.date is not None:
+            return self.override.date
+        return self.original_date
+
+    @property
+    def cancelled(self) -> bool:
+        """Whether the occurrence was cancelled."""
+        return self.override is not None and bool(self.override.cancelled)
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Serializes the occurrence similarly to an event."""
+        datetime_format = self.event.datetime_format
+        return {
+            'event_id': self.event.id,
+            'position': self.position,
+            'title': self.event.title,
+            'description': self.event.description,
+            'date': self.date.strftime(datetime_format),
+            'original_date': self.original_date.strftime(datetime_format),
+            'timezone_name': self.event.timezone_name,
+            'timezone_offset': self.date.strftime('%z'),
+            'cancelled': self.cancelled,
+        }
+
+
+@sa_event.listens_for(Event, 'before_insert')
+@sa_event.listens_for(Event, 'before_update')
+def _update_minute_of_period(mapper, connection, event: Event):
+    """Keeps the minute of period of an event in line with its date."""
+    event._minute_of_period = Event.minute_of_period(
+        event._date_utc, event.repetition)
@@ -90,6 +90,35 @@ class TestEventModel(DatabaseTestFixture, unittest.TestCase):
         self.assertEqual(queried.timezone, timezone('Europe/Paris'))
         self.assertEqual(queried.timezone_name, 'Europe/Paris')
 
+    def test_reading_date_does_not_modify_the_record(self):
+        """Ensures serializing a stored event does not mark it as dirty."""
+        self.db.session.add(Event(
+            Guild(12345),
+            'Some title',
+            datetime(2020, 10, 10, 10, 10, tzinfo=timezone('Europe/Paris'))))
+        self.db.session.commit()
+
+        queried = Event.query.one()
+        queried.to_dict()
+        repr(queried)
+
+        self.assertNotIn(queried, self.db.session.dirty)
+        self.assertEqual(queried.date.tzinfo.zone, 'Europe/Paris')
+
+    def test_date_memoization_is_reset_on_change(self):
+        """Ensures the memoized date follows the changes of the event."""
+        event = Event(
+            Guild(12345),
+            'Some title',
+            datetime(2020, 10, 10, 10, 10, tzinfo=utc))
+        self.assertEqual(event.date, datetime(2020, 10, 10, 10, 10, tzinfo=utc))
+
+        event.date = datetime(2020, 10, 10, 12, 10, tzinfo=utc)
+        self.assertEqual(event.date, datetime(2020, 10, 10, 12, 10, tzinfo=utc))
+
+        event.timezone_name = 'Europe/Paris'
+        self.assertEqual(event.date.strftime('%H:%M %z'), '14:10 +0200')
+
     def test_create_next_event_daily(self):
         """Checks if the daily generates the same event but a day later."""
         event = Event(
@@ -120,6 +149,162 @@ class TestEventModel(DatabaseTestFixture, unittest.TestCase):
         with self.assertRaises(ValueError):
             event.create_next_event()
 
+    def test_create_next_event_keeps_local_hour_across_dst(self):
+        """Checks the local hour is stable when the UTC offset changes."""
+        paris = timezone('Europe/Paris')
+        event = Event(
+            Guild(12345),
+            'Some title',
+            paris.localize(datetime(2020, 10, 21, 21, 0)),
+            repetition=EventRepetitionFrequency.weekly)
+
+        next_event = event.create_next_event()
+
+        self.assertEqual(next_event.date,
+                         paris.localize(datetime(2020, 10, 28, 21, 0)))
+        self.assertEqual(next_event.date.hour, 21)
+
+    def test_occurrences_between_weekly(self):
+        """Checks occurrences of a weekly event are computed over a range."""
+        paris = timezone('Europe/Paris')
+        event = Event(
+            Guild(12345),
+            'Some title',
+            paris.localize(datetime(2020, 10, 7, 21, 0)),
+            repetition=EventRepetitionFrequency.weekly)
+
+        occurrences = event.occurrences_between(
+            paris.localize(datetime(2020, 10, 20)),
+            paris.localize(datetime(2020, 11, 10)))
+
+        self.assertEqual([o.position for o in occurrences], [2, 3, 4])
+        self.assertEqual(
+            [o.date for o in occurrences],
+            [paris.localize(datetime(2020, 10, 21, 21, 0)),
+             paris.localize(datetime(2020, 10, 28, 21, 0)),
+             paris.localize(datetime(2020, 11, 4, 21, 0))])
+
+    def test_occurrences_between_not_repeated(self):
+        """Checks a non-repeated event has a single occurrence."""
+        event = Event(
+            Guild(12345),
+            'Some title',
+            datetime(2020, 10, 10, 10, 10, tzinfo=utc))
+
+        inside = event.occurrences_between(
+            datetime(2020, 10, 1, tzinfo=utc),
+            datetime(2020, 11, 1, tzinfo=utc))
+        outside = event.occurrences_between(
+            datetime(2020, 10, 11, tzinfo=utc),
+            datetime(2020, 11, 1, tzinfo=utc))
+
+        self.assertEqual([o.position for o in inside], [0])
+        self.assertEqual(outside, [])
+
+    def test_occurrences_between_applies_overrides(self):
+        """Checks cancelled and moved occurrences are reflected."""
+        event = Event(
+            Guild(12345),
+            'Some title',
+            datetime(2020, 10, 1, 20, 0, tzinfo=utc),
+            repetition=EventRepetitionFrequency.daily)
+        self.db.session.add(event)
+        event.override_occurrence(1).cancelled = True
+        # Moved from outside of the range to inside of it.
+        event.override_occurrence(10).date = datetime(
+            2020, 10, 3, 8, 0, tzinfo=utc)
+        self.db.session.commit()
+
+        occurrences = Event.query.one().occurrences_between(
+            datetime(2020, 10, 1, tzinfo=utc),
+            datetime(2020, 10, 4, tzinfo=utc))
+
+        self.assertEqual([o.position for o in occurrences], [0, 1, 10, 2])
+        self.assertEqual([o.cancelled for o in occurrences],
+                         [False, True, False, False])
+        self.assertEqual(occurrences[2].original_date,
+                         datetime(2020, 10, 11, 20, 0, tzinfo=utc))
+
+    def test_override_occurrence_fails_if_not_repeated(self):
+        """Checks only the event itself can be changed if not repeated."""
+        event = Event(
+            Guild(12345),
+            'Some title',
+            datetime(2020, 10, 10, 10, 10, tzinfo=utc))
+
+        with self.assertRaises(ValueError):
+            event.override_occurrence(1)
+
+    def test_query_range_compares_utc_dates(self):
+        """Checks the database filters dates regardless of their timezone."""
+        paris = timezone('Europe/Paris')
+        guild = Guild(12345)
+        self.db.session.add(Event(
+            guild, 'Before', paris.localize(datetime(2020, 10, 10, 1, 30))))
+        self.db.session.add(Event(
+            guild, 'Inside', paris.localize(datetime(2020, 10, 10, 2, 30))))
+        self.db.session.add(Event(
+            Guild(54321), 'Other guild',
+            paris.localize(datetime(2020, 10, 10, 2, 30))))
+        self.db.session.commit()
+
+        # 2020-10-10 02:00 in Paris is midnight UTC.
+        events = Event.query_range(
+            datetime(2020, 10, 10, tzinfo=utc),
+            datetime(2020, 10, 11, tzinfo=utc),
+            guild_id=12345).all()
+
+        self.assertEqual([e.title for e in events], ['Inside'])
+
+    def test_occurrences_in_range_includes_repeated_events(self):
+        """Checks repeated events started before the range are listed."""
+        guild = Guild(12345)
+        self.db.session.add(Event(
+            guild, 'Weekly', datetime(2020, 9, 1, 20, 0, tzinfo=utc),
+            repetition=EventRepetitionFrequency.weekly))
+        self.db.session.add(Event(
+            guild, 'Once', datetime(2020, 10, 7, 20, 0, tzinfo=utc)))
+        self.db.session.add(Event(
+            guild, 'Too late', datetime(2020, 10, 20, 20, 0, tzinfo=utc),
+            repetition=EventRepetitionFrequency.daily))
+        self.db.session.commit()
+
+        occurrences = Event.occurrences_in_range(
+            datetime(2020, 10, 5, tzinfo=utc),
+            datetime(2020, 10, 12, tzinfo=utc),
+            guild_id=12345)
+
+        self.assertEqual(
+            [(o.event.title, o.date) for o in occurrences],
+            [('Weekly', datetime(2020, 10, 6, 20, 0, tzinfo=utc)),
+             ('Once', datetime(2020, 10, 7, 20, 0, tzinfo=utc))])
+
+    def test_occurrences_in_range_bounds_repeated_events(self):
+        """Checks only the series occurring around a short range are loaded."""
+        guild = Guild(12345)
+        paris = timezone('Europe/Paris')
+        # 21:00 in Paris, i.e. 20:00 UTC in winter and 19:00 UTC in summer.
+        raid = Event(guild, 'Raid', paris.localize(datetime(2020, 1, 7, 21, 0)),
+                     repetition=EventRepetitionFrequency.weekly)
+        morning = Event(guild, 'Morning', datetime(2020, 1, 7, 8, 0, tzinfo=utc),
+                        repetition=EventRepetitionFrequency.weekly)
+        moved = Event(guild, 'Moved', datetime(2020, 1, 8, 8, 0, tzinfo=utc),
+                      repetition=EventRepetitionFrequency.daily)
+        self.db.session.add_all([raid, morning, moved])
+        moved.override_occurrence(180).date = datetime(2020, 7, 7, 19, 10, tzinfo=utc)
+        self.db.session.commit()
+
+        start = datetime(2020, 7, 7, 18, 50, tzinfo=utc)
+        end = datetime(2020, 7, 7, 19, 20, tzinfo=utc)
+        self.assertEqual(
+            Event.query.filter(Event._series_in_range(start, end)).all(), [raid])
+        occurrences = Event.occurrences_in_range(start, end, guild_id=12345)
+
+        self.assertEqual(
+            [(o.event.title, o.date) for o in occurrences],
+            [('Raid', datetime(2020, 7, 7, 19, 0, tzinfo=utc)),
+             ('Moved', datetime(2020, 7, 7, 19, 10, tzinfo=utc))])
+
     def test_all_repetition_frequency_have_timedelta(self):
         """Ensures we never raise NotImplementedError"""
         for value in EventRepetitionFrequency:
@@ -0,0 +1,119 @@
+"""Forms validating data sent by the user."""
+
+from __future__ import annotations
+
+__LICENSE__ = """
+Copyright 2019 Google LLC
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+    https://www.apache.org/licenses/LICENSE-2.0
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+from flask_sqlalchemy import BaseQuery
+from typing import List, Optional, Tuple
+from werkzeug.datastructures import MultiDict
+from wtforms import (Form, BooleanField, DateTimeField, IntegerField,
+                     StringField, ValidationError, validators)
+
+from api.common.time import parse_instant
+from api.mod_event.event import Event, EventOccurrenceOverride
+
+# Amount of events returned by a listing when no limit is provided.
+DEFAULT_PAGE_SIZE = 100
+# Maximum amount of events that can be returned by a single listing.
+MAX_PAGE_SIZE = 500
+
+
+class OccurrenceUpdateForm(Form):
+    """Field checker for changing a single occurrence of an event."""
+    cancelled = BooleanField('Cancelled')
+    date = DateTimeField('Moved date', [validators.Optional()])
+
+    def apply_to_occurrence(self, event: Event,
+                            position: int) -> EventOccurrenceOverride:
+        """Stores the changes provided in the form on the occurrence.
+
+        The moved date is expressed in the timezone of the event.
+        """
+        override = event.override_occurrence(position)
+        override.cancelled = bool(self.cancelled.data)
+        if self.date.data is None:
+            override.date = None
+        else:
+            override.date = event.timezone.localize(self.date.data)
+        return override
+
+
+class EventListingForm(Form):
+    """Field checker for listing events page by page.
+
+    The form must be created through from_args, as the `from` and `to` query
+    parameters cannot be field names.
+    """
+    limit = IntegerField('Page size', [
+        validators.Optional(),
+        validators.NumberRange(min=1, max=MAX_PAGE_SIZE),
+    ], default=DEFAULT_PAGE_SIZE)
+    after = StringField('Cursor')
+    start = StringField('From')
+    end = StringField('To')
+    guild = StringField('Guild')
+
+    @classmethod
+    def from_args(cls, args: MultiDict) -> EventListingForm:
+        """Creates the form from the query parameters of a request."""
+        data = MultiDict(args)
+        if 'from' in data:
+            data['start'] = data.pop('from')
+        if 'to' in data:
+            data['end'] = data.pop('to')
+        return cls(data)
+
+    def validate_after(self, field: StringField):
+        """Checks the cursor was returned by a previous listing."""
+        if field.data:
+            try:
+                Event.decode_cursor(field.data)
+            except ValueError:
+                raise ValidationError('Invalid cursor.')
+
+    def validate_start(self, field: StringField):
+        """Checks the start of the range is a date."""
+        self._validate_instant(field)
+
+    def validate_end(self, field: StringField):
+        """Checks the end of the range is a date."""
+        self._validate_instant(field)
+
+    @staticmethod
+    def _validate_instant(field: StringField):
+        """Checks the field contains an ISO 8601 date."""
+        try:
+            parse_instant(field.data)
+        except ValueError:
+            raise ValidationError('Invalid ISO 8601 date.')
+
+    def query_scope(self, guild_id: Optional[str] = None) -> BaseQuery:
+        """Returns the query matching all the listed events, on all pages."""
+        return Event.query_range(
+            parse_instant(self.start.data), parse_instant(self.end.data),
+            guild_id=guild_id or self.guild.data or None)
+
+    def query_page(self, guild_id: Optional[str] = None
+                   ) -> Tuple[List[Event], Optional[str]]:
+        """Returns the requested page of events and the next page cursor.
+
+        The guild_id, if provided, overrides the guild filter of the form.
+        """
+        return Event.query_page(
+            self.limit.data or DEFAULT_PAGE_SIZE,
+            after=self.after.data or None,
+            start=parse_instant(self.start.data),
+            end=parse_instant(self.end.data),
+            guild_id=guild_id or self.guild.data or None)
@@ -0,0 +1,29 @@
+"""Signals sent when the events stored in database change."""
+
+from __future__ import annotations
+
+__LICENSE__ = """
+Copyright 2019 Google LLC
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+    https://www.apache.org/licenses/LICENSE-2.0
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+from flask.signals import Namespace
+
+
+_signals = Namespace()
+
+# Sent once the events of a guild were written and committed. The sender is
+# the ID of the guild owning the events.
+#
+# Receivers are called synchronously from the writing thread (usually a Flask
+# request); receivers living in another thread or event loop must hand the
+# notification over themselves.
+events_changed = _signals.signal('events-changed')
@@ -15,16 +15,26 @@ See the License for the specific language governing permissions and
 limitations under the License.
 """
 
-from flask import Blueprint, jsonify, request
-from typing import Optional
+import json
+
+from flask import Blueprint, Response, jsonify, request, stream_with_context
+from flask_sqlalchemy import BaseQuery
+from typing import List, Optional
 
 from config.blizzard import get_wow_handler
 from api.base import db
-from api.mod_event.event import Event
+from api.common.http import conditional_response
+from api.mod_event.calendar import events_to_ical
+from api.mod_event.event import Event, EventOccurrenceOverride
+from api.mod_event.forms import EventListingForm
+from api.mod_event.signals import events_changed
 from api.mod_guild.guild import AssociatedCharacter, Guild, Region, WowGuild
-from api.mod_guild.forms import EventCreationForm
+from api.mod_guild.forms import (AnnouncementForm, EventCreationForm,
+                                 MAX_BATCH_SIZE, validate_event_batch)
+from api.mod_outbox.outbox import OutboxMessage, OutboxMessageKind
 from api.mod_user.user import User, UserInGuild, Permission
 from api.mod_wow.character import WowCharacter
+from api.mod_wow.refresh import get_fresh
 from api.mod_auth.session import get_discord_session
 
 
@@ -39,6 +49,9 @@ def slugify(name: str) -> str:
 
 mod_guild = Blueprint('guild', __name__, url_prefix='/api/guilds')
 
+# Amount of events loaded at once from the database when streaming events.
+STREAM_BATCH_SIZE = 100
+
 
 @mod_guild.route('/')
 def get_all_guilds():
@@ -51,26 +64,105 @@ def get_all_guilds():
     Events are not returned from this route to lower the size of the response.
     """
     # TODO(funkysayu): Implement the visibility limit.
-    guilds = Guild.query.all()
-    return jsonify(guilds=[g.to_dict(rules=('-events',)) for g in guilds])
+    scopes = [Guild.query, WowGuild.query]
+
+    def build():
+        guilds = Guild.query.all()
+        return jsonify(guilds=[g.to_dict(rules=('-events',)) for g in guilds])
+
+    return conditional_response(scopes, build)
 
 
 @mod_guild.route('/<guild_id>')
 def get_one_guild(guild_id: int):
     """Returns a guild from its ID as well as its associated events."""
     # TODO(funkysayu): Implement the visibility limit.
-    guild = Guild.query.filter_by(id=guild_id).one_or_none()
-    if guild is None:
-        return jsonify(error="Guild %s does not exist." % guild_id), 404
-    return jsonify(guild.to_dict())
+    scopes = [Guild.query.filter_by(id=guild_id),
+              WowGuild.query.join(WowGuild.guild).filter(Guild.id == guild_id),
+              Event.query.filter_by(guild_id=guild_id)]
+
+    def build():
+        guild = scopes[0].one_or_none()
+        if guild is None:
+            return jsonify(error="Guild %s does not exist." % guild_id), 404
+        return jsonify(guild.to_dict())
+
+    return conditional_response(scopes, build)
 
 
 @mod_guild.route('/<guild_id>/events')
 def get_guild_events(guild_id: int):
-    """Returns the events scheduled for this guild."""
+    """Returns a page of the events scheduled for this guild, ordered by date.
+
+    Accepts the same query parameters as the /api/events/ listing.
+    """
+    # TODO(funkysayu): Implement the user visibility limit.
+    form = EventListingForm.from_args(request.args)
+    if not form.validate():
+        return jsonify(error='Invalid request', form_errors=form.errors), 400
+
+    def build():
+        events, next_cursor = form.query_page(guild_id=guild_id)
+        return jsonify(events=[e.to_dict() for e in events],
+                       next_cursor=next_cursor)
+
+    return conditional_response([form.query_scope(guild_id=guild_id)], build)
+
+
+def _series_scopes(guild_id: str) -> List[BaseQuery]:
+    """Returns the scopes of the exported events of a guild."""
+    return [
+        Event.query.filter(Event.guild_id == guild_id,
+                           Event.parent_id.is_(None)),
+        EventOccurrenceOverride.query.join(EventOccurrenceOverride.event)
+        .filter(Event.guild_id == guild_id),
+    ]
+
+
+@mod_guild.route('/<guild_id>/events.ndjson')
+def export_guild_events_ndjson(guild_id: int):
+    """Streams the events of this guild, one JSON object per line.
+
+    Repeated events are returned once, with their repetition frequency and
+    their cancelled or moved occurrences, rather than once per occurrence.
+    """
     # TODO(funkysayu): Implement the user visibility limit.
-    events = Event.query.filter_by(guild_id=guild_id).all()
-    return jsonify(events=[e.to_dict() for e in events])
+    if Guild.query.filter_by(id=guild_id).one_or_none() is None:
+        return jsonify(error='Guild %r does not exist' % guild_id), 404
+
+    def build():
+        events = Event.query_series(guild_id).yield_per(STREAM_BATCH_SIZE)
+
+        def generate():
+            for event in events:
+                yield json.dumps(event.to_dict(rules=('overrides',))) + '\n'
+
+        return Response(stream_with_context(generate()),
+                        mimetype='application/x-ndjson')
+
+    return conditional_response(_series_scopes(guild_id), build)
+
+
+@mod_guild.route('/<guild_id>/events.ics')
+def export_guild_events_ical(guild_id: int):
+    """Streams the events of this guild as an iCalendar feed.
+
+    Repeated events are described through recurrence rules, so calendar
+    clients compute their occurrences.
+    """
+    # TODO(funkysayu): Implement the user visibility limit.
+    guild = Guild.query.filter_by(id=guild_id).one_or_none()
+    if guild is None:
+        return jsonify(error='Guild %r does not exist' % guild_id), 404
+
+    def build():
+        events = Event.query_series(guild_id).yield_per(STREAM_BATCH_SIZE)
+        name = guild.discord_name or guild.id
+        return Response(stream_with_context(events_to_ical(events, name)),
+                        mimetype='text/calendar')
+
+    scopes = [Guild.query.filter_by(id=guild_id)] + _series_scopes(guild_id)
+    return conditional_response(scopes, build)
 
 
 @mod_guild.route('/<guild_id>/events', methods=['PUT'])
@@ -86,9 +178,66 @@ def create_guild_event(guild_id: int):
     event = form.convert_to_event(guild)
     db.session.add(event)
     db.session.commit()
+    events_changed.send(guild.id)
     return jsonify(event.to_dict())
 
 
+@mod_guild.route('/<guild_id>/events/batch', methods=['PUT'])
+def write_guild_events(guild_id: int):
+    """Creates or updates a batch of events for this guild.
+
+    The body holds an `events` list; events with an id are updated, the
+    others are created. The batch is written in a single transaction, and
+    only if all its events are valid. Otherwise the errors are returned per
+    event index and nothing is written.
+    """
+    # TODO(funkysayu): Implement the visibility limit.
+    items = (request.get_json(silent=True) or {}).get('events')
+    if not isinstance(items, list) or not items:
+        return jsonify(error='Expected a non-empty list of events'), 400
+    if len(items) > MAX_BATCH_SIZE:
+        return jsonify(error='Too many events in a batch',
+                       max_batch_size=MAX_BATCH_SIZE), 400
+    guild = Guild.query.filter_by(id=guild_id).one_or_none()
+    if guild is None:
+        return jsonify(error='Guild %r does not exist' % guild_id), 404
+
+    values, errors = validate_event_batch(guild, items)
+    if errors:
+        return jsonify(error='Invalid request', item_errors=errors), 400
+    created, updated = Event.bulk_write(values)
+    db.session.commit()
+    events_changed.send(guild.id)
+    return jsonify(created=created, updated=updated)
+
+
+@mod_guild.route('/<guild_id>/announcements', methods=['POST'])
+def post_guild_announcement(guild_id: int):
+    """Asks the bot to post a message in this guild.
+
+    The message is posted in the provided channel, or in the guild system
+    channel. The bot runs in another process: the request is accepted once
+    stored, and handled by the bot shortly after.
+    """
+    # TODO(funkysayu): Implement the visibility limit.
+    form = AnnouncementForm.from_json(request.get_json())
+    if not form.validate():
+        return jsonify(error='Invalid request', form_errors=form.errors), 400
+    guild = Guild.query.filter_by(id=guild_id).one_or_none()
+    if guild is None:
+        return jsonify(error='Guild %r does not exist' % guild_id), 404
+    if not guild.bot_present:
+        return jsonify(error='The bot is not in guild %r' % guild_id), 412
+
+    message = OutboxMessage(guild.id, OutboxMessageKind.announcement, {
+        'content': form.content.data,
+        'channel_id': form.channel_id.data or None,
+    })
+    db.session.add(message)
+    db.session.commit()
+    return jsonify(id=message.id), 202
+
+
 @mod_guild.route('/wow/<region>/<realm>/<name>')
 def get_wow_guild(region: str, realm: str, name: str):
     try:
@@ -96,15 +245,18 @@ def get_wow_guild(region: str, realm: str, name: str):
     except ValueError:
         return jsonify({'error': 'Invalid region provided'}), 401
 
+    handler = get_wow_handler()
     guild: Optional[WowGuild] = WowGuild.query.filter_by(
         region=region, realm_slug=slugify(realm),
         name_slug=slugify(name)).one_or_none()
-    # TODO(funkysayu): implement cache invalidation.
     if guild is None:
         guild = WowGuild.create_from_api(
-            get_wow_handler(), region, slugify(realm), slugify(name))
+            handler, region, slugify(realm), slugify(name))
         db.session.add(guild)
         db.session.commit()
+    else:
+        # Served right away, even if stale; refreshed in the background.
+        get_fresh(guild, handler)
 
     return jsonify(guild.to_dict())
 
@@ -16,13 +16,19 @@ limitations under the License.
 """
 
 
-from pytz import utc, timezone
-from wtforms import Form, DateTimeField, StringField, validators
+from datetime import datetime
+from pytz import utc, timezone, UnknownTimeZoneError
+from typing import Any, Dict, List, Tuple
+from wtforms import (Form, DateTimeField, IntegerField, StringField,
+                     ValidationError, validators)
 
 from api.common.forms import EnumField
 from api.mod_guild.guild import Guild
 from api.mod_event.event import Event, EventRepetitionFrequency
 
+# Maximum amount of events that can be written in a single batch.
+MAX_BATCH_SIZE = 500
+
 
 class EventCreationForm(Form):
     """Field checker for creating an event."""
@@ -31,13 +37,21 @@ class EventCreationForm(Form):
         validators.Length(min=4, max=32),
     ])
     description = StringField('Description', [validators.Length(max=2000)])
-    date = DateTimeField('Date')
+    date = DateTimeField('Date', [validators.DataRequired()])
     repetition = EnumField('Repetition frequency', enum=EventRepetitionFrequency,
                            default=EventRepetitionFrequency.not_repeated.value)
     timezone_name = StringField('Forced timezone')
 
-    def convert_to_event(self, guild: Guild) -> Event:
-        """Converts the data provided in the form to an event."""
+    def validate_timezone_name(self, field: StringField):
+        """Checks the timezone is known."""
+        if field.data:
+            try:
+                timezone(field.data)
+            except UnknownTimeZoneError:
+                raise ValidationError('Unknown timezone.')
+
+    def localized_date(self) -> datetime:
+        """Returns the date provided in the form, in the requested timezone."""
         # TODO(funkysayu): Once we create the complete setup phase, where a
         #   Guild is associated to a WowGuild which itself is associated to
         #   a realm-wise timezone, use this timezone as the default one.
@@ -45,7 +59,80 @@ class EventCreationForm(Form):
         tz = utc
         if self.timezone_name.data:
             tz = timezone(self.timezone_name.data)
-        date = tz.localize(self.date.data)
+        return tz.localize(self.date.data)
+
+    def convert_to_event(self, guild: Guild) -> Event:
+        """Converts the data provided in the form to an event."""
         return Event(
-            guild, self.title.data, date,
+            guild, self.title.data, self.localized_date(),
             self.description.data, self.repetition.data)
+
+    def convert_to_values(self, guild: Guild) -> Dict[str, Any]:
+        """Converts the data provided in the form to event column values.
+
+        Allows writing events in bulk without instantiating the models.
+        """
+        date = self.localized_date()
+        return {
+            'guild_id': guild.id,
+            'title': self.title.data,
+            'description': self.description.data,
+            '_date_utc': date,
+            'timezone_name': date.tzinfo.zone,
+            'repetition': self.repetition.data,
+        }
+
+
+class AnnouncementForm(Form):
+    """Field checker for an announcement posted by the bot."""
+    content = StringField('Content', [
+        validators.DataRequired(),
+        validators.Length(max=2000),
+    ])
+    channel_id = StringField('Channel ID', [
+        validators.Optional(),
+        validators.Regexp(r'^\d+$', message='Invalid channel ID.'),
+    ])
+
+
+class EventBatchItemForm(EventCreationForm):
+    """Field checker for an event written as part of a batch.
+
+    Events with an ID are updated, the others are created.
+    """
+    id = IntegerField('Event ID', [validators.Optional()])
+
+
+def validate_event_batch(guild: Guild, items: List[Any]
+                         ) -> Tuple[List[Dict[str, Any]], Dict[int, Any]]:
+    """Validates a batch of events to write for a guild.
+
+    Returns the column values of each valid event, suitable for
+    Event.bulk_write, and the errors of the invalid events keyed by their
+    index in the batch.
+    """
+    values: Dict[int, Dict[str, Any]] = {}
+    errors: Dict[int, Any] = {}
+    for index, item in enumerate(items):
+        if not isinstance(item, dict):
+            errors[index] = 'Event must be an object.'
+            continue
+        form = EventBatchItemForm.from_json(item)
+        if not form.validate():
+            errors[index] = form.errors
+            continue
+        values[index] = form.convert_to_values(guild)
+        if form.id.data is not None:
+            values[index]['id'] = form.id.data
+
+    # Events can only be updated from their own guild.
+    updated = {index: v['id'] for index, v in values.items() if 'id' in v}
+    if updated:
+        known = {event_id for event_id, in Event.query.filter(
+            Event.guild_id == guild.id,
+            Event.id.in_(set(updated.values()))).with_entities(Event.id)}
+        for index, event_id in updated.items():
+            if event_id not in known:
+                errors[index] = {'id': ['Unknown event for this guild.']}
+                del values[index]
+    return list(values.values()), errors
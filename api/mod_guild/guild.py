@@ -17,15 +17,32 @@ limitations under the License.
 
 import discord
 
+from datetime import timedelta
 from wowapi import WowApi
 
 from flask_sqlalchemy import BaseQuery
+from sqlalchemy import bindparam, select
+from typing import Dict, Iterable, List, Optional
 
 from api.base import db, BaseSerializerMixin
+from api.common.sharding import Shard
+from api.mod_wow.cache import ConditionalResponse, fetch_if_modified
+from api.mod_wow.refresh import Refreshable
 from api.mod_wow.region import Region
 from api.mod_wow.static import WowFaction
 
 
+# Maximum amount of IDs sent in a single IN clause, keeping under the
+# SQLite bound parameters limit.
+IN_CLAUSE_CHUNK_SIZE = 500
+
+
+def _chunks(items: List[str], size: int = IN_CLAUSE_CHUNK_SIZE) -> Iterable[List[str]]:
+    """Splits items in lists of at most size elements."""
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
 class Guild(db.Model, BaseSerializerMixin):
     """A Discord server supported by the bot.
 
@@ -50,7 +67,7 @@ class Guild(db.Model, BaseSerializerMixin):
     query: BaseQuery
 
     # Serialization options
-    serialize_rules = ('-wow_guild_id',)
+    serialize_rules = ('-wow_guild_id', '-settings')
 
     id = db.Column(db.String, primary_key=True)
     date_created = db.Column(
@@ -69,6 +86,8 @@ class Guild(db.Model, BaseSerializerMixin):
     wow_guild_id = db.Column(db.Integer, db.ForeignKey('wow_guild.id'))
     wow_guild = db.relationship('WowGuild', uselist=False, back_populates='guild')
     events = db.relationship('Event', uselist=True, back_populates='guild')
+    settings = db.relationship('GuildSettings', uselist=False,
+                               cascade='all, delete-orphan')
 
     def __init__(self, id: str):
         self.id = id
@@ -80,6 +99,109 @@ class Guild(db.Model, BaseSerializerMixin):
         self.icon_url = str(discord_guild.icon_url)
         self.bot_present = True
 
+    @classmethod
+    def bulk_resync_from_discord_guilds(
+            cls, discord_guilds: Iterable[discord.Guild],
+            mark_absent: bool = False,
+            shard: Optional[Shard] = None) -> Dict[str, int]:
+        """Registers many Discord guilds at once, writing only the changes.
+
+        Stored guilds are loaded through chunked IN queries, then new guilds
+        are inserted and changed guilds updated through one executemany
+        each. If mark_absent is set, the provided guilds are considered to be
+        all the guilds the bot is in, and the other stored guilds are marked
+        as not having the bot anymore. When running a bot shard, only the
+        guilds of this shard are marked.
+
+        Writes are left uncommitted. Returns the amount of created, updated
+        and absent guilds.
+        """
+        table = cls.__table__
+        values = {
+            str(g.id): {'discord_name': g.name, 'icon_url': str(g.icon_url),
+                        'bot_present': True}
+            for g in discord_guilds
+        }
+
+        stored: Dict[str, Dict[str, object]] = {}
+        columns = (table.c.id, table.c.discord_name, table.c.icon_url,
+                   table.c.bot_present)
+        for chunk in _chunks(list(values)):
+            for row in db.session.execute(
+                    select(*columns).where(table.c.id.in_(chunk))):
+                stored[row.id] = {'discord_name': row.discord_name,
+                                  'icon_url': row.icon_url,
+                                  'bot_present': row.bot_present}
+
+        created = [dict(v, id=guild_id) for guild_id, v in values.items()
+                   if guild_id not in stored]
+        updated = [dict(v, guild_id=guild_id) for guild_id, v in values.items()
+                   if guild_id in stored and stored[guild_id] != v]
+        if created:
+            db.session.execute(table.insert(), created)
+        if updated:
+            db.session.execute(
+                table.update().where(table.c.id == bindparam('guild_id')),
+                updated)
+
+        absent: List[str] = []
+        if mark_absent:
+            query = select(table.c.id).where(table.c.bot_present.is_(True))
+            if shard is not None:
+                query = query.where(shard.filter(table.c.id))
+            absent = [guild_id for guild_id, in db.session.execute(query)
+                      if guild_id not in values]
+            for chunk in _chunks(absent):
+                db.session.execute(table.update().where(
+                    table.c.id.in_(chunk)).values(bot_present=False))
+
+        return {'created': len(created), 'updated': len(updated),
+                'absent': len(absent)}
+
+
+class GuildSettings(db.Model, BaseSerializerMixin):
+    """Preferences of a Discord guild, set from the bot commands.
+
+    Guilds without settings use the default ones.
+
+    :attr guild_id: The guild these settings are for.
+    :attr date_created: The moment the settings were first changed.
+    :attr date_modified: The last update performed on our storage.
+    :attr timezone_name: Timezone the dates are displayed in.
+    :attr prefix: Prefix of the bot commands.
+    :attr board_channel_id: Channel of the message listing the upcoming
+        events, if any.
+    :attr board_message_id: The message listing the upcoming events, kept up
+        to date by the bot.
+    """
+    __tablename__ = 'guild_settings'
+
+    DEFAULT_TIMEZONE_NAME = 'UTC'
+    DEFAULT_PREFIX = '!'
+
+    # Automatically created by db.Model but clarifying existence for mypy.
+    query: BaseQuery
+
+    guild_id = db.Column(db.String, db.ForeignKey('guild.id'), primary_key=True)
+    date_created = db.Column(
+        db.DateTime,
+        default=db.func.current_timestamp())
+    date_modified = db.Column(
+        db.DateTime,
+        default=db.func.current_timestamp(),
+        onupdate=db.func.current_timestamp())
+
+    timezone_name = db.Column(db.String, nullable=False,
+                              default=DEFAULT_TIMEZONE_NAME)
+    prefix = db.Column(db.String(8), nullable=False, default=DEFAULT_PREFIX)
+    board_channel_id = db.Column(db.String, nullable=True)
+    board_message_id = db.Column(db.String, nullable=True)
+
+    def __init__(self, guild_id: str):
+        self.guild_id = str(guild_id)
+        self.timezone_name = self.DEFAULT_TIMEZONE_NAME
+        self.prefix = self.DEFAULT_PREFIX
+
 
 class AssociatedCharacter(db.Model, BaseSerializerMixin):
     """A character belonging to a player associated to a WoW guild."""
@@ -113,13 +235,12 @@ class AssociatedCharacter(db.Model, BaseSerializerMixin):
         primaryjoin="(AssociatedCharacter.user_id == UserInGuild.user_id) & (AssociatedCharacter.guild_id == UserInGuild.guild_id)")
     character = db.relationship('WowCharacter')
 
-class WowGuild(db.Model, BaseSerializerMixin):
+class WowGuild(db.Model, BaseSerializerMixin, Refreshable):
     """A World of Warcraft guild.
 
     This object contains a refined version of the object returned by the
-    Blizzard API. Guild profiles may change on a fairly low frequency.
-    Consumers of this model should consider refreshing the data on a
-    defined period.
+    Blizzard API. Guild profiles may change on a fairly low frequency, hence
+    are refreshed once stale, see FRESHNESS_TTL.
 
     All localized values are using the en_US locale.
 
@@ -133,6 +254,8 @@ class WowGuild(db.Model, BaseSerializerMixin):
     :attr name: The localized version of the guild name.
     :attr faction: Faction the guild is into.
     :attr icon_url: Address of the icon of this guild.
+    :attr etag: ETag of the guild profile last retrieved.
+    :attr last_modified: Last-Modified date of the guild profile last retrieved.
     :attr guild: back populated guild associated to this wow guild.
     """
     __tablename__ = 'wow_guild'
@@ -145,8 +268,13 @@ class WowGuild(db.Model, BaseSerializerMixin):
         '-id',
         # Remove circular dependency from the relationships.
         '-guild',
+        # Validators only serve the revalidation of the guild profile.
+        '-etag',
+        '-last_modified',
     )
 
+    FRESHNESS_TTL = timedelta(hours=12)
+
     id = db.Column(db.Integer, primary_key=True)
     date_created = db.Column(
         db.DateTime,
@@ -164,6 +292,8 @@ class WowGuild(db.Model, BaseSerializerMixin):
     name = db.Column(db.String)
     faction = db.Column(db.Enum(WowFaction))
     icon_url = db.Column(db.String)
+    etag = db.Column(db.String)
+    last_modified = db.Column(db.String)
 
     # Relationships
     guild = db.relationship('Guild', uselist=False,
@@ -180,21 +310,53 @@ class WowGuild(db.Model, BaseSerializerMixin):
         return '<Guild %r/%r/%r (#%r)>' % (self.region, self.realm_slug,
                                            self.name_slug, self.id)
 
-    @classmethod
-    def create_from_api(cls, handler: WowApi, region: Region,
-                        realm_slug: str, name_slug: str) -> WowGuild:
-        """Creates a WowGuild object from the API endpoint."""
-        data = handler.get_guild(
-            region.value, region.profile_namespace, realm_slug, name_slug,
-            locale='en_US')
-        guild = cls(data['id'], region, realm_slug, name_slug)
-        guild.faction = WowFaction(data['faction']['type'])
-        guild.name = data['name']
-        guild.realm_name = data['realm']['name']
+    @staticmethod
+    def fetch_profile(handler: WowApi, region: Region, realm_slug: str,
+                      name_slug: str, etag: Optional[str] = None,
+                      last_modified: Optional[str] = None) -> ConditionalResponse:
+        """Retrieves the guild profile, unless it did not change since the
+        retrieval of the given validators.
+        """
+        return fetch_if_modified(
+            handler, lambda: handler.get_guild(
+                region.value, region.profile_namespace, realm_slug, name_slug,
+                locale='en_US'),
+            etag, last_modified)
+
+    def apply_profile(self, handler: WowApi, profile: ConditionalResponse):
+        """Updates the guild from its profile."""
+        data = profile.data
+        self.faction = WowFaction(data['faction']['type'])
+        self.name = data['name']
+        self.realm_name = data['realm']['name']
+        self.etag = profile.etag
+        self.last_modified = profile.last_modified
 
         crest_data = handler.get_guild_crest_emblem_media(
-            region.value, region.static_namespace,
+            self.region.value, self.region.static_namespace,
             data['crest']['emblem']['id'])
-        guild.icon_url = crest_data['assets'][0]['value']
+        self.icon_url = crest_data['assets'][0]['value']
 
+    @classmethod
+    def create_from_api(cls, handler: WowApi, region: Region,
+                        realm_slug: str, name_slug: str) -> WowGuild:
+        """Creates a WowGuild object from the API endpoint."""
+        profile = cls.fetch_profile(handler, region, realm_slug, name_slug)
+        guild = cls(profile.data['id'], region, realm_slug, name_slug)
+        guild.apply_profile(handler, profile)
         return guild
+
+    def refresh_from_api(self, handler: WowApi) -> bool:
+        """Refreshes the guild from the API endpoint.
+
+        The request is conditional to the validators of the last retrieval:
+        if the profile did not change, the row is only touched, to record the
+        guild is up to date. Returns whether the guild changed.
+        """
+        profile = self.fetch_profile(handler, self.region, self.realm_slug,
+                                     self.name_slug, self.etag, self.last_modified)
+        if profile.data is None:
+            self.date_modified = db.func.current_timestamp()
+            return False
+        self.apply_profile(handler, profile)
+        return True
@@ -0,0 +1,205 @@
+from __future__ import annotations
+
+__LICENSE__ = """
+Copyright 2019 Google LLC
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+    https://www.apache.org/licenses/LICENSE-2.0
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+import json
+import unittest
+
+from datetime import datetime
+from pytz import utc
+from sqlalchemy import update
+
+from api.common.testing import ControllerTestFixture
+from api.mod_event.event import Event, EventOccurrenceOverride, \
+    EventRepetitionFrequency
+from api.mod_guild.controllers import mod_guild
+from api.mod_guild.guild import Guild
+from api.mod_outbox.outbox import OutboxMessage, OutboxMessageKind
+
+
+class TestGuildControllers(ControllerTestFixture, unittest.TestCase):
+
+    BLUEPRINTS = [mod_guild]
+
+    def setUp(self):
+        """Add some stuff in the database."""
+        super().setUp()
+
+        guild = Guild('12345')
+        guild.discord_name = 'Some guild'
+        self.db.session.add(guild)
+        weekly = Event(
+            guild, 'Weekly',
+            datetime(2020, 10, 10, 11, 0, tzinfo=utc),
+            repetition=EventRepetitionFrequency.weekly)
+        self.db.session.add(weekly)
+        self.db.session.add(Event(
+            guild, 'Once',
+            datetime(2020, 10, 10, 10, 0, tzinfo=utc)))
+        self.db.session.commit()
+        # Occurrence generated through the :next route.
+        self.db.session.add(weekly.create_next_event())
+        self.db.session.commit()
+
+    def test_export_guild_events_ndjson(self):
+        """Ensure events are streamed once per series, ordered by date."""
+        with self.client as client:
+            results = client.get('/api/guilds/12345/events.ndjson')
+
+        events = [json.loads(line) for line in
+                  results.get_data(as_text=True).splitlines()]
+        self.assertEqual(results.mimetype, 'application/x-ndjson')
+        self.assertEqual([e['title'] for e in events], ['Once', 'Weekly'])
+        self.assertEqual(events[0]['overrides'], [])
+
+    def test_export_guild_events_ndjson_overrides(self):
+        """Ensure cancelled and moved occurrences are part of the export."""
+        weekly = Event.query.filter_by(title='Weekly', parent_id=None).one()
+        cancelled = EventOccurrenceOverride(weekly, 2)
+        cancelled.cancelled = True
+        moved = EventOccurrenceOverride(weekly, 3)
+        moved.date = datetime(2020, 10, 31, 12, 0, tzinfo=utc)
+        self.db.session.add_all([cancelled, moved])
+        self.db.session.commit()
+
+        with self.client as client:
+            results = client.get('/api/guilds/12345/events.ndjson')
+
+        events = [json.loads(line) for line in
+                  results.get_data(as_text=True).splitlines()]
+        overrides = sorted(events[1]['overrides'], key=lambda o: o['position'])
+        self.assertEqual([(o['position'], o['cancelled'], o['date'])
+                          for o in overrides],
+                         [(2, True, None), (3, False, '2020-10-31 12:00:00')])
+
+    def test_export_guild_events_ical(self):
+        """Ensure events are streamed as a calendar."""
+        with self.client as client:
+            results = client.get('/api/guilds/12345/events.ics')
+
+        calendar = results.get_data(as_text=True)
+        self.assertEqual(results.mimetype, 'text/calendar')
+        self.assertTrue(calendar.startswith('BEGIN:VCALENDAR\r\n'))
+        self.assertTrue(calendar.endswith('END:VCALENDAR\r\n'))
+        self.assertEqual(calendar.count('BEGIN:VEVENT'), 2)
+        self.assertEqual(calendar.count('RRULE:FREQ=WEEKLY'), 1)
+
+    def test_export_guild_events_is_conditional(self):
+        """Ensure calendar clients polling the feed get a 304."""
+        # Rows modified during the current second are never cached.
+        for model in (Guild, Event):
+            self.db.session.execute(update(model).values(
+                date_modified=datetime(2020, 1, 1)))
+        self.db.session.commit()
+        with self.client as client:
+            first = client.get('/api/guilds/12345/events.ics')
+            second = client.get('/api/guilds/12345/events.ics', headers={
+                'If-None-Match': first.headers['ETag']})
+
+        self.assertEqual(second.status_code, 304)
+        self.assertEqual(second.get_data(), b'')
+
+    def test_export_unknown_guild(self):
+        """Ensure exporting an unknown guild fails."""
+        with self.client as client:
+            results = client.get('/api/guilds/54321/events.ics')
+
+        self.assertEqual(results.status_code, 404)
+
+    def test_write_guild_events(self):
+        """Ensure a batch creates and updates events at once."""
+        once = Event.query.filter_by(title='Once').one()
+        with self.client as client:
+            results = client.put('/api/guilds/12345/events/batch', json={
+                'events': [
+                    {'title': 'Raid night', 'date': '2020-10-12 19:00:00',
+                     'timezone_name': 'Europe/Paris', 'repetition': 'WEEKLY'},
+                    {'title': 'Mythic+', 'date': '2020-10-13 20:00:00'},
+                    {'id': once.id, 'title': 'Moved',
+                     'date': '2020-10-11 10:00:00'},
+                ]})
+
+        self.assertEqual(results.status_code, 200)
+        self.assertEqual(results.json, {'created': 2, 'updated': 1})
+        raid = Event.query.filter_by(title='Raid night').one()
+        self.assertEqual(raid.date, datetime(2020, 10, 12, 17, 0, tzinfo=utc))
+        self.assertEqual(raid.timezone_name, 'Europe/Paris')
+        self.assertEqual(raid.repetition, EventRepetitionFrequency.weekly)
+        self.db.session.expire_all()
+        moved = Event.query.get(once.id)
+        self.assertEqual(moved.title, 'Moved')
+        self.assertEqual(moved.date, datetime(2020, 10, 11, 10, 0, tzinfo=utc))
+
+    def test_write_guild_events_errors(self):
+        """Ensure invalid events are reported and nothing is written."""
+        other = Guild('54321')
+        self.db.session.add(other)
+        foreign = Event(other, 'Foreign', datetime(2020, 10, 10, tzinfo=utc))
+        self.db.session.add(foreign)
+        self.db.session.commit()
+        with self.client as client:
+            results = client.put('/api/guilds/12345/events/batch', json={
+                'events': [
+                    {'title': 'Valid event', 'date': '2020-10-12 19:00:00'},
+                    {'title': 'No', 'date': '2020-10-12 19:00:00'},
+                    {'title': 'Bad timezone', 'date': '2020-10-12 19:00:00',
+                     'timezone_name': 'Mars/Olympus'},
+                    {'id': foreign.id, 'title': 'Stolen',
+                     'date': '2020-10-12 19:00:00'},
+                    'not an event',
+                    {'title': 'Raid night'},
+                ]})
+
+        self.assertEqual(results.status_code, 400)
+        self.assertEqual(sorted(results.json['item_errors']),
+                         ['1', '2', '3', '4', '5'])
+        self.assertIn('timezone_name', results.json['item_errors']['2'])
+        self.assertIn('date', results.json['item_errors']['5'])
+        self.assertEqual(Event.query.filter_by(title='Valid event').count(), 0)
+        self.assertEqual(Event.query.get(foreign.id).title, 'Foreign')
+
+    def test_write_guild_events_invalid_batch(self):
+        """Ensure malformed or unknown batches are rejected."""
+        with self.client as client:
+            empty = client.put('/api/guilds/12345/events/batch',
+                               json={'events': []})
+            unknown = client.put('/api/guilds/54321/events/batch', json={
+                'events': [{'title': 'Some event',
+                            'date': '2020-10-12 19:00:00'}]})
+
+        self.assertEqual(empty.status_code, 400)
+        self.assertEqual(unknown.status_code, 404)
+
+    def test_post_guild_announcement(self):
+        """Ensure announcements are sent to the bot through the outbox."""
+        payload = {'content': 'Raid is cancelled', 'channel_id': '42'}
+        with self.client as client:
+            absent = client.post('/api/guilds/12345/announcements', json=payload)
+            Guild.query.get('12345').bot_present = True
+            self.db.session.commit()
+            posted = client.post('/api/guilds/12345/announcements', json=payload)
+            invalid = client.post('/api/guilds/12345/announcements',
+                                  json={'content': ''})
+
+        self.assertEqual(absent.status_code, 412)
+        self.assertEqual(posted.status_code, 202)
+        self.assertEqual(invalid.status_code, 400)
+        message = OutboxMessage.query.filter_by(
+            kind=OutboxMessageKind.announcement).one()
+        self.assertEqual(message.id, posted.json['id'])
+        self.assertEqual(message.data, payload)
+
+
+if __name__ == '__main__':
+    unittest.main()
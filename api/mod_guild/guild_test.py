@@ -21,8 +21,12 @@ import json
 import os
 import unittest.mock
 
+from datetime import datetime
+from types import SimpleNamespace
+
 from api.common.testing import DatabaseTestFixture
 from api.mod_guild.guild import Guild, WowGuild, Region
+from api.mod_wow.cache import ConditionalResponse
 from api.mod_wow.static import WowFaction
 
 
@@ -74,6 +78,31 @@ class TestGuildModel(DatabaseTestFixture, unittest.TestCase):
             '?size=1024')
         self.assertEqual(guild.bot_present, True)
 
+    def test_bulk_resync_from_discord_guilds(self):
+        """Synchronizes many guilds at once, writing only the changes."""
+        for guild_id, name in (('1', 'Unchanged'), ('2', 'Old name'),
+                               ('3', 'Left')):
+            guild = Guild(guild_id)
+            guild.discord_name = name
+            guild.icon_url = 'icon'
+            guild.bot_present = True
+            self.db.session.add(guild)
+        self.db.session.commit()
+
+        counts = Guild.bulk_resync_from_discord_guilds([
+            SimpleNamespace(id=1, name='Unchanged', icon_url='icon'),
+            SimpleNamespace(id=2, name='New name', icon_url='icon'),
+            SimpleNamespace(id=4, name='Joined', icon_url='icon'),
+        ], mark_absent=True)
+        self.db.session.commit()
+
+        self.assertEqual(counts, {'created': 1, 'updated': 1, 'absent': 1})
+        guilds = {g.id: g for g in Guild.query.all()}
+        self.assertEqual(guilds['2'].discord_name, 'New name')
+        self.assertEqual(guilds['3'].bot_present, False)
+        self.assertEqual(guilds['4'].discord_name, 'Joined')
+        self.assertEqual(guilds['4'].bot_present, True)
+
     def test_create_wow_guild(self):
         """Creates and register a wow guild in a database."""
         wow_guild = WowGuild(123, Region.eu, 'argent-dawn', 'some-guild')
@@ -131,3 +160,36 @@ class TestGuildModel(DatabaseTestFixture, unittest.TestCase):
         self.assertEqual(guild.icon_url,
                          'https://render-eu.worldofwarcraft.com/'
                          'guild/tabards/emblem_114.png')
+
+    def test_refresh_wow_guild(self):
+        """Ensure an unmodified guild is only touched when refreshed."""
+        wow_guild = WowGuild(49392850, Region.eu, 'argent-dawn', 'negative-waves')
+        wow_guild.name = 'Negative Waves'
+        wow_guild.etag = '"v1"'
+        wow_guild.date_modified = datetime(2020, 1, 1)
+        self.db.session.add(wow_guild)
+        self.db.session.commit()
+        mock = unittest.mock.MagicMock()
+
+        with unittest.mock.patch(
+                'api.mod_guild.guild.fetch_if_modified',
+                return_value=ConditionalResponse(None, '"v1"', None)) as fetch:
+            self.assertFalse(wow_guild.refresh_from_api(mock))
+        self.db.session.commit()
+
+        self.assertEqual(fetch.call_args.args[2:], ('"v1"', None))
+        mock.get_guild_crest_emblem_media.assert_not_called()
+        self.assertEqual(wow_guild.name, 'Negative Waves')
+        self.assertGreater(wow_guild.date_modified, datetime(2020, 1, 1))
+
+        mock.get_guild_crest_emblem_media.return_value = \
+            self.GET_GUILD_CREST_EMBLEM_MEDIA
+        with unittest.mock.patch(
+                'api.mod_guild.guild.fetch_if_modified',
+                return_value=ConditionalResponse(self.GET_GUILD_DATA, '"v2"', None)):
+            self.assertTrue(wow_guild.refresh_from_api(mock))
+        self.assertEqual(wow_guild.etag, '"v2"')
+        self.assertEqual(wow_guild.realm_name, 'Argent Dawn')
+        self.assertNotIn('etag', wow_guild.to_dict())
+        self.assertNotIn('last_modified', wow_guild.to_dict())
+
@@ -0,0 +1,176 @@
+"""Work sent by the web application to the bot processes."""
+
+from __future__ import annotations
+
+__LICENSE__ = """
+Copyright 2019 Google LLC
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+    https://www.apache.org/licenses/LICENSE-2.0
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+import json
+
+from datetime import datetime, timedelta
+from enum import Enum
+from flask_sqlalchemy import BaseQuery
+from pytz import utc
+from sqlalchemy import or_
+from typing import Any, Dict, Iterable, List, Optional
+
+from api.base import db, BaseSerializerMixin, UtcDateTime
+from api.common.sharding import Shard
+from api.mod_guild.guild import Guild
+
+
+# Amount of times a message is tried before being given up on.
+MAX_ATTEMPTS = 5
+
+# Delay before trying a failed message again, doubled after each failure.
+RETRY_DELAY = timedelta(seconds=5)
+
+# How long messages are kept, handled or not.
+RETENTION = timedelta(days=7)
+
+# Minimum delay between two prunes of the outbox by a process.
+PRUNE_INTERVAL = timedelta(hours=1)
+
+
+class OutboxMessageKind(Enum):
+    """Kind of work requested to the bot."""
+    # Posts a message in the guild. Payload: content, optional channel_id.
+    announcement = 'ANNOUNCEMENT'
+    # Reminds the guild of an event. Payload: event_id, position, title, date.
+    reminder = 'REMINDER'
+    # The events of the guild were written. No payload.
+    events_changed = 'EVENTS_CHANGED'
+
+
+class OutboxMessage(db.Model, BaseSerializerMixin):
+    """A piece of work for the bot, stored until a bot process handles it.
+
+    The web application and the bot run in separate processes: the web
+    application stores messages in this table and the bot shard owning the
+    guild polls them. Handled messages are deleted. Failed messages are tried
+    again after an exponential delay; messages failing MAX_ATTEMPTS times are
+    kept with their error for investigation. Messages older than RETENTION
+    are pruned, e.g. when no bot process consumes them.
+
+    :attr id: Unique ID of the message, ordering the messages.
+    :attr date_created: When the message was posted.
+    :attr date_abandoned: When the message was given up on, if it was.
+    :attr date_retry: When the message can be tried again, after a failure.
+    :attr guild_id: The guild the work is for.
+    :attr kind: The kind of work requested.
+    :attr payload: JSON encoded arguments of the work.
+    :attr attempts: Amount of failed attempts at handling the message.
+    :attr error: Last error raised when handling the message.
+    """
+    __tablename__ = 'outbox_message'
+    __table_args__ = (
+        db.Index('ix_outbox_message_pending', 'date_abandoned', 'id'),
+        db.Index('ix_outbox_message_date_created', 'date_created'),
+    )
+
+    # Automatically created by db.Model but clarifying existence for mypy.
+    query: BaseQuery
+
+    id = db.Column(db.Integer, primary_key=True)
+    date_created = db.Column(
+        db.DateTime,
+        default=db.func.current_timestamp())
+    date_abandoned = db.Column(UtcDateTime)
+    date_retry = db.Column(UtcDateTime)
+
+    guild_id = db.Column(db.String, nullable=False)
+    kind = db.Column(db.Enum(OutboxMessageKind), nullable=False)
+    payload = db.Column(db.Text, nullable=False, default='{}')
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    error = db.Column(db.String)
+
+    def __init__(self, guild_id: str, kind: OutboxMessageKind,
+                 payload: Optional[Dict[str, Any]] = None):
+        self.guild_id = str(guild_id)
+        self.kind = kind
+        self.payload = json.dumps(payload or {})
+
+    def __repr__(self):
+        """Returns a debugging representation of the message."""
+        return f'<OutboxMessage {self.id} {self.kind.name} for {self.guild_id}>'
+
+    @property
+    def data(self) -> Dict[str, Any]:
+        """Returns the decoded payload."""
+        return json.loads(self.payload)
+
+    @classmethod
+    def pending(cls, limit: int, shard: Optional[Shard] = None,
+                now: Optional[datetime] = None) -> List[OutboxMessage]:
+        """Returns the oldest messages to handle, for the guilds of a shard.
+
+        Failed messages are only returned once their retry delay elapsed.
+        """
+        query = cls.query.filter(
+            cls.date_abandoned.is_(None),
+            or_(cls.date_retry.is_(None), cls.date_retry <= (now or datetime.now(utc))))
+        if shard is not None:
+            query = query.filter(shard.filter(cls.guild_id))
+        return query.order_by(cls.id).limit(limit).all()
+
+    @classmethod
+    def complete(cls, handled: Iterable[int], failed: Dict[int, str]):
+        """Deletes the handled messages and records the failures.
+
+        Writes are left uncommitted.
+        """
+        handled = list(handled)
+        if handled:
+            cls.query.filter(cls.id.in_(handled)).delete(
+                synchronize_session=False)
+        if failed:
+            now = datetime.now(utc)
+            for message in cls.query.filter(cls.id.in_(list(failed))):
+                message.attempts += 1
+                message.error = failed[message.id]
+                message.date_retry = now + RETRY_DELAY * 2 ** (message.attempts - 1)
+                if message.attempts >= MAX_ATTEMPTS:
+                    message.date_abandoned = now
+
+    @classmethod
+    def prune(cls, before: datetime) -> int:
+        """Deletes the messages posted before a date, handled or not.
+
+        Returns the amount of messages deleted. Writes are left uncommitted.
+        """
+        # date_created is set by the database, in UTC.
+        return cls.query.filter(
+            cls.date_created < before.astimezone(utc).replace(tzinfo=None)
+        ).delete(synchronize_session=False)
+
+
+_last_prune: Optional[datetime] = None
+
+
+def forward_events_changed(guild_id: str):
+    """Notifies the bot of the events written by the web application.
+
+    Connected to the api.mod_event.signals.events_changed signal, after the
+    write was committed. Guilds without the bot are not notified, and old
+    messages are pruned from time to time.
+    """
+    global _last_prune
+    now = datetime.now(utc)
+    if _last_prune is None or now - _last_prune >= PRUNE_INTERVAL:
+        _last_prune = now
+        OutboxMessage.prune(now - RETENTION)
+    bot_present = db.session.query(Guild.bot_present).filter(
+        Guild.id == str(guild_id)).scalar()
+    if bot_present:
+        db.session.add(OutboxMessage(guild_id, OutboxMessageKind.events_changed))
+    db.session.commit()
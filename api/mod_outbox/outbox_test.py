@@ -0,0 +1,108 @@
+from __future__ import annotations
+
+__LICENSE__ = """
+Copyright 2019 Google LLC
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+    https://www.apache.org/licenses/LICENSE-2.0
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+import unittest
+
+from datetime import datetime, timedelta
+from pytz import utc
+
+from api.common.sharding import Shard
+from api.common.testing import DatabaseTestFixture
+from api.mod_event.signals import events_changed
+from api.mod_guild.guild import Guild
+from api.mod_outbox.outbox import (MAX_ATTEMPTS, RETENTION, OutboxMessage,
+                                   OutboxMessageKind)
+
+
+class TestOutboxMessage(DatabaseTestFixture, unittest.TestCase):
+
+    def test_pending(self):
+        """Ensure messages are returned in order, for the shard guilds."""
+        for guild_id in (1 << 22, 2 << 22, 3 << 22):
+            self.db.session.add(OutboxMessage(
+                guild_id, OutboxMessageKind.announcement, {'content': 'Hi'}))
+        self.db.session.commit()
+
+        messages = OutboxMessage.pending(10, Shard(1, 2))
+        self.assertEqual([m.guild_id for m in messages],
+                         [str(1 << 22), str(3 << 22)])
+        self.assertEqual(messages[0].data, {'content': 'Hi'})
+        self.assertEqual(len(OutboxMessage.pending(2)), 2)
+
+    def test_complete(self):
+        """Ensure handled messages are deleted and failures retried."""
+        done = OutboxMessage('1', OutboxMessageKind.events_changed)
+        failing = OutboxMessage('1', OutboxMessageKind.events_changed)
+        self.db.session.add_all([done, failing])
+        self.db.session.commit()
+        done_id, failing_id = done.id, failing.id
+
+        later = datetime.now(utc) + timedelta(days=1)
+        for attempt in range(MAX_ATTEMPTS):
+            self.assertEqual([m.id for m in OutboxMessage.pending(10, now=later)],
+                             [failing_id] if attempt else [done_id, failing_id])
+            OutboxMessage.complete([done_id], {failing_id: 'Boom'})
+            self.db.session.commit()
+
+        self.assertEqual(OutboxMessage.pending(10, now=later), [])
+        abandoned = OutboxMessage.query.one()
+        self.assertEqual(abandoned.error, 'Boom')
+        self.assertIsNotNone(abandoned.date_abandoned)
+
+    def test_retry_delay(self):
+        """Ensure failed messages are retried after a growing delay."""
+        failing = OutboxMessage('1', OutboxMessageKind.announcement)
+        self.db.session.add(failing)
+        self.db.session.commit()
+        now = datetime.now(utc)
+
+        OutboxMessage.complete([], {failing.id: 'Boom'})
+        self.db.session.commit()
+        self.assertEqual(OutboxMessage.pending(10, now=now), [])
+        self.assertEqual(len(OutboxMessage.pending(10, now=now + timedelta(seconds=6))), 1)
+
+        OutboxMessage.complete([], {failing.id: 'Boom'})
+        self.db.session.commit()
+        self.assertEqual(OutboxMessage.pending(10, now=now + timedelta(seconds=6)), [])
+        self.assertEqual(len(OutboxMessage.pending(10, now=now + timedelta(seconds=11))), 1)
+
+    def test_prune(self):
+        """Ensure messages older than the retention are deleted."""
+        old = OutboxMessage('1', OutboxMessageKind.events_changed)
+        old.date_created = datetime.utcnow() - RETENTION - timedelta(hours=1)
+        self.db.session.add_all([old, OutboxMessage('1', OutboxMessageKind.events_changed)])
+        self.db.session.commit()
+
+        self.assertEqual(OutboxMessage.prune(datetime.now(utc) - RETENTION), 1)
+        self.db.session.commit()
+        self.assertEqual(OutboxMessage.query.count(), 1)
+
+    def test_forward_events_changed(self):
+        """Ensure event writes are forwarded to the bot of the guild."""
+        with_bot, without_bot = Guild('12345'), Guild('54321')
+        with_bot.bot_present = True
+        self.db.session.add_all([with_bot, without_bot])
+        self.db.session.commit()
+
+        events_changed.send('12345')
+        events_changed.send('54321')
+
+        message = OutboxMessage.query.one()
+        self.assertEqual(message.guild_id, '12345')
+        self.assertEqual(message.kind, OutboxMessageKind.events_changed)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,307 @@
+"""Caches the responses of the Blizzard Game and Profile APIs.
+
+Responses are kept according to the namespace they belong to: static data
+only changes with game patches, dynamic data (e.g. realms) every few hours,
+and profiles each time a player logs out.
+
+Stored models can also be revalidated with conditional requests, which
+Blizzard answers with a bodyless 304 when the resource did not change.
+"""
+
+from __future__ import annotations
+
+__LICENSE__ = """
+Copyright 2019 Google LLC
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    https://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+import json
+import sqlite3
+import threading
+import time
+
+from collections import OrderedDict
+from requests.exceptions import RequestException
+from typing import Any, Callable, Dict, NamedTuple, Optional, Tuple
+from wowapi import WowApi, WowApiException
+
+from api.mod_wow.quota import QuotaManager, retry_after_seconds
+
+
+# Time to live of the responses, per namespace prefix, in seconds.
+NAMESPACE_TTLS = (
+    ('static-', 7 * 24 * 3600.),
+    ('dynamic-', 6 * 3600.),
+    ('profile-', 10 * 60.),
+)
+
+# Amount of responses kept in memory, in front of the disk store.
+MEMORY_CACHE_ENTRIES = 4096
+
+# Amount of times a rate limited request is retried before giving up.
+MAX_RATE_LIMITED_RETRIES = 3
+
+
+def namespace_ttl(namespace: Optional[str]) -> Optional[float]:
+    """Returns how long responses of a namespace are kept, if cached."""
+    for prefix, ttl in NAMESPACE_TTLS:
+        if namespace is not None and namespace.startswith(prefix):
+            return ttl
+    return None
+
+
+class ConditionalResponse(NamedTuple):
+    """Response to a conditional request.
+
+    :attr data: The resource, or None if it was not modified.
+    :attr etag: ETag of the resource, to send on the next request.
+    :attr last_modified: Last-Modified date of the resource, to send on the
+        next request.
+    """
+    data: Optional[Dict[str, Any]]
+    etag: Optional[str]
+    last_modified: Optional[str]
+
+
+class _ConditionalRequest:
+    """Validators of the conditional request being made by a thread."""
+
+    def __init__(self, etag: Optional[str], last_modified: Optional[str]):
+        self.etag = etag
+        self.last_modified = last_modified
+        self.not_modified = False
+
+    def headers(self) -> Dict[str, str]:
+        headers = {}
+        if self.etag:
+            headers['If-None-Match'] = self.etag
+        if self.last_modified:
+            headers['If-Modified-Since'] = self.last_modified
+        return headers
+
+
+class ResponseStore:
+    """Keeps the responses in a SQLite file, to survive restarts.
+
+    Safe to use from many threads.
+    """
+
+    def __init__(self, path: str, clock: Callable[[], float] = time.time):
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        with self._lock, self._connection:
+            self._connection.execute(
+                'CREATE TABLE IF NOT EXISTS responses ('
+                'key TEXT PRIMARY KEY, value TEXT NOT NULL, '
+                'expires_at REAL NOT NULL)')
+            self._connection.execute(
+                'DELETE FROM responses WHERE expires_at <= ?', (clock(),))
+
+    def get(self, key: str) -> Optional[Tuple[float, str]]:
+        """Returns the expiration and the response of a key, if fresh."""
+        with self._lock:
+            row = self._connection.execute(
+                'SELECT expires_at, value FROM responses '
+                'WHERE key = ? AND expires_at > ?', (key, self._clock())).fetchone()
+        return row
+
+    def put(self, key: str, value: str, expires_at: float):
+        with self._lock, self._connection:
+            self._connection.execute(
+                'INSERT OR REPLACE INTO responses (key, value, expires_at) '
+                'VALUES (?, ?, ?)', (key, value, expires_at))
+
+    def close(self):
+        with self._lock:
+            self._connection.close()
+
+
+class CachedWowApi(WowApi):
+    """A WowApi handler answering from a cache when possible.
+
+    Responses of the Game Data and Profile APIs are cached per method,
+    region, namespace, arguments and locale, for the time to live of their
+    namespace. Recently used responses are kept in memory, in front of an
+    optional disk store. Requests made with a user token are not cached.
+    Requests reaching the API wait for their turn in the quota manager.
+
+    :attr hits: Amount of responses served from memory.
+    :attr disk_hits: Amount of responses served from the disk store.
+    :attr misses: Amount of responses requested to the API.
+    """
+
+    def __init__(self, client_id: str, client_secret: str,
+                 store: Optional[ResponseStore] = None,
+                 memory_entries: int = MEMORY_CACHE_ENTRIES,
+                 clock: Callable[[], float] = time.time,
+                 quota: Optional[QuotaManager] = None, **kwargs):
+        super().__init__(client_id, client_secret, **kwargs)
+        self._store = store
+        self._quota = quota or QuotaManager()
+        self._memory: OrderedDict[str, Tuple[float, str]] = OrderedDict()
+        self._memory_entries = memory_entries
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._conditional = threading.local()
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def cache_key(resource: str, region: str, args: Tuple[Any, ...],
+                  filters: Dict[str, Any]) -> str:
+        """Identifies a request by method, region, namespace, arguments and
+        locale, plus any other filter.
+        """
+        others = sorted((k, str(v)) for k, v in filters.items()
+                        if k not in ('namespace', 'locale', 'access_token'))
+        return json.dumps([resource, region, filters.get('namespace'),
+                           [str(arg) for arg in args], filters.get('locale'),
+                           others])
+
+    def get_resource(self, resource, region, *args, **filters):
+        ttl = namespace_ttl(filters.get('namespace'))
+        conditional = getattr(self._conditional, 'request', None)
+        if ttl is None:
+            return super().get_resource(resource, region, *args, **filters)
+
+        key = self.cache_key(resource, region, args, filters)
+        if conditional is None or not conditional.headers():
+            cached = self._lookup(key)
+            if cached is not None:
+                return json.loads(cached)
+        else:
+            with self._lock:
+                self.misses += 1
+
+        data = super().get_resource(resource, region, *args, **filters)
+        if conditional is None or not conditional.not_modified:
+            self._remember(key, json.dumps(data), self._clock() + ttl)
+        return data
+
+    def fetch_if_modified(self, fetch: Callable[[], Any], etag: Optional[str],
+                          last_modified: Optional[str]) -> ConditionalResponse:
+        """Makes the single request of fetch conditional to the validators.
+
+        Given validators, the cache is bypassed, as the request revalidates
+        the caller's copy. Without them, the response may come from the
+        cache, in which case no validators are returned.
+        """
+        conditional = _ConditionalRequest(etag, last_modified)
+        self._conditional.request = conditional
+        try:
+            data = fetch()
+        finally:
+            self._conditional.request = None
+        if conditional.not_modified:
+            return ConditionalResponse(None, etag, last_modified)
+        return ConditionalResponse(data, conditional.etag, conditional.last_modified)
+
+    def _get_client_credentials(self, region):
+        """Requests an access token once the quota allows it."""
+        self._quota.acquire()
+        return super()._get_client_credentials(region)
+
+    def _handle_request(self, url, **kwargs):
+        """Requests the API once the quota allows it.
+
+        Rate limited requests are retried after the Retry-After delay, which
+        holds all the other requests in the meantime. The last 429 is raised
+        right away, without holding the other requests.
+        """
+        conditional = getattr(self._conditional, 'request', None)
+        if conditional is not None:
+            kwargs['headers'] = conditional.headers()
+
+        for attempt in range(MAX_RATE_LIMITED_RETRIES + 1):
+            self._quota.acquire()
+            try:
+                response = self._session.get(url, **kwargs)
+            except RequestException as exc:
+                raise WowApiException(str(exc))
+            if response.status_code != 429 or attempt == MAX_RATE_LIMITED_RETRIES:
+                break
+            self._quota.defer(retry_after_seconds(response.headers.get('Retry-After')))
+
+        if conditional is not None and response.status_code == 304:
+            conditional.not_modified = True
+            return None
+        if not response.ok:
+            raise WowApiException('Invalid response - {0} - {1}'.format(
+                url, response.status_code))
+        if conditional is not None:
+            conditional.etag = response.headers.get('ETag')
+            conditional.last_modified = response.headers.get('Last-Modified')
+        try:
+            return response.json()
+        except ValueError:
+            raise WowApiException('Invalid Json: {0} for {1}'.format(
+                response.content, url))
+
+    def _lookup(self, key: str) -> Optional[str]:
+        """Returns the fresh response of a key from memory, else from disk."""
+        now = self._clock()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                if entry[0] > now:
+                    self._memory.move_to_end(key)
+                    self.hits += 1
+                    return entry[1]
+                del self._memory[key]
+
+        entry = self._store.get(key) if self._store is not None else None
+        with self._lock:
+            if entry is None:
+                self.misses += 1
+                return None
+            self.disk_hits += 1
+            self._keep_in_memory(key, entry)
+        return entry[1]
+
+    def _remember(self, key: str, value: str, expires_at: float):
+        with self._lock:
+            self._keep_in_memory(key, (expires_at, value))
+        if self._store is not None:
+            self._store.put(key, value, expires_at)
+
+    def _keep_in_memory(self, key: str, entry: Tuple[float, str]):
+        """Adds an entry, evicting the least recently used; needs the lock."""
+        self._memory[key] = entry
+        self._memory.move_to_end(key)
+        while len(self._memory) > self._memory_entries:
+            self._memory.popitem(last=False)
+
+    def metrics(self) -> Dict[str, float]:
+        with self._lock:
+            metrics = {
+                'wow_cache_hits': self.hits,
+                'wow_cache_disk_hits': self.disk_hits,
+                'wow_cache_misses': self.misses,
+                'wow_cache_memory_entries': len(self._memory),
+            }
+        metrics.update(self._quota.metrics())
+        return metrics
+
+
+def fetch_if_modified(handler: WowApi, fetch: Callable[[], Any],
+                      etag: Optional[str] = None,
+                      last_modified: Optional[str] = None) -> ConditionalResponse:
+    """Calls fetch, which makes a single request with the handler, as a
+    conditional request if the handler supports it.
+    """
+    if isinstance(handler, CachedWowApi):
+        return handler.fetch_if_modified(fetch, etag, last_modified)
+    return ConditionalResponse(fetch(), None, None)
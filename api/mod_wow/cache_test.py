@@ -0,0 +1,216 @@
+from __future__ import annotations
+
+__LICENSE__ = """
+Copyright 2019 Google LLC
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+    https://www.apache.org/licenses/LICENSE-2.0
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+import os
+import tempfile
+import unittest.mock
+
+from datetime import datetime
+from wowapi import WowApi, WowApiException
+
+from api.mod_wow.cache import CachedWowApi, ResponseStore, fetch_if_modified
+from api.mod_wow.quota import QuotaManager
+
+
+class FakeClock:
+    now = 1000.
+
+    def __call__(self):
+        return self.now
+
+
+class TestCachedWowApi(unittest.TestCase):
+    """Checks the responses of the API are cached per namespace."""
+
+    def setUp(self):
+        self.clock = FakeClock()
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, 'cache.db')
+        patcher = unittest.mock.patch.object(
+            WowApi, 'get_resource', return_value={'id': 536})
+        self.get_resource = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def make_handler(self, **kwargs) -> CachedWowApi:
+        store = ResponseStore(self.path, clock=self.clock)
+        self.addCleanup(store.close)
+        return CachedWowApi('id', 'secret', store, clock=self.clock, **kwargs)
+
+    def test_namespace_ttl(self):
+        """Ensure responses expire according to their namespace."""
+        handler = self.make_handler()
+        handler.get_realm('eu', 'dynamic-eu', 'argent-dawn', locale='en_US')
+        handler.get_playable_class('eu', 'static-eu', 3, locale='en_US')
+        self.clock.now += 2 * 3600
+        handler.get_realm('eu', 'dynamic-eu', 'argent-dawn', locale='en_US')
+        handler.get_playable_class('eu', 'static-eu', 3, locale='en_US')
+        self.assertEqual(self.get_resource.call_count, 2)
+
+        self.clock.now += 5 * 3600
+        handler.get_realm('eu', 'dynamic-eu', 'argent-dawn', locale='en_US')
+        handler.get_playable_class('eu', 'static-eu', 3, locale='en_US')
+        self.assertEqual(self.get_resource.call_count, 3)
+        self.assertEqual(handler.hits, 3)
+        self.assertEqual(handler.misses, 3)
+
+    def test_key(self):
+        """Ensure the region, namespace, arguments and locale are in the key."""
+        handler = self.make_handler()
+        handler.get_realm('eu', 'dynamic-eu', 'argent-dawn', locale='en_US')
+        handler.get_realm('eu', 'dynamic-eu', 'argent-dawn', locale='fr_FR')
+        handler.get_realm('eu', 'dynamic-eu', 'hyjal', locale='en_US')
+        handler.get_realm('us', 'dynamic-us', 'argent-dawn', locale='en_US')
+        handler.get_realm('eu', 'dynamic-eu', 'argent-dawn', locale='en_US')
+        self.assertEqual(self.get_resource.call_count, 4)
+
+    def test_disk_store(self):
+        """Ensure responses survive a restart, through the disk store."""
+        self.make_handler().get_character_profile_summary(
+            'eu', 'profile-eu', 'argent-dawn', 'funkypewpew', locale='en_US')
+
+        handler = self.make_handler()
+        data = handler.get_character_profile_summary(
+            'eu', 'profile-eu', 'argent-dawn', 'funkypewpew', locale='en_US')
+        self.assertEqual(data, {'id': 536})
+        self.assertEqual(self.get_resource.call_count, 1)
+        self.assertEqual(handler.metrics()['wow_cache_disk_hits'], 1)
+
+        self.clock.now += 3600
+        self.make_handler().get_character_profile_summary(
+            'eu', 'profile-eu', 'argent-dawn', 'funkypewpew', locale='en_US')
+        self.assertEqual(self.get_resource.call_count, 2)
+
+    def test_memory_eviction(self):
+        """Ensure the least recently used responses leave the memory."""
+        handler = CachedWowApi('id', 'secret', memory_entries=2, clock=self.clock)
+        for slug in ('a', 'b', 'a', 'c', 'a', 'b'):
+            handler.get_realm('eu', 'dynamic-eu', slug)
+        self.assertEqual(self.get_resource.call_count, 4)
+
+    def test_uncached(self):
+        """Ensure requests outside of the cached namespaces are not cached."""
+        handler = self.make_handler()
+        handler.get_resource('data/wow/token/', 'eu')
+        handler.get_resource('data/wow/token/', 'eu')
+        self.assertEqual(self.get_resource.call_count, 2)
+
+
+class TestConditionalRequests(unittest.TestCase):
+    """Checks stored resources are revalidated with conditional requests."""
+
+    def setUp(self):
+        self.handler = CachedWowApi('id', 'secret')
+        self.handler._access_tokens['eu'] = {
+            'token': 'token', 'expiration': datetime(2100, 1, 1)}
+        self.handler._session = unittest.mock.MagicMock()
+        self.get = self.handler._session.get
+
+    def fetch(self, etag=None, last_modified=None):
+        return fetch_if_modified(self.handler, lambda: self.handler.get_guild(
+            'eu', 'profile-eu', 'argent-dawn', 'negative-waves'), etag, last_modified)
+
+    def test_modified(self):
+        """Ensure a modified resource is returned with its validators."""
+        self.get.return_value.status_code = 200
+        self.get.return_value.json.return_value = {'id': 49392850}
+        self.get.return_value.headers = {
+            'ETag': '"v2"', 'Last-Modified': 'Sat, 17 Oct 2020 10:00:00 GMT'}
+
+        response = self.fetch('"v1"', 'Fri, 16 Oct 2020 10:00:00 GMT')
+
+        self.assertEqual(response.data, {'id': 49392850})
+        self.assertEqual(response.etag, '"v2"')
+        self.assertEqual(response.last_modified, 'Sat, 17 Oct 2020 10:00:00 GMT')
+        self.assertEqual(self.get.call_args.kwargs['headers'], {
+            'If-None-Match': '"v1"',
+            'If-Modified-Since': 'Fri, 16 Oct 2020 10:00:00 GMT'})
+
+    def test_not_modified(self):
+        """Ensure nothing is returned nor cached on a 304."""
+        self.get.return_value.status_code = 304
+
+        response = self.fetch('"v1"')
+        self.assertIsNone(response.data)
+        self.assertEqual(response.etag, '"v1"')
+
+        self.get.return_value.status_code = 200
+        self.get.return_value.json.return_value = {'id': 49392850}
+        self.handler.get_guild('eu', 'profile-eu', 'argent-dawn', 'negative-waves')
+        self.assertEqual(self.get.call_count, 2)
+        self.assertNotIn('headers', self.get.call_args.kwargs)
+
+    def test_without_validators(self):
+        """Ensure requests without validators are served from the cache."""
+        self.get.return_value.status_code = 200
+        self.get.return_value.json.return_value = {'id': 49392850}
+        self.get.return_value.headers = {'ETag': '"v1"'}
+
+        for _ in range(3):
+            response = self.fetch()
+            self.assertEqual(response.data, {'id': 49392850})
+        self.assertEqual(self.get.call_count, 1)
+        self.assertEqual(self.handler.hits, 2)
+        self.assertEqual(self.handler.misses, 1)
+
+        self.fetch('"v1"')
+        self.assertEqual(self.get.call_count, 2)
+        self.assertEqual(self.handler.misses, 2)
+
+    def test_rate_limited(self):
+        """Ensure rate limited requests are retried after Retry-After."""
+        limited = unittest.mock.MagicMock(status_code=429, headers={'Retry-After': '0'})
+        self.get.side_effect = [limited, unittest.mock.DEFAULT]
+        self.get.return_value.status_code = 200
+        self.get.return_value.json.return_value = {'id': 49392850}
+
+        data = self.handler.get_guild('eu', 'profile-eu', 'argent-dawn', 'negative-waves')
+        self.assertEqual(data, {'id': 49392850})
+        self.assertEqual(self.get.call_count, 2)
+        self.assertEqual(self.handler.metrics()['wow_quota_rate_limited'], 1)
+
+    def test_rate_limited_last_attempt(self):
+        """Ensure the last 429 is raised without holding other requests."""
+        limited = unittest.mock.MagicMock(status_code=429, ok=False,
+                                          headers={'Retry-After': '60'})
+        self.get.return_value = limited
+        with unittest.mock.patch('api.mod_wow.cache.MAX_RATE_LIMITED_RETRIES', 0):
+            with self.assertRaises(WowApiException):
+                self.handler.get_guild('eu', 'profile-eu', 'argent-dawn', 'negative-waves')
+        self.assertEqual(self.handler.metrics()['wow_quota_rate_limited'], 0)
+
+    def test_access_token_quota(self):
+        """Ensure the access token requests wait for their turn as well."""
+        quota = QuotaManager()
+        handler = CachedWowApi('id', 'secret', quota=quota)
+        handler._session = self.handler._session
+        self.get.return_value.json.return_value = {
+            'access_token': 'token', 'expires_in': 3600}
+        handler._get_client_credentials('eu')
+        self.assertEqual(quota.metrics()['wow_quota_second_remaining'], 99)
+
+    def test_other_handlers(self):
+        """Ensure handlers without cache make plain requests."""
+        mock = unittest.mock.MagicMock()
+        mock.get_guild.return_value = {'id': 49392850}
+        response = fetch_if_modified(mock, lambda: mock.get_guild(), '"v1"')
+        self.assertEqual(response.data, {'id': 49392850})
+        self.assertIsNone(response.etag)
+
+
+if __name__ == '__main__':
+    unittest.main()
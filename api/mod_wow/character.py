@@ -18,13 +18,18 @@ See the License for the specific language governing permissions and
 limitations under the License.
 """
 
-from typing import Optional, List
+from datetime import timedelta
+from typing import Dict, Iterable, Optional, List, Tuple
 from wowapi import WowApi, WowApiException
 from werkzeug.exceptions import HTTPException
 
 from flask_sqlalchemy import BaseQuery
+from sqlalchemy import bindparam, inspect, select
 
 from api.base import db, BaseSerializerMixin
+from api.common.concurrency import call_concurrently
+from api.mod_wow.cache import ConditionalResponse, fetch_if_modified
+from api.mod_wow.refresh import Refreshable, get_fresh
 from api.mod_wow.realm import WowRealm
 from api.mod_wow.static import WowFaction, WowPlayableClass, WowPlayableSpec
 from api.mod_wow.region import Region
@@ -41,7 +46,7 @@ class CharacerNotFoundException(WowApiException, HTTPException):
         self.realm = realm
         self.character = character
 
-class WowCharacter(db.Model, BaseSerializerMixin):
+class WowCharacter(db.Model, BaseSerializerMixin, Refreshable):
     """Represents a world of warcraft character.
 
     :attr id: ID of the character, matching Blizzard's Game API ID.
@@ -52,6 +57,8 @@ class WowCharacter(db.Model, BaseSerializerMixin):
     :attr active_spec: Currently activated spec, updated last time the player logged out
     :attr average_ilvl: Average iLvL, as seen when the user is tagging.
     :attr equipped_ilvl: Currently equiped iLvL.
+    :attr etag: ETag of the profile summary last retrieved.
+    :attr last_modified: Last-Modified date of the profile summary last retrieved.
     """
     __tablename__ = 'wow_characters'
 
@@ -59,7 +66,10 @@ class WowCharacter(db.Model, BaseSerializerMixin):
     query: BaseQuery
 
     # Serialization options
-    serialize_rules = ('-klass_id', '-active_spec_id','-realm_id')
+    serialize_rules = ('-klass_id', '-active_spec_id','-realm_id', '-etag', '-last_modified')
+
+    # Item levels and active specs change every time the player logs out.
+    FRESHNESS_TTL = timedelta(hours=1)
 
     id = db.Column(db.String, primary_key=True)
     date_created = db.Column(
@@ -80,58 +90,175 @@ class WowCharacter(db.Model, BaseSerializerMixin):
     active_spec = db.relationship(WowPlayableSpec, uselist=False)
     average_ilvl = db.Column(db.Integer)
     equipped_ilvl = db.Column(db.Integer)
+    etag = db.Column(db.String)
+    last_modified = db.Column(db.String)
 
     @classmethod
-    def create_from_api(cls, handler: WowApi, realm: WowRealm, name: str) -> WowCharacter:
-        """Retrieves data about a character from the wow API."""
+    def fetch_profile(cls, handler: WowApi, realm: WowRealm, name: str,
+                      etag: Optional[str] = None,
+                      last_modified: Optional[str] = None) -> ConditionalResponse:
+        """Retrieves the profile summary of a character from the wow API.
+
+        If validators of a previous retrieval are given, the profile data is
+        None when it did not change since. Only reaches the API, hence can run
+        outside of the application context.
+        """
         try:
-            data = handler.get_character_profile_summary(
-                realm.region.value, realm.region.profile_namespace, realm.slug,
-                name.lower(), locale='en_US')
+            return fetch_if_modified(
+                handler, lambda: handler.get_character_profile_summary(
+                    realm.region.value, realm.region.profile_namespace, realm.slug,
+                    name.lower(), locale='en_US'),
+                etag, last_modified)
         except WowApiException as e:
             if str(e).endswith('404'):
                 raise CharacerNotFoundException(str(e), realm, name)
+            raise
+
+    @classmethod
+    def from_profile(cls, profile: ConditionalResponse, realm: WowRealm,
+                     klass: WowPlayableClass) -> WowCharacter:
+        """Creates a WowCharacter from its profile summary."""
+        character = cls(id=str(profile.data['id']), realm_id=realm.id, realm=realm)
+        character.apply_profile(profile, klass)
+        return character
 
-        klass = WowPlayableClass.get_or_create(handler, data['character_class']['id'])
-        return cls(
-            id=str(data['id']),
-            name=data['name'],
-            realm_id=realm.id,
-            realm=realm,
-            faction=WowFaction(data['faction']['type']),
-            klass=klass,
-            active_spec_id=data['active_spec']['id'],
-            average_ilvl=data['average_item_level'],
-            equipped_ilvl=data['equipped_item_level'])
+    def apply_profile(self, profile: ConditionalResponse, klass: WowPlayableClass):
+        """Updates the character from its profile summary."""
+        data = profile.data
+        self.name = data['name']
+        self.faction = WowFaction(data['faction']['type'])
+        self.klass_id = klass.id
+        self.klass = klass
+        self.active_spec_id = data['active_spec']['id']
+        self.active_spec = next(
+            (spec for spec in klass.specs if spec.id == self.active_spec_id), None)
+        self.average_ilvl = data['average_item_level']
+        self.equipped_ilvl = data['equipped_item_level']
+        self.etag = profile.etag
+        self.last_modified = profile.last_modified
+
+    @classmethod
+    def create_from_api(cls, handler: WowApi, realm: WowRealm, name: str) -> WowCharacter:
+        """Retrieves data about a character from the wow API."""
+        profile = cls.fetch_profile(handler, realm, name)
+        klass = WowPlayableClass.get_or_create(
+            handler, profile.data['character_class']['id'])
+        return cls.from_profile(profile, realm, klass)
+
+    def refresh_from_api(self, handler: WowApi) -> bool:
+        """Refreshes the character from the wow API.
+
+        The request is conditional to the validators of the last retrieval:
+        if the profile did not change, the row is only touched, to record the
+        character is up to date. Returns whether the character changed.
+        """
+        profile = self.fetch_profile(
+            handler, self.realm, self.name, self.etag, self.last_modified)
+        if profile.data is None:
+            self.date_modified = db.func.current_timestamp()
+            return False
+        klass = WowPlayableClass.get_or_create(
+            handler, profile.data['character_class']['id'])
+        self.apply_profile(profile, klass)
+        return True
 
     @classmethod
     def get_or_create(cls, handler: WowApi, realm: WowRealm, name: str) -> WowCharacter:
-        """Try to get a WowCharacter from the database or create it from the API."""
+        """Try to get a WowCharacter from the database or create it from the API.
+
+        Stored characters are returned right away; stale ones are refreshed
+        in the background.
+        """
         character: Optional[WowCharacter] = cls.query.filter_by(
             realm_id=realm.id, name=name.title()).one_or_none()
         if character is None:
-            character = cls.create_from_api(handler, realm, name)
-        return character
+            return cls.create_from_api(handler, realm, name)
+        return get_fresh(character, handler)
 
     @classmethod
     def get_logged_user_characters(cls, handler: WowApi, token: str, region: Region) -> List[WowCharacter]:
-        """Retrieves the user's character list."""
-        print(region.value, region.profile_namespace, token)
+        """Retrieves the user's character list.
+
+        Characters are resolved in batches rather than one at a time: the
+        distinct realms first, then the stored characters with one query,
+        then the missing characters and their classes concurrently from the
+        API. Stale stored characters are refreshed in the background. New
+        characters are not saved, see bulk_upsert.
+        """
         data = handler.get_account_profile_summary(region.value, region.profile_namespace, token)
 
         # Users may have multiple accounts in the event they have/had
         # different subscriptions.
-        accounts = data.get('wow_accounts', [])
+        wanted: List[Tuple[str, str]] = list(dict.fromkeys(
+            (character_data['realm']['slug'], character_data['name'].title())
+            for account in data.get('wow_accounts', [])
+            for character_data in account.get('characters', [])))
+        if not wanted:
+            return []
+        realms = WowRealm.get_or_create_many(handler, region, (slug for slug, _ in wanted))
+
+        stored: Dict[Tuple[int, str], WowCharacter] = {
+            (character.realm_id, character.name): get_fresh(character, handler)
+            for character in cls.query.filter(
+                cls.realm_id.in_({realm.id for realm in realms.values()}),
+                cls.name.in_({name for _, name in wanted}))}
+
+        # The wow api has missing data when querying a character from the account-bound
+        # character API, such as ilvl, active spec etc. To have the full definition
+        # of the character we need to query again the character from the public API.
+        profiles = call_concurrently(
+            lambda key: cls.fetch_profile(handler, realms[key[0]], key[1]),
+            ((slug, name) for slug, name in wanted
+             if (realms[slug].id, name) not in stored))
+        found: Dict[Tuple[str, str], ConditionalResponse] = {}
+        for key, future in profiles.items():
+            try:
+                found[key] = future.result()
+            except CharacerNotFoundException:
+                pass
+        classes = WowPlayableClass.get_or_create_many(
+            handler, (profile.data['character_class']['id'] for profile in found.values()))
+
         characters: List[WowCharacter] = []
-        for account in accounts:
-            for character_data in account.get('characters', []):
-                # The wow api has missing data when querying a character from the account-bound
-                # character API, such as ilvl, active spec etc. To have the full definition
-                # of the character we need to query again the character from the public API.
-                realm = WowRealm.get_or_create(
-                    handler, region, character_data['realm']['slug'])
-                try:
-                    characters.append(cls.get_or_create(handler, realm, character_data['name']))
-                except CharacerNotFoundException as e:
-                    pass
+        for slug, name in wanted:
+            realm = realms[slug]
+            if (realm.id, name) in stored:
+                characters.append(stored[(realm.id, name)])
+            elif (slug, name) in found:
+                profile = found[(slug, name)]
+                characters.append(cls.from_profile(
+                    profile, realm, classes[profile.data['character_class']['id']]))
         return characters
+
+    @classmethod
+    def bulk_upsert(cls, characters: Iterable[WowCharacter]):
+        """Saves the characters not loaded from the database at once.
+
+        Their new realms and classes are added to the session, then the
+        characters are inserted, or updated when stored under another name or
+        realm, through one executemany each. Writes are left uncommitted.
+        """
+        created = [c for c in characters if inspect(c).transient]
+        if not created:
+            return
+        db.session.add_all({c.realm for c in created} | {c.klass for c in created})
+        db.session.flush()
+
+        table = cls.__table__
+        values = {c.id: {'name': c.name, 'realm_id': c.realm_id, 'faction': c.faction,
+                         'klass_id': c.klass_id, 'active_spec_id': c.active_spec_id,
+                         'average_ilvl': c.average_ilvl, 'equipped_ilvl': c.equipped_ilvl,
+                         'etag': c.etag, 'last_modified': c.last_modified}
+                  for c in created}
+        stored = {character_id for character_id, in db.session.execute(
+            select(table.c.id).where(table.c.id.in_(list(values))))}
+        inserted = [dict(v, id=character_id) for character_id, v in values.items()
+                    if character_id not in stored]
+        updated = [dict(v, character_id=character_id) for character_id, v in values.items()
+                   if character_id in stored]
+        if inserted:
+            db.session.execute(table.insert(), inserted)
+        if updated:
+            db.session.execute(
+                table.update().where(table.c.id == bindparam('character_id')),
+                updated)
@@ -20,11 +20,15 @@ import json
 import os
 import unittest.mock
 
+from datetime import datetime
+from wowapi import WowApiException
+
 from api.common.testing import DatabaseTestFixture
+from api.mod_wow.cache import ConditionalResponse
 from api.mod_wow.character import WowCharacter
 from api.mod_wow.region import Region
 from api.mod_wow.realm import WowRealm
-from api.mod_wow.static import WowFaction
+from api.mod_wow.static import WowFaction, WowPlayableClass, WowPlayableSpec
 
 
 TESTDATA_DIR = os.path.join(
@@ -88,3 +92,85 @@ class TestWowPlayableSpecModel(DatabaseTestFixture, unittest.TestCase):
         mock.get_character_profile_summary.assert_not_called()
         self.assertEqual(character.id, '123456')
         self.assertEqual(character.name, 'Funkypewpew')
+
+    def test_get_logged_user_characters(self):
+        """Tests the characters of an account are resolved in batches."""
+        def get_realm(region, namespace, slug, locale=None):
+            return {'id': len(slug), 'name': slug.title(), 'slug': slug,
+                    'timezone': 'Europe/Paris'}
+
+        def get_character(region, namespace, slug, name, locale=None):
+            if name == 'unknown':
+                raise WowApiException('Request failed with code 404')
+            return self.CHARACTER_DATA
+
+        mock = unittest.mock.MagicMock()
+        mock.get_realm.side_effect = get_realm
+        mock.get_character_profile_summary.side_effect = get_character
+        mock.get_account_profile_summary.return_value = {'wow_accounts': [
+            {'characters': [
+                {'name': 'Funkypewpew', 'realm': {'slug': 'argent-dawn'}},
+                {'name': 'Stored', 'realm': {'slug': 'hyjal'}},
+                {'name': 'Unknown', 'realm': {'slug': 'hyjal'}},
+            ]},
+            {'characters': [
+                {'name': 'Funkypewpew', 'realm': {'slug': 'argent-dawn'}},
+            ]},
+        ]}
+        hyjal = WowRealm(id=5, region=Region.eu, name='Hyjal', slug='hyjal',
+                         timezone_name='Europe/Paris')
+        klass = WowPlayableClass(id=3, name='Hunter')
+        klass.specs = [WowPlayableSpec(id=253, name='Beast Mastery')]
+        self.db.session.add_all([
+            klass, WowCharacter(id='1', name='Stored', realm=hyjal)])
+        self.db.session.commit()
+
+        characters = WowCharacter.get_logged_user_characters(mock, 'token', Region.eu)
+
+        self.assertEqual([c.name for c in characters], ['Funkypewpew', 'Stored'])
+        mock.get_realm.assert_called_once_with(
+            'eu', 'dynamic-eu', 'argent-dawn', locale='en_US')
+        self.assertEqual(mock.get_character_profile_summary.call_count, 2)
+        self.assertEqual(characters[0].realm.slug, 'argent-dawn')
+        self.assertEqual(characters[0].active_spec.name, 'Beast Mastery')
+
+        WowCharacter.bulk_upsert(characters)
+        self.db.session.commit()
+        self.assertEqual(WowCharacter.query.count(), 2)
+        stored = WowCharacter.query.get('146666340')
+        self.assertEqual(stored.realm.name, 'Argent-Dawn')
+        self.assertEqual(stored.klass.name, 'Hunter')
+        self.assertEqual(stored.equipped_ilvl, 135)
+
+    def test_refresh_from_api(self):
+        """Tests a character is only touched when its profile did not change."""
+        realm = WowRealm(id=536, region=Region.eu, slug='argent-dawn')
+        klass = WowPlayableClass(id=3, name='Hunter')
+        klass.specs = [WowPlayableSpec(id=253, name='Beast Mastery')]
+        character = WowCharacter(id='146666340', name='Funkypewpew', realm=realm,
+                                 equipped_ilvl=120, etag='"v1"',
+                                 date_modified=datetime(2020, 1, 1))
+        self.db.session.add_all([klass, character])
+        self.db.session.commit()
+        mock = unittest.mock.MagicMock()
+
+        with unittest.mock.patch(
+                'api.mod_wow.character.fetch_if_modified',
+                return_value=ConditionalResponse(None, '"v1"', None)) as fetch:
+            self.assertFalse(character.refresh_from_api(mock))
+        self.db.session.commit()
+        self.assertEqual(fetch.call_args.args[2:], ('"v1"', None))
+        self.assertEqual(character.equipped_ilvl, 120)
+        self.assertGreater(character.date_modified, datetime(2020, 1, 1))
+
+        with unittest.mock.patch(
+                'api.mod_wow.character.fetch_if_modified',
+                return_value=ConditionalResponse(self.CHARACTER_DATA, '"v2"', None)):
+            self.assertTrue(character.refresh_from_api(mock))
+        self.db.session.commit()
+        self.assertEqual(character.equipped_ilvl, 135)
+        self.assertEqual(character.etag, '"v2"')
+        self.assertEqual(character.active_spec.name, 'Beast Mastery')
+        self.assertNotIn('etag', character.to_dict())
+        self.assertNotIn('last_modified', character.to_dict())
+
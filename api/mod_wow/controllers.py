@@ -15,13 +15,14 @@ See the License for the specific language governing permissions and
 limitations under the License.
 """
 
-from flask import Blueprint, jsonify, request
-from typing import Optional
+from flask import Blueprint, Response, jsonify, request
+from typing import Mapping, Optional
 
 from config.blizzard import get_wow_handler
 from api.base import db
 from api.mod_auth.session import get_bnet_session, get_discord_session
 from api.mod_wow.character import WowCharacter
+from api.mod_wow.refresh import refresh_queue
 from api.mod_wow.region import DEFAULT_REGION, Region
 from api.mod_user.user import User, UserOwnsCharacters
 
@@ -39,17 +40,40 @@ def get_all_characters():
     
     # Create the relationship with the user, if not already existing.
     user = User.from_oauth_discord(discord_session)
-    relationships = []
-    for character in characters:
-        existing = UserOwnsCharacters.query.filter_by(
-            user_id=user.id, character_id=character.id).one_or_none()
-        if existing is None:
-            relationships.append(UserOwnsCharacters(user.id, character.id))
-    
+    owned = {character_id for character_id, in db.session.query(
+        UserOwnsCharacters.character_id).filter(
+            UserOwnsCharacters.user_id == user.id,
+            UserOwnsCharacters.character_id.in_([c.id for c in characters]))}
+    relationships = [UserOwnsCharacters(user.id, c.id)
+                     for c in characters if c.id not in owned]
+
     # Save the characters in cache. This will reduce by a margin the
     # amount of QPS on the WoW API.
+    WowCharacter.bulk_upsert(characters)
     db.session.add_all(relationships)
-    db.session.add_all(characters)
     db.session.commit()
     return jsonify(data=[c.to_dict() for c in characters])
 
+
+def _render_gauges(gauges: Mapping[str, float]) -> str:
+    """Renders metrics in the Prometheus text format."""
+    lines = []
+    for name, value in sorted(gauges.items()):
+        lines.append('# TYPE web_%s gauge' % name)
+        lines.append('web_%s %s' % (name, float(value)))
+    return '\n'.join(lines) + '\n'
+
+
+@mod_wow.route('/metrics')
+def get_metrics():
+    """Returns the metrics of the Blizzard API requests of this process, in
+    the Prometheus text format: cache hits and misses, background refreshes
+    and quota.
+
+    The remaining budget is the one of all the processes when they share a
+    quota file.
+    """
+    gauges = dict(get_wow_handler().metrics())
+    gauges.update(refresh_queue.metrics())
+    return Response(_render_gauges(gauges),
+                    mimetype='text/plain; version=0.0.4')
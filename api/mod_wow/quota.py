@@ -0,0 +1,318 @@
+"""Keeps the requests to the Blizzard API under its rate limits.
+
+Blizzard allows 100 requests per second and 36,000 requests per hour per
+client. Every request made by the application waits for its turn in a
+QuotaManager, which serves the waiting requests by priority: users waiting
+on a page come first, then the background refreshes, then the bulk loads.
+
+The budget can be shared by the processes using the same client, e.g. the
+web application, the bot and bin/preload_data.py, through a SQLite file.
+"""
+
+from __future__ import annotations
+
+__LICENSE__ = """
+Copyright 2019 Google LLC
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    https://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+import contextlib
+import contextvars
+import heapq
+import itertools
+import sqlite3
+import threading
+import time
+
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from enum import IntEnum
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+
+REQUESTS_PER_SECOND = 100
+REQUESTS_PER_HOUR = 36000
+
+# Delay applied after a 429 which does not tell how long to wait, in seconds.
+DEFAULT_RETRY_AFTER = 1.
+
+
+class Priority(IntEnum):
+    """Priority classes of the requests, the lowest value first."""
+    interactive = 0
+    background = 1
+    bulk = 2
+
+
+# Share of the budgets the lower priorities leave to the upper ones, so a
+# bulk load, even from another process, never starves the users.
+RESERVE = {
+    Priority.interactive: 0.,
+    Priority.background: .1,
+    Priority.bulk: .25,
+}
+
+_priority: contextvars.ContextVar[Priority] = contextvars.ContextVar(
+    'request_priority', default=Priority.interactive)
+
+
+@contextlib.contextmanager
+def request_priority(priority: Priority) -> Iterator[None]:
+    """Makes the requests of the block use the given priority.
+
+    Requests are interactive by default.
+    """
+    token = _priority.set(priority)
+    try:
+        yield
+    finally:
+        _priority.reset(token)
+
+
+def retry_after_seconds(value: Optional[str]) -> float:
+    """Parses a Retry-After header, either a delay in seconds or a date."""
+    if not value:
+        return DEFAULT_RETRY_AFTER
+    try:
+        return max(float(value), 0.)
+    except ValueError:
+        pass
+    try:
+        date = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return DEFAULT_RETRY_AFTER
+    if date.tzinfo is None:
+        date = date.replace(tzinfo=timezone.utc)
+    return max((date - datetime.now(timezone.utc)).total_seconds(), 0.)
+
+
+class TokenBucket:
+    """Allows capacity requests per period, with bursts up to capacity.
+
+    :attr tokens: Amount of requests allowed right away, as of updated.
+    :attr updated: When the tokens were last refilled.
+    """
+
+    def __init__(self, capacity: int, period: float, now: float,
+                 tokens: Optional[float] = None):
+        self.capacity = capacity
+        self.rate = capacity / period
+        self.tokens = float(capacity) if tokens is None else tokens
+        self.updated = now
+
+    def _refill(self, now: float):
+        # The clock may go backwards, e.g. when set by NTP.
+        elapsed = max(now - self.updated, 0.)
+        self.tokens = min(self.capacity, self.tokens + elapsed * self.rate)
+        self.updated = now
+
+    def remaining(self, now: float) -> float:
+        self._refill(now)
+        return self.tokens
+
+    def delay(self, now: float, reserve: float = 0.) -> float:
+        """Returns how long to wait for a token, leaving reserve tokens."""
+        missing = 1 + reserve - self.remaining(now)
+        return max(missing / self.rate, 0.)
+
+    def take(self, now: float):
+        self._refill(now)
+        self.tokens -= 1
+
+
+class MemoryBudget:
+    """The rate limits budget of a single process.
+
+    :attr second: Bucket of the per-second limit.
+    :attr hour: Bucket of the per-hour limit.
+    :attr blocked_until: Time until which no request can be made.
+    """
+
+    def __init__(self, per_second: int, per_hour: int, now: float):
+        self.second = TokenBucket(per_second, 1., now)
+        self.hour = TokenBucket(per_hour, 3600., now)
+        self.blocked_until = now
+
+    def take(self, now: float, reserve: float) -> float:
+        """Takes a request from the budget, leaving a share of it to the
+        upper priorities.
+
+        Returns 0 if taken, else how long to wait before trying again.
+        """
+        delay = max(self.blocked_until - now,
+                    self.second.delay(now, reserve * self.second.capacity),
+                    self.hour.delay(now, reserve * self.hour.capacity))
+        if delay <= 0:
+            self.second.take(now)
+            self.hour.take(now)
+        return delay
+
+    def block(self, until: float):
+        self.blocked_until = max(self.blocked_until, until)
+
+    def remaining(self, now: float) -> Tuple[float, float]:
+        """Returns the requests left this second and this hour."""
+        return self.second.remaining(now), self.hour.remaining(now)
+
+
+class SharedBudget:
+    """The rate limits budget shared by the processes using a SQLite file.
+
+    The buckets are read and written back within a single transaction for
+    each request. Times are read from the wall clock, common to the
+    processes. Safe to use from many threads.
+    """
+
+    def __init__(self, path: str, per_second: int, per_hour: int, now: float):
+        self._per_second = per_second
+        self._per_hour = per_hour
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(
+            path, timeout=10., isolation_level=None, check_same_thread=False)
+        with self._lock:
+            self._connection.execute(
+                'CREATE TABLE IF NOT EXISTS quota ('
+                'name TEXT PRIMARY KEY, value REAL NOT NULL, '
+                'updated REAL NOT NULL)')
+            self._connection.executemany(
+                'INSERT OR IGNORE INTO quota (name, value, updated) VALUES (?, ?, ?)',
+                (('second', per_second, now), ('hour', per_hour, now),
+                 ('blocked_until', now, now)))
+
+    def _load(self) -> MemoryBudget:
+        rows = {name: (value, updated) for name, value, updated in
+                self._connection.execute('SELECT name, value, updated FROM quota')}
+        budget = MemoryBudget(self._per_second, self._per_hour, 0.)
+        for name, bucket in (('second', budget.second), ('hour', budget.hour)):
+            bucket.tokens, bucket.updated = rows[name]
+        budget.blocked_until = rows['blocked_until'][0]
+        return budget
+
+    def _store(self, budget: MemoryBudget):
+        self._connection.executemany(
+            'UPDATE quota SET value = ?, updated = ? WHERE name = ?',
+            ((budget.second.tokens, budget.second.updated, 'second'),
+             (budget.hour.tokens, budget.hour.updated, 'hour'),
+             (budget.blocked_until, budget.blocked_until, 'blocked_until')))
+
+    @contextlib.contextmanager
+    def _transaction(self) -> Iterator[MemoryBudget]:
+        """Loads the budget, and stores it back unless an error is raised."""
+        with self._lock:
+            # Locks the file for writing right away, so the processes do not
+            # spend the same tokens.
+            self._connection.execute('BEGIN IMMEDIATE')
+            try:
+                budget = self._load()
+                yield budget
+                self._store(budget)
+            except BaseException:
+                self._connection.execute('ROLLBACK')
+                raise
+            self._connection.execute('COMMIT')
+
+    def take(self, now: float, reserve: float) -> float:
+        with self._transaction() as budget:
+            return budget.take(now, reserve)
+
+    def block(self, until: float):
+        with self._transaction() as budget:
+            budget.block(until)
+
+    def remaining(self, now: float) -> Tuple[float, float]:
+        with self._lock:
+            return self._load().remaining(now)
+
+    def close(self):
+        with self._lock:
+            self._connection.close()
+
+
+class QuotaManager:
+    """Makes requests wait for their turn under the rate limits.
+
+    Waiting requests of the process are served by priority, then in order of
+    arrival. When Blizzard answers with a 429, all requests wait for the
+    Retry-After delay. Given a path, the budget and the 429 delays are shared
+    with the other processes using it; processes only yield to each other
+    through the shares of the budget left to the upper priorities. Safe to
+    use from many threads.
+
+    :attr throttled: Amount of requests which had to wait.
+    :attr rate_limited: Amount of 429 answers waited for.
+    """
+
+    def __init__(self, per_second: int = REQUESTS_PER_SECOND,
+                 per_hour: int = REQUESTS_PER_HOUR,
+                 path: Optional[str] = None,
+                 clock: Callable[[], float] = time.time):
+        now = clock()
+        self._clock = clock
+        self._budget = (SharedBudget(path, per_second, per_hour, now) if path
+                        else MemoryBudget(per_second, per_hour, now))
+        self._condition = threading.Condition()
+        self._waiters: List[List[int]] = []
+        self._sequence = itertools.count()
+        self.throttled = 0
+        self.rate_limited = 0
+
+    def acquire(self, priority: Optional[Priority] = None):
+        """Blocks until a request of the priority, by default the one of the
+        current context, can be made.
+        """
+        if priority is None:
+            priority = _priority.get()
+        with self._condition:
+            entry = [priority, next(self._sequence)]
+            heapq.heappush(self._waiters, entry)
+            # Lets a waiting request of lower priority yield its turn.
+            self._condition.notify_all()
+            throttled = False
+            try:
+                while True:
+                    if self._waiters[0] is not entry:
+                        self._condition.wait()
+                        continue
+                    delay = self._budget.take(self._clock(), RESERVE[priority])
+                    if delay <= 0:
+                        return
+                    if not throttled:
+                        throttled = True
+                        self.throttled += 1
+                    self._condition.wait(delay)
+            finally:
+                self._waiters.remove(entry)
+                heapq.heapify(self._waiters)
+                self._condition.notify_all()
+
+    def defer(self, seconds: float):
+        """Holds all the requests for some time, e.g. after a 429."""
+        with self._condition:
+            self.rate_limited += 1
+            self._budget.block(self._clock() + seconds)
+            self._condition.notify_all()
+
+    def metrics(self) -> Dict[str, float]:
+        with self._condition:
+            second, hour = self._budget.remaining(self._clock())
+            metrics = {
+                'wow_quota_second_remaining': int(second),
+                'wow_quota_hour_remaining': int(hour),
+                'wow_quota_throttled': self.throttled,
+                'wow_quota_rate_limited': self.rate_limited,
+            }
+            for priority in Priority:
+                metrics['wow_quota_waiting_%s' % priority.name] = sum(
+                    1 for waiter in self._waiters if waiter[0] == priority)
+        return metrics
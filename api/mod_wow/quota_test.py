@@ -0,0 +1,125 @@
+from __future__ import annotations
+
+__LICENSE__ = """
+Copyright 2019 Google LLC
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+    https://www.apache.org/licenses/LICENSE-2.0
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+import os
+import tempfile
+import threading
+import time
+import unittest
+
+from api.mod_wow.quota import Priority, QuotaManager, RESERVE, TokenBucket, \
+    request_priority, retry_after_seconds
+
+
+class TestQuotaManager(unittest.TestCase):
+    """Checks the requests are kept under the rate limits, by priority."""
+
+    def test_token_bucket(self):
+        """Ensure tokens refill at the rate of the bucket."""
+        bucket = TokenBucket(10, 1., now=0.)
+        for _ in range(10):
+            bucket.take(0.)
+        self.assertAlmostEqual(bucket.delay(0.), .1)
+        self.assertAlmostEqual(bucket.remaining(.5), 5.)
+        self.assertAlmostEqual(bucket.remaining(60.), 10.)
+        self.assertAlmostEqual(bucket.delay(60., reserve=9), 0.)
+        self.assertAlmostEqual(bucket.delay(60., reserve=10), .1)
+
+    def test_reserve(self):
+        """Ensure bulk requests leave part of the budget to users."""
+        quota = QuotaManager(per_second=100, per_hour=4, clock=lambda: 0.)
+        for _ in range(3):
+            quota.acquire(Priority.bulk)
+        self.assertGreater(quota._budget.take(0., RESERVE[Priority.bulk]), 0.)
+        quota.acquire()
+        self.assertEqual(quota.metrics()['wow_quota_hour_remaining'], 0)
+
+    def test_priority(self):
+        """Ensure waiting users are served before bulk requests."""
+        quota = QuotaManager(per_second=10)
+        quota._budget.second.take(time.time())
+        for _ in range(9):
+            quota.acquire()
+        served = []
+
+        def request(priority: Priority):
+            with request_priority(priority):
+                quota.acquire()
+            served.append(priority)
+
+        bulk = threading.Thread(target=request, args=(Priority.bulk,))
+        bulk.start()
+        while not quota.metrics()['wow_quota_waiting_bulk']:
+            time.sleep(.001)
+        interactive = threading.Thread(target=request, args=(Priority.interactive,))
+        interactive.start()
+        bulk.join()
+        interactive.join()
+
+        self.assertEqual(served, [Priority.interactive, Priority.bulk])
+        self.assertEqual(quota.throttled, 2)
+
+    def test_retry_after(self):
+        """Ensure a 429 holds all the requests for its Retry-After delay."""
+        self.assertEqual(retry_after_seconds('2'), 2.)
+        self.assertEqual(retry_after_seconds(None), 1.)
+        self.assertEqual(retry_after_seconds('Wed, 21 Oct 2015 07:28:00 GMT'), 0.)
+
+        quota = QuotaManager()
+        quota.defer(.05)
+        start = time.monotonic()
+        quota.acquire()
+        self.assertGreaterEqual(time.monotonic() - start, .04)
+        self.assertEqual(quota.metrics()['wow_quota_rate_limited'], 1)
+
+
+class TestSharedBudget(unittest.TestCase):
+    """Checks the processes sharing a quota file share its budget."""
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, 'quota.db')
+
+    def make_quota(self, **kwargs) -> QuotaManager:
+        quota = QuotaManager(path=self.path, **kwargs)
+        self.addCleanup(quota._budget.close)
+        return quota
+
+    def test_shared_budget(self):
+        """Ensure requests of a process are spent from the others' budget."""
+        web = self.make_quota(per_second=100, per_hour=8, clock=lambda: 0.)
+        preload = self.make_quota(per_second=100, per_hour=8, clock=lambda: 0.)
+        for _ in range(6):
+            preload.acquire(Priority.bulk)
+        self.assertEqual(web.metrics()['wow_quota_hour_remaining'], 2)
+        # The bulk requests left their share of the budget to the users.
+        self.assertGreater(preload._budget.take(0., RESERVE[Priority.bulk]), 0.)
+        web.acquire()
+        web.acquire()
+        self.assertEqual(preload.metrics()['wow_quota_hour_remaining'], 0)
+
+    def test_shared_retry_after(self):
+        """Ensure a 429 holds the requests of all the processes."""
+        web = self.make_quota()
+        bot = self.make_quota()
+        web.defer(.05)
+        start = time.monotonic()
+        bot.acquire()
+        self.assertGreaterEqual(time.monotonic() - start, .04)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -18,16 +18,19 @@ See the License for the specific language governing permissions and
 limitations under the License.
 """
 
+from datetime import timedelta
 from flask_sqlalchemy import BaseQuery
-from typing import Optional
+from typing import Any, Dict, Iterable, Optional
 from wowapi import WowApi
 from pytz import timezone
 
 from api.base import db, BaseSerializerMixin
+from api.common.concurrency import call_concurrently
+from api.mod_wow.refresh import Refreshable, get_fresh
 from api.mod_wow.region import Region
 
 
-class WowRealm(db.Model, BaseSerializerMixin):
+class WowRealm(db.Model, BaseSerializerMixin, Refreshable):
     """Represents a world of warcraft realm.
 
     :attr id: ID of the realm, matching Blizzard's Game API ID.
@@ -44,6 +47,9 @@ class WowRealm(db.Model, BaseSerializerMixin):
     # Serialization options
     serialize_rules = ('-timezone',)
 
+    # Realms are only renamed or moved on rare occasions.
+    FRESHNESS_TTL = timedelta(days=1)
+
     id = db.Column(db.Integer, primary_key=True)
     date_created = db.Column(
         db.DateTime,
@@ -66,19 +72,59 @@ class WowRealm(db.Model, BaseSerializerMixin):
     @classmethod
     def create_from_api(cls, handler: WowApi, region: Region, realm_slug: str) -> WowRealm:
         """Creates a WowPlayableClass from the data returned by the WoW API"""
-        data = handler.get_realm(region.value, region.dynamic_namespace, realm_slug, locale='en_US')
         realm = cls()
-        realm.id = data['id']
-        realm.name = data['name']
-        realm.slug = data['slug']
         realm.region = region
-        realm.timezone_name = data['timezone']
+        realm.apply_data(cls.fetch_data(handler, region, realm_slug))
         return realm
 
+    @staticmethod
+    def fetch_data(handler: WowApi, region: Region, realm_slug: str) -> Dict[str, Any]:
+        return handler.get_realm(region.value, region.dynamic_namespace, realm_slug, locale='en_US')
+
+    def apply_data(self, data: Dict[str, Any]):
+        """Updates the realm from the data returned by the WoW API."""
+        self.id = data['id']
+        self.name = data['name']
+        self.slug = data['slug']
+        self.timezone_name = data['timezone']
+
+    def refresh_from_api(self, handler: WowApi) -> bool:
+        """Refreshes the realm from the WoW API; returns whether it changed."""
+        data = self.fetch_data(handler, self.region, self.slug)
+        changed = (self.name, self.slug, self.timezone_name) != (
+            data['name'], data['slug'], data['timezone'])
+        self.apply_data(data)
+        if not changed:
+            self.date_modified = db.func.current_timestamp()
+        return changed
+
     @classmethod
     def get_or_create(cls, handler: WowApi, region: Region, realm_slug: str) -> WowRealm:
-        """Try to get a WowRealm from the database or create it from the API."""
+        """Try to get a WowRealm from the database or create it from the API.
+
+        Stored realms are returned right away; stale ones are refreshed in
+        the background.
+        """
         realm: Optional[WowRealm] = cls.query.filter_by(region=region, slug=realm_slug).one_or_none()
         if realm is None:
-            realm = cls.create_from_api(handler, region, realm_slug)
-        return realm
+            return cls.create_from_api(handler, region, realm_slug)
+        return get_fresh(realm, handler)
+
+    @classmethod
+    def get_or_create_many(cls, handler: WowApi, region: Region,
+                           realm_slugs: Iterable[str]) -> Dict[str, WowRealm]:
+        """Gets many WowRealm at once, by slug.
+
+        Stored realms are loaded with one query, stale ones being refreshed in
+        the background; the others are created from the API concurrently.
+        """
+        slugs = set(realm_slugs)
+        realms: Dict[str, WowRealm] = {
+            realm.slug: get_fresh(realm, handler) for realm in cls.query.filter(
+                cls.region == region, cls.slug.in_(slugs))}
+        fetched = call_concurrently(
+            lambda slug: cls.create_from_api(handler, region, slug),
+            slugs - realms.keys())
+        for slug, future in fetched.items():
+            realms[slug] = future.result()
+        return realms
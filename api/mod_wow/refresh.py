@@ -0,0 +1,152 @@
+"""Keeps the models built from the Blizzard API fresh, in the background.
+
+Models are served from the database while fresh. Once stale, they are still
+served right away, while a refresh from the API is queued: users never wait
+on the API for data we already have (stale-while-revalidate).
+"""
+
+from __future__ import annotations
+
+__LICENSE__ = """
+Copyright 2019 Google LLC
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    https://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+import logging
+import queue
+import threading
+
+from datetime import datetime, timedelta
+from flask import Flask, current_app
+from sqlalchemy import inspect
+from typing import Any, Dict, Optional, Set, Tuple, Type
+from wowapi import WowApi
+
+from api.base import db
+from api.mod_wow.quota import Priority, request_priority
+
+
+class Refreshable:
+    """A model built from the API, which can be refreshed from it.
+
+    :attr FRESHNESS_TTL: How long the model is served without refreshing it,
+        since its last update (date_modified).
+    """
+
+    FRESHNESS_TTL: timedelta
+
+    def is_stale(self, now: Optional[datetime] = None) -> bool:
+        """Whether the model should be refreshed from the API."""
+        # date_modified is set by the database, in UTC.
+        date_modified = getattr(self, 'date_modified', None)
+        if not isinstance(date_modified, datetime):
+            return date_modified is None
+        return date_modified + self.FRESHNESS_TTL <= (now or datetime.utcnow())
+
+    def refresh_from_api(self, handler: WowApi) -> bool:
+        """Updates the model from the API; returns whether it changed."""
+        raise NotImplementedError()
+
+
+class RefreshQueue:
+    """Refreshes stale models from the API, from a background thread.
+
+    A model is queued at most once at a time, however often it is requested
+    while stale. Each refresh runs in its own application context, reloads
+    the model and commits on its own. Its requests yield to the users' ones.
+
+    :attr changed: Amount of refreshes which changed the model.
+    :attr unchanged: Amount of refreshes which only touched the model.
+    :attr failed: Amount of refreshes which raised.
+    """
+
+    def __init__(self):
+        self._queue: queue.Queue[Tuple[Flask, Type[Any], Any, WowApi]] = queue.Queue()
+        self._pending: Set[Tuple[Type[Any], Any]] = set()
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self.changed = 0
+        self.unchanged = 0
+        self.failed = 0
+
+    def schedule(self, model: Refreshable, handler: WowApi) -> bool:
+        """Queues the refresh of a model; returns whether it was queued.
+
+        Must be called from an application context, used for the refresh.
+        """
+        key = (type(model), inspect(model).identity[0])
+        with self._lock:
+            if key in self._pending:
+                return False
+            self._pending.add(key)
+            if self._thread is None:
+                self._thread = threading.Thread(
+                    target=self._run, name='Model refresh', daemon=True)
+                self._thread.start()
+        self._queue.put((current_app._get_current_object(), *key, handler))
+        return True
+
+    def join(self):
+        """Blocks until all the queued refreshes are done."""
+        self._queue.join()
+
+    def _run(self):
+        while True:
+            app, model_class, primary_key, handler = self._queue.get()
+            try:
+                self._refresh(app, model_class, primary_key, handler)
+            finally:
+                with self._lock:
+                    self._pending.discard((model_class, primary_key))
+                self._queue.task_done()
+
+    def _refresh(self, app: Flask, model_class: Type[Any], primary_key: Any,
+                 handler: WowApi):
+        with app.app_context(), request_priority(Priority.background):
+            try:
+                model = db.session.get(model_class, primary_key)
+                if model is None or not model.is_stale():
+                    return
+                if model.refresh_from_api(handler):
+                    self.changed += 1
+                else:
+                    self.unchanged += 1
+                db.session.commit()
+            except Exception:
+                self.failed += 1
+                db.session.rollback()
+                logging.exception('Failed to refresh %s %r',
+                                  model_class.__name__, primary_key)
+
+    def metrics(self) -> Dict[str, int]:
+        with self._lock:
+            pending = len(self._pending)
+        return {
+            'refresh_pending': pending,
+            'refresh_changed': self.changed,
+            'refresh_unchanged': self.unchanged,
+            'refresh_failed': self.failed,
+        }
+
+
+# Queue shared by the models of the application.
+refresh_queue = RefreshQueue()
+
+
+def get_fresh(model: Optional[Refreshable], handler: WowApi,
+              refresher: Optional[RefreshQueue] = None) -> Optional[Refreshable]:
+    """Returns a model as is, queuing its refresh if stored and stale."""
+    if model is not None and inspect(model).persistent and model.is_stale():
+        (refresher or refresh_queue).schedule(model, handler)
+    return model
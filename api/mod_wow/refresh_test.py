@@ -0,0 +1,98 @@
+from __future__ import annotations
+
+__LICENSE__ = """
+Copyright 2019 Google LLC
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+    https://www.apache.org/licenses/LICENSE-2.0
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+import threading
+import unittest.mock
+
+from datetime import datetime
+
+from api.common.testing import DatabaseTestFixture
+from api.mod_wow.realm import WowRealm
+from api.mod_wow.refresh import RefreshQueue, refresh_queue
+from api.mod_wow.region import Region
+
+
+REALM_DATA = {'id': 536, 'name': 'Argent Dawn', 'slug': 'argent-dawn',
+              'timezone': 'Europe/London'}
+
+
+class TestRefresh(DatabaseTestFixture, unittest.TestCase):
+    """Checks stale models are served while refreshed in the background."""
+
+    def store_realm(self, date_modified: datetime) -> WowRealm:
+        realm = WowRealm(id=536, region=Region.eu, name='Old Dawn',
+                         slug='argent-dawn', timezone_name='Europe/Paris',
+                         date_modified=date_modified)
+        self.db.session.add(realm)
+        self.db.session.commit()
+        return realm
+
+    def test_fresh(self):
+        """Ensure fresh models are served without reaching the API."""
+        self.store_realm(datetime.utcnow())
+        mock = unittest.mock.MagicMock()
+
+        realm = WowRealm.get_or_create(mock, Region.eu, 'argent-dawn')
+        refresh_queue.join()
+
+        self.assertEqual(realm.name, 'Old Dawn')
+        mock.get_realm.assert_not_called()
+
+    def test_stale(self):
+        """Ensure stale models are served, then refreshed in the background."""
+        self.store_realm(datetime(2020, 1, 1))
+        mock = unittest.mock.MagicMock()
+        mock.get_realm.return_value = REALM_DATA
+
+        realm = WowRealm.get_or_create(mock, Region.eu, 'argent-dawn')
+        self.assertEqual(realm.name, 'Old Dawn')
+        refresh_queue.join()
+
+        mock.get_realm.assert_called_once_with(
+            'eu', 'dynamic-eu', 'argent-dawn', locale='en_US')
+        self.db.session.expire_all()
+        realm = WowRealm.query.get(536)
+        self.assertEqual(realm.name, 'Argent Dawn')
+        self.assertEqual(realm.timezone_name, 'Europe/London')
+        self.assertFalse(realm.is_stale())
+
+    def test_queue(self):
+        """Ensure models are queued once at a time, and failures counted."""
+        realm = self.store_realm(datetime(2020, 1, 1))
+        release = threading.Event()
+
+        def get_realm(*args, **kwargs):
+            release.wait()
+            raise ValueError('API down')
+
+        mock = unittest.mock.MagicMock()
+        mock.get_realm.side_effect = get_realm
+        queue = RefreshQueue()
+
+        self.assertTrue(queue.schedule(realm, mock))
+        self.assertFalse(queue.schedule(realm, mock))
+        self.assertEqual(queue.metrics()['refresh_pending'], 1)
+        with self.assertLogs(level='ERROR'):
+            release.set()
+            queue.join()
+
+        self.assertEqual(queue.metrics(), {
+            'refresh_pending': 0, 'refresh_changed': 0,
+            'refresh_unchanged': 0, 'refresh_failed': 1})
+        mock.get_realm.assert_called_once()
+
+
+if __name__ == '__main__':
+    unittest.main()
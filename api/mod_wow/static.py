@@ -26,11 +26,12 @@ limitations under the License.
 
 from enum import Enum
 from wowapi import WowApi
-from typing import Optional
+from typing import Dict, Iterable, Optional
 
 from flask_sqlalchemy import BaseQuery
 
 from api.base import db, BaseSerializerMixin
+from api.common.concurrency import call_concurrently
 from api.mod_wow.region import DEFAULT_REGION
 
 
@@ -149,3 +150,21 @@ class WowPlayableClass(db.Model, BaseSerializerMixin):
         if klass is None:
             klass = cls.create_from_api(handler, class_id)
         return klass
+
+    @classmethod
+    def get_or_create_many(cls, handler: WowApi,
+                           class_ids: Iterable[int]) -> Dict[int, WowPlayableClass]:
+        """Gets many WowPlayableClass at once, by ID.
+
+        Stored classes are loaded with one query, the others are created from
+        the API concurrently.
+        """
+        ids = set(class_ids)
+        classes: Dict[int, WowPlayableClass] = {
+            klass.id: klass for klass in cls.query.filter(cls.id.in_(ids))}
+        fetched = call_concurrently(
+            lambda class_id: cls.create_from_api(handler, class_id),
+            ids - classes.keys())
+        for class_id, future in fetched.items():
+            classes[class_id] = future.result()
+        return classes
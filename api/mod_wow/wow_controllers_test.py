@@ -0,0 +1,71 @@
+from __future__ import annotations
+
+__LICENSE__ = """
+Copyright 2019 Google LLC
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+    https://www.apache.org/licenses/LICENSE-2.0
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+import unittest.mock
+
+from wowapi import WowApi
+
+from api.common.testing import ControllerTestFixture
+from api.mod_wow.cache import CachedWowApi
+from api.mod_wow.controllers import mod_wow
+from api.mod_wow.quota import QuotaManager
+
+
+class TestWowControllers(ControllerTestFixture, unittest.TestCase):
+
+    BLUEPRINTS = [mod_wow]
+
+    def setUp(self):
+        """Serve a handler of a known quota."""
+        super().setUp()
+        self.handler = CachedWowApi('id', 'secret', quota=QuotaManager(
+            per_second=100, per_hour=1000, clock=lambda: 0.))
+        patcher = unittest.mock.patch(
+            'api.mod_wow.controllers.get_wow_handler', return_value=self.handler)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_get_metrics(self):
+        """Ensure the remaining budget of the quota is exported."""
+        self.handler._quota.acquire()
+        self.handler._quota.defer(0.)
+
+        with self.client as client:
+            results = client.get('/api/wow/metrics')
+
+        self.assertEqual(results.status_code, 200)
+        lines = results.get_data(as_text=True).splitlines()
+        self.assertIn('web_wow_quota_hour_remaining 999.0', lines)
+        self.assertIn('web_wow_quota_rate_limited 1.0', lines)
+        self.assertIn('# TYPE web_wow_quota_throttled gauge', lines)
+
+    def test_get_cache_metrics(self):
+        """Ensure the cache hits and the refreshes are exported."""
+        with unittest.mock.patch.object(WowApi, 'get_resource',
+                                        return_value={'id': 536}):
+            for _ in range(3):
+                self.handler.get_realm('eu', 'dynamic-eu', 'argent-dawn')
+
+        with self.client as client:
+            results = client.get('/api/wow/metrics')
+
+        lines = results.get_data(as_text=True).splitlines()
+        self.assertIn('web_wow_cache_hits 2.0', lines)
+        self.assertIn('web_wow_cache_misses 1.0', lines)
+        self.assertIn('web_refresh_pending 0.0', lines)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+"""Benchmarks the synchronization of the Discord guilds on bot startup.
+
+Compares the synchronization of guilds one query at a time (as previously
+done by the bot on_ready handler) against the bulk reconciliation of
+Guild.bulk_resync_from_discord_guilds, on synthetic guilds.
+"""
+
+from __future__ import annotations
+
+__LICENSE__ = """
+Copyright 2019 Google LLC
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    https://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+import argparse
+import time
+
+from tabulate import tabulate
+from types import SimpleNamespace
+from typing import List
+
+from api.common.testing import DatabaseTestFixture
+from api.mod_guild.guild import Guild
+
+
+parser = argparse.ArgumentParser(
+    description='Guild synchronization benchmark')
+parser.add_argument(
+    '--guilds', dest='guilds', type=int, nargs='+', default=[1000, 10000],
+    help='number of synthetic guilds the bot is in')
+parser.add_argument(
+    '--churn', dest='churn', type=float, default=0.05,
+    help='ratio of guilds renamed, joined and left between two startups')
+
+
+def make_guilds(count: int, churn: float, restart: bool) -> List[SimpleNamespace]:
+    """Creates synthetic Discord guilds.
+
+    On restart, some guilds were renamed, some were left and some joined.
+    """
+    changed = int(count * churn) if restart else 0
+    first = changed
+    guilds = []
+    for index in range(first, count + changed):
+        name = 'Guild %d' % index
+        if restart and index < 2 * changed:
+            name += ' (renamed)'
+        guilds.append(SimpleNamespace(
+            id=10 ** 17 + index, name=name,
+            icon_url='https://cdn.discordapp.com/icons/%d/icon.webp' % index))
+    return guilds
+
+
+def resync_one_by_one(fixture: DatabaseTestFixture,
+                      guilds: List[SimpleNamespace]):
+    """Synchronizes the guilds one query at a time."""
+    for discord_guild in guilds:
+        guild = Guild.query.filter_by(id=discord_guild.id).one_or_none()
+        if guild is None:
+            guild = Guild(discord_guild.id)
+        guild.resync_from_discord_guild(discord_guild)
+        fixture.db.session.add(guild)
+    fixture.db.session.commit()
+
+
+def resync_bulk(fixture: DatabaseTestFixture, guilds: List[SimpleNamespace]):
+    """Synchronizes the guilds in bulk."""
+    Guild.bulk_resync_from_discord_guilds(guilds, mark_absent=True)
+    fixture.db.session.commit()
+
+
+def benchmark(count: int, churn: float):
+    """Runs both approaches on a fresh database and returns the timings."""
+    results = []
+    for name, resync in (('one by one', resync_one_by_one),
+                         ('bulk', resync_bulk)):
+        fixture = DatabaseTestFixture()
+        fixture.setUp()
+        try:
+            timings = []
+            for restart in (False, True, True):
+                guilds = make_guilds(count, churn, restart)
+                start = time.perf_counter()
+                resync(fixture, guilds)
+                timings.append(time.perf_counter() - start)
+                fixture.db.session.expunge_all()
+        finally:
+            fixture.tearDown()
+        results.append((name, count, *(t * 1000 for t in timings)))
+    return results
+
+
+def main():
+    """Runs the benchmark and displays the timings in a table."""
+    args = parser.parse_args()
+
+    rows = []
+    for count in args.guilds:
+        rows.extend(benchmark(count, args.churn))
+    print(tabulate(rows, headers=(
+        'approach', 'guilds', 'first start (ms)', 'restart (ms)',
+        'unchanged restart (ms)'), floatfmt='.2f'))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,119 @@
+#!/usr/bin/env python3
+"""Benchmarks the computation of event occurrences.
+
+Compares the chained generation of events (one record created per
+occurrence, as done by the /api/events/<id>:next route) against the
+computation of virtual occurrences over a time window.
+"""
+
+from __future__ import annotations
+
+__LICENSE__ = """
+Copyright 2019 Google LLC
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    https://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+import argparse
+import time
+
+from datetime import datetime, timedelta
+from pytz import timezone
+from tabulate import tabulate
+
+from api.common.testing import DatabaseTestFixture
+from api.mod_event.event import Event, EventRepetitionFrequency
+from api.mod_guild.guild import Guild
+
+
+parser = argparse.ArgumentParser(
+    description='Event occurrences benchmark')
+parser.add_argument(
+    '--weeks', dest='weeks', type=int, nargs='+', default=[4, 12, 52],
+    help='number of weekly occurrences to compute')
+parser.add_argument(
+    '--repeat', dest='repeat', type=int, default=3,
+    help='number of runs per measure')
+
+
+def make_weekly_event(fixture: DatabaseTestFixture) -> int:
+    """Creates a weekly event crossing a daylight saving time change."""
+    guild = Guild('12345')
+    event = Event(
+        guild, 'Mythic Raiding',
+        timezone('Europe/Paris').localize(datetime(2020, 9, 2, 21, 0)),
+        repetition=EventRepetitionFrequency.weekly)
+    fixture.db.session.add(guild)
+    fixture.db.session.add(event)
+    fixture.db.session.commit()
+    return event.id
+
+
+def run_chained(fixture: DatabaseTestFixture, event_id: int, weeks: int):
+    """Generates the occurrences one record at a time."""
+    for _ in range(weeks):
+        child = Event.query.filter_by(parent_id=event_id).one_or_none()
+        if child is None:
+            event = Event.query.filter_by(id=event_id).one()
+            child = event.create_next_event()
+            fixture.db.session.add(child)
+            fixture.db.session.commit()
+        event_id = child.id
+
+
+def run_virtual(event_id: int, weeks: int):
+    """Computes the occurrences in a single pass."""
+    event = Event.query.filter_by(id=event_id).one()
+    start = event.date
+    event.occurrences_between(start, start + timedelta(weeks=weeks + 1))
+
+
+def benchmark(weeks: int, repeat: int):
+    """Runs both approaches on a fresh database and returns the timings."""
+    results = []
+    for name in ('chained', 'virtual'):
+        timings = []
+        for _ in range(repeat):
+            fixture = DatabaseTestFixture()
+            fixture.setUp()
+            try:
+                event_id = make_weekly_event(fixture)
+                start = time.perf_counter()
+                if name == 'chained':
+                    run_chained(fixture, event_id, weeks)
+                else:
+                    run_virtual(event_id, weeks)
+                timings.append(time.perf_counter() - start)
+                rows = Event.query.count()
+            finally:
+                fixture.tearDown()
+        results.append((name, weeks, rows,
+                        min(timings) * 1000,
+                        sum(timings) / len(timings) * 1000))
+    return results
+
+
+def main():
+    """Runs the benchmark and displays the timings in a table."""
+    args = parser.parse_args()
+
+    rows = []
+    for weeks in args.weeks:
+        rows.extend(benchmark(weeks, args.repeat))
+    print(tabulate(rows, headers=(
+        'approach', 'occurrences', 'event rows', 'best (ms)', 'mean (ms)'),
+        floatfmt='.2f'))
+
+
+if __name__ == "__main__":
+    main()
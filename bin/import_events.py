@@ -0,0 +1,85 @@
+"""Bulk loads the events of a guild from a CSV file.
+
+The CSV file must have a header row naming its columns, matching the fields
+accepted by the /api/guilds/<guild_id>/events/batch route: title,
+description, date (formatted as YYYY-MM-DD HH:MM:SS), repetition,
+timezone_name and optionally the id of an existing event to update.
+"""
+
+from __future__ import annotations
+
+__LICENSE__ = """
+Copyright 2019 Google LLC
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+    https://www.apache.org/licenses/LICENSE-2.0
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+import argparse
+import csv
+import logging
+import sys
+
+from tabulate import tabulate
+from typing import Any, Dict, List
+
+from api.app import app, db
+from api.mod_event.event import Event
+from api.mod_event.signals import events_changed
+from api.mod_guild.guild import Guild
+from api.mod_guild.forms import validate_event_batch
+
+
+parser = argparse.ArgumentParser(
+    description='Guild events bulk loader')
+parser.add_argument(
+    'guild_id', help='Discord ID of the guild owning the events')
+parser.add_argument(
+    'csv_file', type=argparse.FileType('r'),
+    help='CSV file describing the events')
+parser.add_argument(
+    '--skip_invalid', dest='skip_invalid', action='store_true',
+    help='if present, loads the valid events even if some rows are invalid')
+
+
+def read_rows(csv_file) -> List[Dict[str, Any]]:
+    """Reads the events described in the CSV file, ignoring empty cells."""
+    return [{key: value for key, value in row.items() if value}
+            for row in csv.DictReader(csv_file)]
+
+
+def main():
+    """Validates all the events of the file and writes them at once."""
+    args = parser.parse_args()
+    rows = read_rows(args.csv_file)
+
+    with app.app_context():
+        guild = Guild.query.filter_by(id=args.guild_id).one_or_none()
+        if guild is None:
+            logging.error('Guild %s does not exist.', args.guild_id)
+            sys.exit(1)
+
+        values, errors = validate_event_batch(guild, rows)
+        if errors:
+            # Rows are numbered as in the file, after the header.
+            print(tabulate([(index + 2, error) for index, error in errors.items()],
+                           headers=('line', 'errors')))
+            if not args.skip_invalid:
+                logging.error('%d invalid rows, nothing was loaded.', len(errors))
+                sys.exit(1)
+
+        created, updated = Event.bulk_write(values)
+        db.session.commit()
+        # Lets the bot reload the reminders of the guild.
+        events_changed.send(guild.id)
+    logging.info('Created %d events, updated %d events.', created, updated)
+
+
+if __name__ == "__main__":
+    main()
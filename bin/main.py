@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+"""Flask web runtime script, also running the bot in separate processes."""
+
+from __future__ import annotations
+
+__LICENSE__ = """
+Copyright 2019 Google LLC
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    https://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+import argparse
+import logging
+import os
+import threading
+
+from bot.supervisor import ShardSupervisor
+from config.discord import bot_token
+from config.flask import port, debug, database_file
+from api.app import app, db
+from api.build import build_angular
+
+parser = argparse.ArgumentParser(
+  description='Flask application serving the event manager UI.')
+parser.add_argument(
+    '-p', '--port', dest='port', type=int, default=port,
+    help='web application serving port')
+parser.add_argument(
+    '--no_build', dest='no_build', action='store_true',
+    help='do not build the Angular application')
+parser.add_argument(
+    '--recreate_database', dest='recreate_database', action='store_true',
+    help='if present, removes the previous database file')
+parser.add_argument(
+    '--no_bot', dest='no_bot', action='store_true',
+    help='do not run the bot, e.g. when running it through bin/run_shards.py')
+parser.add_argument(
+    '--shards', dest='shards', type=int, default=1,
+    help='number of bot shards, each running in its own process')
+
+
+logging.root.setLevel(logging.INFO)
+
+
+def main():
+    """Runs the bot with its frontend server."""
+    args = parser.parse_args()
+    if not args.no_build:
+        logging.info('Building Angular...')
+        build_angular(debug)
+
+    if os.path.exists(database_file) and args.recreate_database:
+        logging.info('Clearing previous database')
+        os.remove(database_file)
+    if not os.path.exists(database_file):
+        logging.info('Creating database')
+        with app.app_context():
+            db.create_all()
+
+    # Start the bot in its own processes; the web application sends it work
+    # through the outbox (see api.mod_outbox).
+    supervisor = None
+    if not args.no_bot:
+        supervisor = ShardSupervisor(bot_token, args.shards)
+        logging.info('Starting the bot')
+        threading.Thread(target=supervisor.run, name='Bot supervisor',
+                         daemon=True).start()
+
+    host = debug and '127.0.0.1' or '0.0.0.0'
+    try:
+        app.run(host=host, port=args.port, debug=debug,
+                use_reloader=False)
+    finally:
+        if supervisor is not None:
+            supervisor.stop()
+
+
+if __name__ == "__main__":
+    main()
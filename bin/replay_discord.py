@@ -0,0 +1,68 @@
+#!/usr/bin/env python3
+"""Benchmarks the bot against a local fake Discord.
+
+Replays the messages and guild joins of a scenario (see bot/scenarios) at
+its rates, and reports the throughput and latency of the bot handlers.
+Nothing reaches Discord, and the events are stored in a temporary database.
+"""
+
+from __future__ import annotations
+
+__LICENSE__ = """
+Copyright 2019 Google LLC
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    https://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+import argparse
+import logging
+
+from tabulate import tabulate
+
+from bot.replay import REPORT_HEADERS, Scenario, run_scenario
+
+
+parser = argparse.ArgumentParser(
+    description='Bot throughput benchmark against a fake Discord')
+parser.add_argument(
+    '--scenario', dest='scenario', default='bot/scenarios/smoke.json',
+    help='JSON file of the scenario to replay')
+parser.add_argument(
+    '--rate_scale', dest='rate_scale', type=float, default=1.,
+    help='multiplies the message and guild join rates of the scenario')
+parser.add_argument(
+    '--duration', dest='duration', type=float, default=None,
+    help='overrides the duration of the scenario, in seconds')
+
+
+def main():
+    """Replays the scenario and displays the measures in a table."""
+    logging.basicConfig(level=logging.WARNING)
+    args = parser.parse_args()
+
+    scenario = Scenario.load(args.scenario).scaled(args.rate_scale)
+    if args.duration is not None:
+        scenario = scenario._replace(duration_seconds=args.duration)
+    report = run_scenario(scenario)
+
+    print(scenario.name)
+    print('%d guilds, %d messages sent in %.2fs (%.0f/s asked), '
+          '%d REST requests, %d rate limited' % (
+              scenario.guilds, report.sent, report.send_seconds,
+              scenario.messages_per_second, report.requests,
+              report.rate_limited))
+    print(tabulate(report.rows(), headers=REPORT_HEADERS, floatfmt='.2f'))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,70 @@
+#!/usr/bin/env python3
+"""Discord bot runtime script, running the bot shards in their own process.
+
+The web application is served separately, through bin/main.py --no_bot.
+"""
+
+from __future__ import annotations
+
+__LICENSE__ = """
+Copyright 2019 Google LLC
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    https://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+import argparse
+import logging
+import os
+import signal
+
+from bot.supervisor import ShardSupervisor
+from config.discord import bot_token
+from config.flask import database_file
+from api.app import app, db
+
+parser = argparse.ArgumentParser(
+    description='Discord bot shards supervisor.')
+parser.add_argument(
+    '-n', '--shards', dest='shards', type=int, default=os.cpu_count() or 1,
+    help='number of shards, each running in its own process')
+
+
+logging.root.setLevel(logging.INFO)
+
+
+def main():
+    """Runs and supervises the bot shards."""
+    args = parser.parse_args()
+    if args.shards < 1:
+        parser.error('at least one shard is needed')
+
+    if not os.path.exists(database_file):
+        logging.info('Creating database')
+        with app.app_context():
+            db.create_all()
+
+    supervisor = ShardSupervisor(bot_token, args.shards)
+
+    def on_terminate(signum, frame):
+        """Stops the shards cleanly on termination."""
+        raise KeyboardInterrupt()
+
+    signal.signal(signal.SIGTERM, on_terminate)
+    try:
+        supervisor.run()
+    except KeyboardInterrupt:
+        logging.info('Stopping the shards')
+
+
+if __name__ == "__main__":
+    main()
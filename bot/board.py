@@ -0,0 +1,131 @@
+"""Keeps a message listing the upcoming events of each guild up to date."""
+
+from __future__ import annotations
+
+__LICENSE__ = """
+Copyright 2019 Google LLC
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    https://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+import asyncio
+import logging
+
+from typing import Awaitable, Callable, Dict, List, Optional
+
+from bot.messaging import BLOCK_SEPARATOR, MAX_MESSAGE_LENGTH
+
+
+# Delay without changes before the board of a guild is edited.
+BOARD_DEBOUNCE_SECONDS = 5.
+
+# Longest delay between a change and the edit of the board, even if the
+# events keep changing.
+BOARD_MAX_DELAY_SECONDS = 30.
+
+BOARD_TITLE = '**Upcoming events this week**'
+BOARD_MORE = '*... and %d more*'
+
+
+def render_board(events: List[str]) -> str:
+    """Formats the board message, fitting the events in a single message."""
+    if not events:
+        return BOARD_TITLE + BLOCK_SEPARATOR + 'No events this week!'
+    blocks = [BOARD_TITLE]
+    length = len(BOARD_TITLE)
+    for index, event in enumerate(events):
+        left_out = len(events) - index - 1
+        length += len(BLOCK_SEPARATOR) + len(event)
+        # Unless this is the last event, keep room to say how many are left.
+        reserved = len(BLOCK_SEPARATOR + BOARD_MORE % left_out) if left_out else 0
+        if length + reserved > MAX_MESSAGE_LENGTH:
+            blocks.append(BOARD_MORE % (left_out + 1))
+            break
+        blocks.append(event)
+    return BLOCK_SEPARATOR.join(blocks)
+
+
+class BoardUpdater:
+    """Debounces the edits of the boards of the guilds.
+
+    Each change of a guild postpones the edit of its board by debounce
+    seconds, up to max_delay after the first change: a burst of changes
+    results in a single edit. Edits of a guild never run concurrently; a
+    change made while editing triggers another edit.
+
+    :attr changes: Amount of changes notified.
+    :attr edits: Amount of boards edited.
+    """
+
+    def __init__(self, update: Callable[[str], Awaitable[None]],
+                 loop: Optional[asyncio.AbstractEventLoop] = None,
+                 debounce: float = BOARD_DEBOUNCE_SECONDS,
+                 max_delay: float = BOARD_MAX_DELAY_SECONDS):
+        self._update = update
+        self._loop = loop or asyncio.get_event_loop()
+        self._debounce = debounce
+        self._max_delay = max_delay
+        self._timers: Dict[str, asyncio.TimerHandle] = {}
+        self._first_change: Dict[str, float] = {}
+        self._running: Dict[str, asyncio.Task] = {}
+        self.changes = 0
+        self.edits = 0
+
+    def schedule(self, guild_id: str):
+        """Notifies the events of a guild changed."""
+        self.changes += 1
+        now = self._loop.time()
+        first = self._first_change.setdefault(guild_id, now)
+        deadline = min(now + self._debounce, first + self._max_delay)
+        timer = self._timers.pop(guild_id, None)
+        if timer is not None:
+            timer.cancel()
+        self._timers[guild_id] = self._loop.call_at(deadline, self._fire, guild_id)
+
+    def _fire(self, guild_id: str):
+        """Starts the edit of a board, once the previous one is done."""
+        del self._timers[guild_id]
+        running = self._running.get(guild_id)
+        if running is not None and not running.done():
+            self._timers[guild_id] = self._loop.call_later(
+                self._debounce, self._fire, guild_id)
+            return
+        del self._first_change[guild_id]
+        self._running[guild_id] = self._loop.create_task(self._edit(guild_id))
+
+    async def _edit(self, guild_id: str):
+        """Runs the edit of a board, logging its failures."""
+        try:
+            await self._update(guild_id)
+            self.edits += 1
+        except Exception:
+            logging.exception('Failed to update the board of guild %s', guild_id)
+        finally:
+            del self._running[guild_id]
+
+    def stop(self):
+        """Cancels the pending edits."""
+        for timer in self._timers.values():
+            timer.cancel()
+        for task in self._running.values():
+            task.cancel()
+        self._timers.clear()
+        self._first_change.clear()
+
+    def metrics(self) -> Dict[str, float]:
+        """Returns the state of the updater, suitable for exporting."""
+        return {
+            'board_changes': self.changes,
+            'board_edits': self.edits,
+            'board_pending': len(self._timers),
+        }
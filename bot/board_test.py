@@ -0,0 +1,84 @@
+from __future__ import annotations
+
+__LICENSE__ = """
+Copyright 2019 Google LLC
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+    https://www.apache.org/licenses/LICENSE-2.0
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+import asyncio
+import unittest
+
+from bot.board import BOARD_TITLE, BoardUpdater, render_board
+from bot.messaging import MAX_MESSAGE_LENGTH
+
+
+class TestRenderBoard(unittest.TestCase):
+
+    def test_render(self):
+        """Ensure the board lists the events under its title."""
+        self.assertEqual(render_board(['a', 'b']), BOARD_TITLE + '\n\na\n\nb')
+        self.assertIn('No events', render_board([]))
+
+    def test_render_too_many(self):
+        """Ensure the board fits in a message, counting the events left out."""
+        events = ['event %03d: %s' % (i, 'x' * 90) for i in range(100)]
+        content = render_board(events)
+
+        self.assertLessEqual(len(content), MAX_MESSAGE_LENGTH)
+        shown = content.count('event ')
+        self.assertTrue(content.endswith('*... and %d more*' % (100 - shown)))
+
+
+class TestBoardUpdater(unittest.TestCase):
+
+    def setUp(self):
+        self.loop = asyncio.new_event_loop()
+        self.edits = []
+
+        async def update(guild_id):
+            self.edits.append(guild_id)
+            await asyncio.sleep(0.02)
+
+        self.updater = BoardUpdater(update, loop=self.loop, debounce=0.05,
+                                    max_delay=0.1)
+
+    def tearDown(self):
+        self.updater.stop()
+        # Let the cancelled edits finish.
+        self.loop.run_until_complete(asyncio.sleep(0))
+        self.loop.close()
+
+    def test_debounce(self):
+        """Ensure a burst of changes results in a single edit per guild."""
+        for _ in range(10):
+            self.updater.schedule('1')
+        self.updater.schedule('2')
+        self.loop.run_until_complete(asyncio.sleep(0.15))
+
+        self.assertEqual(sorted(self.edits), ['1', '2'])
+        self.assertEqual(self.updater.metrics()['board_changes'], 11)
+        self.assertEqual(self.updater.metrics()['board_edits'], 2)
+
+    def test_max_delay(self):
+        """Ensure continuous changes still edit the board regularly."""
+        async def changes():
+            for _ in range(20):
+                self.updater.schedule('1')
+                await asyncio.sleep(0.01)
+
+        self.loop.run_until_complete(changes())
+        self.assertGreaterEqual(len(self.edits), 1)
+        self.loop.run_until_complete(asyncio.sleep(0.15))
+        self.assertIn(len(self.edits), (2, 3))
+        self.assertEqual(self.updater.metrics()['board_pending'], 0)
+
+if __name__ == '__main__':
+    unittest.main()
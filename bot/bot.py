@@ -16,16 +16,37 @@ See the License for the specific language governing permissions and
 limitations under the License.
 """
 
+import asyncio
 import discord
 import logging
+import os
 
-from typing import Dict, Optional, List
+from datetime import datetime
+from pytz import timezone, utc
+from typing import Any, Dict, Optional, List
 
 from api.base import app, db
+from api.common.sharding import Shard
 from api.mod_guild.guild import Guild
-from bot.handlers.base import CommandHandler
-from bot.handlers.events import CommandWeekly, CommandSetTimezone
-from bot.handlers.help import CommandHelp
+from bot.board import BoardUpdater, render_board
+from bot.executor import DatabaseExecutor
+from bot.interactions import (INTERACTION_APPLICATION_COMMAND,
+                              InteractionMessage, register_commands)
+from bot.messaging import MessageSender
+from bot.metrics import (HandlerMetrics, METRICS_WRITE_SECONDS, PHASE_DISCORD,
+                         collect_gauges, timed)
+from bot.outbox import OutboxConsumer, OutboxHandlers
+from bot.reminders import Reminder, ReminderScheduler
+from bot.settings import GuildSettingsCache
+from bot.handlers.admin import CommandStats
+from bot.handlers.base import CommandHandler, OptionError
+from bot.handlers.events import CommandBoard, CommandWeekly
+from bot.handlers.help import CommandHelp, format_help
+from bot.handlers.settings import CommandSetPrefix, CommandSetTimezone
+
+
+# Delay before checking the guilds again when the bot is in none.
+WEEKLY_DIGEST_IDLE_SECONDS = 60.
 
 
 class WowrganizerBot(discord.Client):
@@ -34,13 +55,53 @@ class WowrganizerBot(discord.Client):
     This class defines the main interface between Discord and the bot
     itself, listening for server-level events and clients-level ones.
 
-    :attr _handlers: The commands the bot supports, keyed by their trigger.
+    :attr handlers: The commands the bot supports, keyed by their trigger.
+    :attr help_blocks: The help of each command, built once.
+    :attr messages: Sends the messages of the bot within the rate limits.
+    :attr reminders: Fires the reminders of the upcoming events.
+    :attr database: Runs the blocking database calls off the event loop.
+    :attr outbox: Handles the work sent by the web application.
+    :attr settings: The settings of the guilds, read for each message.
+    :attr board: Edits the messages listing the events of the guilds.
+    :attr metrics: Latency and errors of the command handlers.
+    :attr metrics_path: File where the metrics are written, if any.
+    :attr owner_id: The owner of the bot application, allowed to run the
+        admin commands; known once connected.
+    :attr application_id: The Discord application of the bot, known once
+        connected.
     """
 
     handlers: Dict[str, CommandHandler]
+    help_blocks: List[str]
+    messages: MessageSender
+    reminders: ReminderScheduler
+    database: DatabaseExecutor
+    outbox: OutboxConsumer
+    settings: GuildSettingsCache
+    board: BoardUpdater
+    metrics: HandlerMetrics
+    metrics_path: Optional[str]
+    owner_id: Optional[int] = None
+    application_id: Optional[str] = None
+    _digest_warmer: Optional[asyncio.Task] = None
+    _metrics_writer: Optional[asyncio.Task] = None
+    _commands_registered = False
 
-    def __init__(self, *args, **kwargs):
+    def __init__(self, *args, metrics_dir: Optional[str] = None, **kwargs):
         super().__init__(*args, **kwargs)
+        self.metrics = HandlerMetrics()
+        self.metrics_path = metrics_dir and os.path.join(
+            metrics_dir, 'bot-shard-%d.prom' % (self.shard_id or 0))
+        self.database = DatabaseExecutor()
+        self.messages = MessageSender()
+        self.settings = GuildSettingsCache()
+        self.reminders = ReminderScheduler(
+            self.send_reminder, self.database, loop=self.loop, shard=self.shard)
+        self.board = BoardUpdater(self.update_board, loop=self.loop)
+        self.outbox = OutboxConsumer(
+            OutboxHandlers(self.send_announcement, self.send_reminder,
+                           self.on_events_changed),
+            self.database, shard=self.shard)
 
         all_handlers = self._setup_handlers()
         self.handlers = {}
@@ -53,60 +114,258 @@ class WowrganizerBot(discord.Client):
                     'Duplicated command %s: culprit handlers are %r and %r' % (
                         handler.COMMAND, handler,
                         self.handlers[handler.COMMAND]))
+            handler.compile()
+            handler.messages = self.messages
             self.handlers[handler.COMMAND] = handler
+        self.help_blocks = format_help(h.compiled for h in all_handlers)
+
+    @property
+    def shard(self) -> Optional[Shard]:
+        """The shard run by this bot, if sharded."""
+        if self.shard_count is None:
+            return None
+        return Shard(self.shard_id, self.shard_count)
 
     def _setup_handlers(self) -> List[CommandHandler]:
         """Called at initialization, sets up the command handlers."""
+        weekly = CommandWeekly(self.database, self.settings)
         return [
-            CommandWeekly(),
-            CommandSetTimezone(),
+            weekly,
+            CommandBoard(weekly),
+            CommandSetTimezone(self.database, self.settings),
+            CommandSetPrefix(self.database, self.settings),
             CommandHelp(self),
+            CommandStats(self),
         ]
 
-    async def on_ready(self):
-        """Notify we are ready to handle requests."""
+    def _resync_guilds(self, discord_guilds: List[discord.Guild],
+                       mark_absent: bool = False):
+        """Registers the guilds as available in the DB.
+
+        If mark_absent is set, the other guilds of the shard are marked as
+        unavailable.
+        """
         with app.app_context():
-            for discord_guild in self.guilds:
-                guild = Guild.query.filter_by(id=discord_guild.id).one_or_none()
-                if guild is None:
-                    guild = Guild(discord_guild.id)
-                guild.resync_from_discord_guild(discord_guild)
-                db.session.add(guild)
+            counts = Guild.bulk_resync_from_discord_guilds(
+                discord_guilds, mark_absent=mark_absent, shard=self.shard)
             db.session.commit()
+        logging.info('Resynced guilds: %(created)d created, %(updated)d '
+                     'updated, %(absent)d absent', counts)
 
-    async def on_guild_join(self, discord_guild: discord.Guild):
-        """Registers the guild as available in the DB."""
-        logging.info('Joined guild %s', discord_guild.name)
+    @staticmethod
+    def _remove_guild(guild_id: int):
+        """Un-registers the guild as available in the DB."""
         with app.app_context():
-            guild = Guild.query.filter_by(id=discord_guild.id).one_or_none()
+            guild = Guild.query.filter_by(id=guild_id).one_or_none()
             if guild is None:
-                guild = Guild(discord_guild.id)
-            guild.resync_from_discord_guild(discord_guild)
-            db.session.add(guild)
+                return
+            db.session.delete(guild)
             db.session.commit()
 
+    async def on_ready(self):
+        """Notify we are ready to handle requests."""
+        await self.database.run(
+            self._resync_guilds, list(self.guilds), mark_absent=True)
+        await self.database.run(self.settings.load, self.shard)
+        self.reminders.start()
+        self.outbox.start(self.loop)
+        if self._digest_warmer is None or self._digest_warmer.done():
+            self._digest_warmer = self.loop.create_task(
+                self.warm_weekly_digests(), name='Weekly digests warmer')
+        if self.metrics_path and (self._metrics_writer is None
+                                  or self._metrics_writer.done()):
+            self._metrics_writer = self.loop.create_task(
+                self.write_metrics(), name='Metrics writer')
+        if self.owner_id is None:
+            self.owner_id = (await self.application_info()).owner.id
+        # Slash commands are global: a single shard registers them.
+        if not self._commands_registered and not self.shard_id:
+            await register_commands(
+                self.http, self.application_id,
+                (h.compiled for h in self.handlers.values()))
+            self._commands_registered = True
+
+    async def close(self):
+        """Stops the background tasks along with the connection."""
+        self.reminders.stop()
+        self.outbox.stop()
+        self.board.stop()
+        if self._digest_warmer is not None:
+            self._digest_warmer.cancel()
+        if self._metrics_writer is not None:
+            self._metrics_writer.cancel()
+        await super().close()
+        self.database.shutdown()
+
+    async def warm_weekly_digests(self):
+        """Computes the weekly digests of all guilds at the start of each week.
+
+        Guilds are warmed by groups sharing the same timezone, hence the same
+        week boundaries.
+        """
+        weekly = self.handlers[CommandWeekly.COMMAND]
+        while True:
+            groups = self.settings.guilds_by_timezone(
+                str(g.id) for g in self.guilds)
+            next_week = None
+            for timezone_name, guild_ids in groups.items():
+                tz = timezone(timezone_name)
+                year, week, _ = datetime.now(tz).isocalendar()
+                try:
+                    await self.database.run(weekly.warm, guild_ids, year, week, tz,
+                                            self.shard)
+                except Exception:
+                    logging.exception('Failed to warm the weekly digests')
+                # The boards list the events of the week which just started.
+                boards = set(self.settings.guilds_with_board())
+                for guild_id in boards.intersection(guild_ids):
+                    self.board.schedule(guild_id)
+                _, end = CommandWeekly.week_time_range(year, week, tz)
+                next_week = min(next_week or end, end)
+            delay = (next_week - datetime.now(utc)).total_seconds() \
+                if next_week else WEEKLY_DIGEST_IDLE_SECONDS
+            await asyncio.sleep(max(delay, 0))
+
+    def collect_gauges(self) -> Dict[str, float]:
+        """Returns the metrics of the bot components."""
+        weekly_cache = self.handlers[CommandWeekly.COMMAND].cache
+        return collect_gauges([
+            self.database.metrics, self.messages.metrics, self.board.metrics,
+            self.reminders.metrics,
+            lambda: {'weekly_digest_hits': weekly_cache.hits,
+                     'weekly_digest_misses': weekly_cache.misses},
+        ])
+
+    async def write_metrics(self):
+        """Writes the metrics file of the shard regularly."""
+        labels = {'shard': str(self.shard_id or 0)}
+        while True:
+            try:
+                self.metrics.write(self.metrics_path, self.collect_gauges(),
+                                   labels)
+            except OSError:
+                logging.exception('Failed to write the metrics')
+            await asyncio.sleep(METRICS_WRITE_SECONDS)
+
+    async def send_reminder(self, reminder: Reminder):
+        """Reminds a guild of an event about to start."""
+        discord_guild = self.get_guild(int(reminder.guild_id))
+        if discord_guild is None or discord_guild.system_channel is None:
+            logging.info('No channel to remind guild %s of event %d',
+                         reminder.guild_id, reminder.event_id)
+            return
+        await self.messages.send(
+            discord_guild.system_channel, 'Reminder: **%s** starts at %s' % (
+                reminder.title, reminder.date.strftime('%H:%M (%Z)')))
+
+    async def send_announcement(self, guild_id: str, content: str,
+                                channel_id: Optional[str] = None):
+        """Posts a message in a guild channel, its system one by default."""
+        discord_guild = self.get_guild(int(guild_id))
+        if discord_guild is None:
+            raise ValueError('Guild %s is not available' % guild_id)
+        channel = discord_guild.system_channel
+        if channel_id is not None:
+            channel = discord_guild.get_channel(int(channel_id))
+        if channel is None:
+            raise ValueError('No channel to post in guild %s' % guild_id)
+        await self.messages.send(channel, content)
+
+    def on_events_changed(self, guild_id: str):
+        """Drops what was computed from the events of a guild."""
+        self.reminders.notify_changed(guild_id)
+        self.handlers[CommandWeekly.COMMAND].cache.invalidate_guild(guild_id)
+        if self.settings.get(guild_id).board_message_id is not None:
+            self.board.schedule(guild_id)
+
+    async def update_board(self, guild_id: str):
+        """Edits the message listing the events of a guild."""
+        settings = self.settings.get(guild_id)
+        discord_guild = self.get_guild(int(guild_id))
+        if settings.board_message_id is None or discord_guild is None:
+            return
+        channel = discord_guild.get_channel(int(settings.board_channel_id))
+        weekly = self.handlers[CommandWeekly.COMMAND]
+        content = render_board(await weekly.current_digest(guild_id))
+        if channel is not None:
+            try:
+                await channel.get_partial_message(
+                    int(settings.board_message_id)).edit(content=content)
+                return
+            except discord.NotFound:
+                pass
+        logging.info('Board of guild %s was deleted', guild_id)
+        await self.database.run(self.settings.set_board, guild_id, None, None)
+
+    async def on_guild_join(self, discord_guild: discord.Guild):
+        """Registers the guild as available in the DB."""
+        logging.info('Joined guild %s', discord_guild.name)
+        await self.database.run(self._resync_guilds, [discord_guild])
+
     async def on_guild_remove(self, discord_guild: discord.Guild):
         """Un-register the guild as available in the DB."""
         logging.info('Removed from guild %s', discord_guild.name)
-        with app.app_context():
-            guild = Guild.query.filter_by(id=discord_guild.id).one_or_none()
-            if guild is None:
-                return
-            db.session.delete(guild)
-            db.session.commit()
+        await self.database.run(self._remove_guild, discord_guild.id)
 
     async def on_message(self, message: discord.Message):
         """Checks if a command was sent in the message for this bot."""
         if message.author == self.user:
             return
-        if not message.content.startswith('!'):
+        prefix = self.settings.get(message.guild and message.guild.id).prefix
+        if not message.content.startswith(prefix):
+            return
+
+        # Messages starting with the prefix are not all meant for the bot, so
+        # unknown commands are ignored.
+        command_name = message.content.partition(' ')[0][len(prefix):]
+        handler = self.handlers.get(command_name)
+        if handler is None:
+            self.metrics.count_unknown()
+            return
+        try:
+            args = handler.compiled.parse_message(message)
+        except OptionError as e:
+            self.metrics.count_invalid(handler.COMMAND)
+            await self.messages.send(message.channel, 'Failed: %s' % e)
             return
+        guild_id = message.guild and message.guild.id
+        async with self.metrics.measure(handler.COMMAND, guild_id):
+            await handler.handle(message, args)
+
+    async def on_socket_response(self, payload: Dict[str, Any]):
+        """Handles the gateway events discord.py does not support."""
+        event = payload.get('t')
+        if event == 'READY':
+            self.application_id = payload['d']['application']['id']
+        elif event == 'INTERACTION_CREATE':
+            await self.on_interaction(payload['d'])
 
-        command_name = message.content.partition(' ')[0][1:]
-        if command_name in self.handlers:
-            await self.handlers[command_name].handle(message)
-        else:
-            await message.channel.send('Unknown command.')
+    async def on_interaction(self, payload: Dict[str, Any]):
+        """Runs the handler of a slash command."""
+        if payload['type'] != INTERACTION_APPLICATION_COMMAND:
+            return
+        message = InteractionMessage(
+            payload, self.http, self.application_id, self.get_guild)
+        handler = self.handlers.get(message.command)
+        if handler is None:
+            # Registered by an older version of the bot.
+            self.metrics.count_unknown()
+            await self.messages.send(message.channel, 'Unknown command.')
+            return
+        try:
+            args = handler.compiled.parse_options(
+                message.options, message.guild is not None)
+        except OptionError as e:
+            self.metrics.count_invalid(handler.COMMAND)
+            await self.messages.send(message.channel, 'Failed: %s' % e)
+            return
+        guild_id = message.guild and message.guild.id
+        async with self.metrics.measure(handler.COMMAND, guild_id):
+            # Interactions must be acknowledged within 3 seconds, which
+            # commands waiting on the database may not meet.
+            with timed(PHASE_DISCORD):
+                await message.channel.defer()
+            await handler.handle(message, args)
 
 
 # Runtime instance management.
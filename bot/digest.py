@@ -0,0 +1,101 @@
+"""Caches the weekly digests of the guilds events."""
+
+from __future__ import annotations
+
+__LICENSE__ = """
+Copyright 2019 Google LLC
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    https://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+import threading
+import time
+
+from datetime import timedelta
+from typing import Callable, Dict, List, Optional, Tuple
+
+from api.mod_event.signals import events_changed
+
+
+# Maximum age of a digest. Writes made outside of this process (e.g. from
+# scripts) do not invalidate the cache, so digests are refreshed at least
+# this often.
+DIGEST_TTL = timedelta(hours=1)
+
+# (guild ID, ISO year, ISO week, timezone name)
+DigestKey = Tuple[Optional[str], int, int, str]
+
+
+class WeeklyDigestCache:
+    """Caches the formatted events of a guild week.
+
+    Digests of a guild are invalidated whenever its events are written (see
+    api.mod_event.signals), which may happen from another thread than the
+    one reading the cache.
+
+    A digest computed while the guild events were written is not cached, as
+    it may not contain the change: callers take the generation of the guild
+    before computing the digest and provide it back to put().
+
+    :attr hits: Amount of digests served from the cache.
+    :attr misses: Amount of digests missing from the cache.
+    """
+
+    hits: int
+    misses: int
+
+    def __init__(self, ttl: timedelta = DIGEST_TTL,
+                 clock: Callable[[], float] = time.monotonic):
+        self._ttl = ttl.total_seconds()
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._entries: Dict[DigestKey, Tuple[float, List[str]]] = {}
+        self._generations: Dict[Optional[str], int] = {}
+        self.hits = 0
+        self.misses = 0
+        events_changed.connect(self.invalidate_guild)
+
+    def generation(self, guild_id: Optional[str]) -> int:
+        """Returns the amount of invalidations of a guild digests."""
+        with self._lock:
+            return self._generations.get(guild_id, 0)
+
+    def get(self, key: DigestKey) -> Optional[List[str]]:
+        """Returns the cached digest, or None if missing or expired."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or self._clock() - entry[0] > self._ttl:
+                self.misses += 1
+                return None
+            self.hits += 1
+            return entry[1]
+
+    def put(self, key: DigestKey, digest: List[str], generation: int):
+        """Caches a digest, unless its guild was invalidated meanwhile."""
+        with self._lock:
+            if self._generations.get(key[0], 0) == generation:
+                self._entries[key] = (self._clock(), digest)
+
+    def invalidate_guild(self, guild_id: Optional[str]):
+        """Drops all the digests of a guild."""
+        guild_id = guild_id and str(guild_id)
+        with self._lock:
+            self._generations[guild_id] = self._generations.get(guild_id, 0) + 1
+            for key in [k for k in self._entries if k[0] == guild_id]:
+                del self._entries[key]
+
+    def prune(self, year: int, week: int):
+        """Drops the digests of the weeks before the provided one."""
+        with self._lock:
+            for key in [k for k in self._entries if k[1:3] < (year, week)]:
+                del self._entries[key]
@@ -0,0 +1,133 @@
+from __future__ import annotations
+
+__LICENSE__ = """
+Copyright 2019 Google LLC
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+    https://www.apache.org/licenses/LICENSE-2.0
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+import unittest.mock
+
+from datetime import datetime, timedelta
+from pytz import utc, timezone
+
+from api.common.sharding import Shard
+from api.common.testing import DatabaseTestFixture
+from api.mod_event.event import Event
+from api.mod_event.signals import events_changed
+from api.mod_guild.guild import Guild
+from bot.digest import WeeklyDigestCache
+from bot.executor import DatabaseExecutor
+from bot.handlers.events import CommandWeekly
+from bot.settings import GuildSettingsCache
+
+
+class TestWeeklyDigestCache(DatabaseTestFixture, unittest.TestCase):
+
+    def setUp(self):
+        # Event writes are also forwarded to the database outbox.
+        super().setUp()
+        self.now = 0.
+        self.cache = WeeklyDigestCache(
+            ttl=timedelta(minutes=1), clock=lambda: self.now)
+
+    def test_get_put(self):
+        """Ensure digests are cached until they expire."""
+        key = ('12345', 2020, 41, 'UTC')
+        self.assertIsNone(self.cache.get(key))
+        self.cache.put(key, ['Raid'], self.cache.generation('12345'))
+
+        self.assertEqual(self.cache.get(key), ['Raid'])
+        self.now = 61.
+        self.assertIsNone(self.cache.get(key))
+        self.assertEqual((self.cache.hits, self.cache.misses), (1, 2))
+
+    def test_events_changed_invalidates(self):
+        """Ensure writing the events of a guild drops its digests only."""
+        self.cache.put(('12345', 2020, 41, 'UTC'), ['Raid'], 0)
+        self.cache.put(('54321', 2020, 41, 'UTC'), ['Dungeon'], 0)
+        events_changed.send('12345')
+
+        self.assertIsNone(self.cache.get(('12345', 2020, 41, 'UTC')))
+        self.assertEqual(self.cache.get(('54321', 2020, 41, 'UTC')), ['Dungeon'])
+
+    def test_put_after_invalidation(self):
+        """Ensure digests computed during a write are not cached."""
+        generation = self.cache.generation('12345')
+        self.cache.invalidate_guild('12345')
+        self.cache.put(('12345', 2020, 41, 'UTC'), ['Raid'], generation)
+
+        self.assertIsNone(self.cache.get(('12345', 2020, 41, 'UTC')))
+
+
+class TestCommandWeeklyDigest(DatabaseTestFixture, unittest.TestCase):
+
+    def setUp(self):
+        """Add events on two guilds."""
+        super().setUp()
+        for guild_id, title in (('12345', 'Raid'), ('54321', 'Dungeon')):
+            guild = Guild(guild_id)
+            self.db.session.add(guild)
+            self.db.session.add(Event(
+                guild, title, datetime(2020, 10, 7, 20, 0, tzinfo=utc)))
+        self.db.session.commit()
+        self.command = CommandWeekly(
+            DatabaseExecutor(), GuildSettingsCache(self.app), WeeklyDigestCache())
+
+    def test_week_time_range(self):
+        """Ensure weeks follow the ISO calendar."""
+        # 2018 starts on a Monday, 2020 has 53 ISO weeks.
+        start, end = CommandWeekly.week_time_range(2018, 1, utc)
+        self.assertEqual(start, datetime(2018, 1, 1, tzinfo=utc))
+        start, end = CommandWeekly.week_time_range(2020, 53, utc)
+        self.assertEqual(end, datetime(2021, 1, 4, tzinfo=utc))
+        with self.assertRaises(IndexError):
+            CommandWeekly.week_time_range(2021, 53, utc)
+
+    def test_digest(self):
+        """Ensure digests are formatted in the requested timezone and cached."""
+        paris = timezone('Europe/Paris')
+        digest = self.command.compute_digest('12345', 2020, 41, paris)
+
+        self.assertEqual(len(digest), 1)
+        self.assertIn('22:00', digest[0])
+        self.assertIn('**Raid**', digest[0])
+        self.assertIs(self.command.cache.get(('12345', 2020, 41, 'Europe/Paris')),
+                      digest)
+
+    def test_warm(self):
+        """Ensure warming computes the digests of all guilds."""
+        self.command.warm(['12345', '54321', '99999'], 2020, 41, utc)
+
+        cache = self.command.cache
+        self.assertEqual(len(cache.get(('54321', 2020, 41, 'UTC'))), 1)
+        self.assertEqual(cache.get(('99999', 2020, 41, 'UTC')), [])
+        self.assertEqual(cache.misses, 0)
+
+    def test_warm_shard(self):
+        """Ensure warming only loads the events of the guilds of the shard."""
+        # Guild IDs are assigned to shards from their upper bits.
+        other = Guild(str(1 << 22))
+        self.db.session.add(other)
+        self.db.session.add(Event(
+            other, 'Other', datetime(2020, 10, 7, 20, 0, tzinfo=utc)))
+        self.db.session.commit()
+
+        with unittest.mock.patch.object(
+                Event, 'occurrences_in_range',
+                wraps=Event.occurrences_in_range) as occurrences_in_range:
+            self.command.warm(['12345', '54321'], 2020, 41, utc, Shard(0, 2))
+
+        self.assertEqual(occurrences_in_range.call_args.kwargs['shard'], Shard(0, 2))
+        self.assertEqual(len(self.command.cache.get(('12345', 2020, 41, 'UTC'))), 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,117 @@
+"""Runs the blocking database work of the bot off its event loop."""
+
+from __future__ import annotations
+
+__LICENSE__ = """
+Copyright 2019 Google LLC
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    https://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+import asyncio
+import functools
+import logging
+
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, TypeVar
+
+from bot.metrics import PHASE_DATABASE, timed
+
+
+# Amount of threads querying the database.
+DEFAULT_MAX_WORKERS = 4
+
+# Amount of jobs accepted before callers have to wait for a free slot.
+DEFAULT_MAX_PENDING = 64
+
+T = TypeVar('T')
+
+
+class DatabaseExecutor:
+    """Bounded thread pool running the blocking SQLAlchemy calls of the bot.
+
+    Jobs run in their own thread, hence their own scoped session, and must
+    set up their app context themselves as the bot handlers already do.
+
+    At most max_pending jobs are submitted at once; further callers wait for
+    a slot, which is reported as a saturation of the executor.
+
+    :attr pending: Amount of jobs submitted and not finished yet.
+    :attr waiting: Amount of callers waiting for a slot.
+    :attr peak_pending: Highest amount of jobs pending at once.
+    :attr saturations: Amount of calls which had to wait for a slot.
+    """
+
+    pending: int
+    waiting: int
+    peak_pending: int
+    saturations: int
+
+    def __init__(self, max_workers: int = DEFAULT_MAX_WORKERS,
+                 max_pending: int = DEFAULT_MAX_PENDING):
+        self._max_workers = max_workers
+        self._executor = ThreadPoolExecutor(
+            max_workers, thread_name_prefix='bot-database')
+        self._slots = asyncio.Semaphore(max_pending)
+        self.pending = 0
+        self.waiting = 0
+        self.peak_pending = 0
+        self.saturations = 0
+
+    @property
+    def queue_depth(self) -> int:
+        """Amount of jobs waiting for a thread, or for a slot to be submitted."""
+        return max(self.pending - self._max_workers, 0) + self.waiting
+
+    async def run(self, fn: Callable[..., T], *args, **kwargs) -> T:
+        """Runs fn in a database thread and returns its result.
+
+        The time spent, including waiting for a slot, is attributed to the
+        database phase of the running command.
+        """
+        with timed(PHASE_DATABASE):
+            return await self._run(fn, *args, **kwargs)
+
+    async def _run(self, fn: Callable[..., T], *args, **kwargs) -> T:
+        if self._slots.locked():
+            self.saturations += 1
+            logging.warning(
+                'Database executor saturated: %d jobs pending, %d waiting',
+                self.pending, self.waiting)
+        self.waiting += 1
+        try:
+            await self._slots.acquire()
+        finally:
+            self.waiting -= 1
+
+        self.pending += 1
+        self.peak_pending = max(self.peak_pending, self.pending)
+        try:
+            return await asyncio.get_running_loop().run_in_executor(
+                self._executor, functools.partial(fn, *args, **kwargs))
+        finally:
+            self.pending -= 1
+            self._slots.release()
+
+    def shutdown(self):
+        """Stops accepting jobs, without waiting for the running ones."""
+        self._executor.shutdown(wait=False)
+
+    def metrics(self) -> Dict[str, Any]:
+        """Returns the executor metrics, suitable for exporting."""
+        return {
+            'database_jobs_pending': self.pending,
+            'database_queue_depth': self.queue_depth,
+            'database_peak_pending': self.peak_pending,
+            'database_saturations': self.saturations,
+        }
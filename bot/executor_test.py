@@ -0,0 +1,62 @@
+from __future__ import annotations
+
+__LICENSE__ = """
+Copyright 2019 Google LLC
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+    https://www.apache.org/licenses/LICENSE-2.0
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+import asyncio
+import threading
+import unittest
+
+from bot.executor import DatabaseExecutor
+
+
+class TestDatabaseExecutor(unittest.TestCase):
+
+    def setUp(self):
+        self.executor = DatabaseExecutor(max_workers=1, max_pending=2)
+
+    def tearDown(self):
+        self.executor.shutdown()
+
+    def test_run(self):
+        """Ensure jobs run in another thread and return their result."""
+        async def main():
+            return await self.executor.run(threading.get_ident)
+
+        self.assertNotEqual(asyncio.run(main()), threading.get_ident())
+        self.assertEqual(self.executor.pending, 0)
+
+    def test_saturation(self):
+        """Ensure callers over the limit wait and are reported."""
+        release = threading.Event()
+        depths = []
+
+        async def main():
+            jobs = [asyncio.ensure_future(self.executor.run(release.wait))
+                    for _ in range(4)]
+            await asyncio.sleep(0.05)
+            depths.append(self.executor.queue_depth)
+            release.set()
+            await asyncio.gather(*jobs)
+
+        asyncio.run(main())
+        # One running, one queued in the pool, two waiting for a slot.
+        self.assertEqual(depths, [3])
+        metrics = self.executor.metrics()
+        self.assertEqual(metrics['database_saturations'], 2)
+        self.assertEqual(metrics['database_peak_pending'], 2)
+        self.assertEqual(metrics['database_queue_depth'], 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
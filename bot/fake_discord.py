@@ -0,0 +1,355 @@
+"""A local stand-in for the Discord gateway and REST API, for benchmarks.
+
+Serves the subset of Discord the bot uses: login, the gateway handshake,
+application commands and channel messages. Dispatches events to the bot on
+demand and records the requests the bot makes, with their timings.
+"""
+
+from __future__ import annotations
+
+__LICENSE__ = """
+Copyright 2019 Google LLC
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    https://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+import asyncio
+import discord
+import itertools
+import json
+import re
+import threading
+import time
+
+from aiohttp import web, WSMsgType
+from collections import deque
+from datetime import datetime
+from pytz import utc
+from typing import Any, Awaitable, Callable, Deque, Dict, List, NamedTuple, Optional
+
+
+# Discord allows 5 messages per 5 seconds in a channel.
+CHANNEL_RATE_LIMIT = 5
+CHANNEL_RATE_PERIOD = 5.
+
+# Gateway opcodes, see
+# https://discord.com/developers/docs/topics/opcodes-and-status-codes
+OP_DISPATCH = 0
+OP_HEARTBEAT = 1
+OP_IDENTIFY = 2
+OP_HELLO = 10
+OP_HEARTBEAT_ACK = 11
+
+HEARTBEAT_INTERVAL_MS = 41250
+
+BOT_USER = {
+    'id': '700000000000000001',
+    'username': 'Wowrganizer',
+    'discriminator': '0001',
+    'avatar': None,
+    'bot': True,
+}
+OWNER_USER = {
+    'id': '700000000000000002',
+    'username': 'Owner',
+    'discriminator': '0002',
+    'avatar': None,
+}
+APPLICATION_ID = '700000000000000003'
+
+_snowflakes = itertools.count(800000000000000000)
+
+
+def snowflake() -> str:
+    """Returns a new unique Discord ID."""
+    return str(next(_snowflakes))
+
+
+def make_guild(guild_id: int, name: str) -> Dict[str, Any]:
+    """Returns the GUILD_CREATE payload of a guild with a single channel.
+
+    The channel ID is the guild ID plus one.
+    """
+    channel_id = str(guild_id + 1)
+    return {
+        'id': str(guild_id),
+        'name': name,
+        'icon': None,
+        'owner_id': OWNER_USER['id'],
+        'region': 'europe',
+        'afk_channel_id': None,
+        'afk_timeout': 300,
+        'verification_level': 0,
+        'default_message_notifications': 0,
+        'explicit_content_filter': 0,
+        'roles': [{
+            'id': str(guild_id), 'name': '@everyone', 'permissions': '0',
+            'position': 0, 'color': 0, 'hoist': False, 'managed': False,
+            'mentionable': False,
+        }],
+        'emojis': [],
+        'features': [],
+        'mfa_level': 0,
+        'system_channel_id': channel_id,
+        'member_count': 2,
+        'members': [],
+        'presences': [],
+        'channels': [{
+            'id': channel_id, 'type': 0, 'name': 'general', 'position': 0,
+            'permission_overwrites': [],
+        }],
+        'large': False,
+    }
+
+
+def make_message(channel_id: str, content: str,
+                 author: Dict[str, Any], guild_id: Optional[str] = None
+                 ) -> Dict[str, Any]:
+    """Returns the payload of a message, as sent by the gateway or REST."""
+    message = {
+        'id': snowflake(),
+        'channel_id': channel_id,
+        'author': author,
+        'content': content,
+        'timestamp': datetime.now(utc).isoformat(),
+        'edited_timestamp': None,
+        'tts': False,
+        'mention_everyone': False,
+        'mentions': [],
+        'mention_roles': [],
+        'attachments': [],
+        'embeds': [],
+        'pinned': False,
+        'type': 0,
+    }
+    if guild_id is not None:
+        message['guild_id'] = guild_id
+        message['member'] = {'roles': [], 'joined_at': message['timestamp'],
+                             'deaf': False, 'mute': False}
+    return message
+
+
+def _json_response(data: Any, status: int = 200,
+                   headers: Optional[Dict[str, str]] = None) -> web.Response:
+    """Returns a JSON response; discord.py only decodes JSON bodies whose
+    content type is exactly application/json, without a charset.
+    """
+    return web.Response(body=json.dumps(data).encode(), status=status,
+                        headers=dict(headers or {},
+                                     **{'Content-Type': 'application/json'}))
+
+
+class RecordedRequest(NamedTuple):
+    """A REST request received from the bot."""
+    method: str
+    path: str
+    body: Any
+    received_at: float
+    status: int
+
+
+class FakeDiscord:
+    """Serves a fake Discord to a bot connecting through discord.py.
+
+    Runs its own event loop in a thread, so the bot and the fake do not
+    compete for the same loop. Point discord.py to base_url through
+    discord.http.Route.BASE before starting the bot.
+
+    Messages posted by the bot are limited to CHANNEL_RATE_LIMIT per
+    CHANNEL_RATE_PERIOD per channel, as Discord does; requests above the
+    limit get a 429 response.
+
+    :attr guilds: GUILD_CREATE payloads of the guilds the bot is in.
+    :attr requests: The REST requests received, in order.
+    :attr identified_at: When the bot identified on the gateway.
+    :attr on_request: Called with each REST request, from the fake thread.
+    """
+
+    def __init__(self, guilds: List[Dict[str, Any]], host: str = '127.0.0.1',
+                 clock: Callable[[], float] = time.perf_counter):
+        self.guilds = guilds
+        self.requests: List[RecordedRequest] = []
+        self.identified_at: Optional[float] = None
+        self.on_request: Optional[Callable[[RecordedRequest], None]] = None
+        self._host = host
+        self._clock = clock
+        self._port = 0
+        self._sequence = itertools.count(1)
+        self._socket: Optional[web.WebSocketResponse] = None
+        self._history: Dict[str, Deque[float]] = {}
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(
+            target=self._loop.run_forever, name='Fake Discord', daemon=True)
+        self._runner: Optional[web.AppRunner] = None
+        self._routes = [
+            ('GET', re.compile(r'/users/@me$'), self._get_user),
+            ('GET', re.compile(r'/gateway$'), self._get_gateway),
+            ('GET', re.compile(r'/oauth2/applications/@me$'),
+             self._get_application),
+            ('PUT', re.compile(r'/applications/\d+/commands$'),
+             self._put_commands),
+            ('POST', re.compile(r'/channels/(\d+)/messages$'),
+             self._post_message),
+            ('PATCH', re.compile(r'/channels/(\d+)/messages/(\d+)$'),
+             self._patch_message),
+            ('PUT', re.compile(r'/channels/\d+/pins/\d+$'), self._no_content),
+        ]
+
+    @property
+    def base_url(self) -> str:
+        """Base URL of the REST API, to set as discord.http.Route.BASE."""
+        return 'http://%s:%d/api/v7' % (self._host, self._port)
+
+    def start(self):
+        """Starts serving, from a thread of its own."""
+        self._thread.start()
+        self.call(self._start_server()).result()
+
+    def stop(self):
+        """Stops serving and the thread."""
+        self.call(self._stop_server()).result()
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+
+    def call(self, coroutine: Awaitable[Any]) -> 'asyncio.Future':
+        """Runs a coroutine on the fake loop, from any thread."""
+        return asyncio.run_coroutine_threadsafe(coroutine, self._loop)
+
+    async def _start_server(self):
+        app = web.Application()
+        app.router.add_get('/gateway', self._gateway)
+        app.router.add_route('*', '/api/v7/{path:.*}', self._rest)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, self._host, 0)
+        await site.start()
+        self._port = site._server.sockets[0].getsockname()[1]
+
+    async def _stop_server(self):
+        if self._socket is not None:
+            await self._socket.close()
+        await self._runner.cleanup()
+
+    async def dispatch(self, event: str, data: Dict[str, Any]) -> float:
+        """Sends a gateway event to the bot; returns when it was sent."""
+        sent_at = self._clock()
+        await self._socket.send_str(json.dumps({
+            'op': OP_DISPATCH, 't': event, 's': next(self._sequence), 'd': data}))
+        return sent_at
+
+    async def _gateway(self, request: web.Request) -> web.WebSocketResponse:
+        """Speaks the gateway protocol, up to the dispatch of the guilds."""
+        socket = web.WebSocketResponse(max_msg_size=0)
+        await socket.prepare(request)
+        self._socket = socket
+        await socket.send_json({'op': OP_HELLO, 's': None, 't': None,
+                                'd': {'heartbeat_interval': HEARTBEAT_INTERVAL_MS}})
+        async for message in socket:
+            if message.type != WSMsgType.TEXT:
+                continue
+            payload = json.loads(message.data)
+            if payload['op'] == OP_HEARTBEAT:
+                await socket.send_json({'op': OP_HEARTBEAT_ACK, 's': None,
+                                        't': None, 'd': None})
+            elif payload['op'] == OP_IDENTIFY:
+                self.identified_at = self._clock()
+                await self._identify(payload['d'])
+        return socket
+
+    async def _identify(self, identify: Dict[str, Any]):
+        """Sends READY, then the guilds as Discord streams them."""
+        await self.dispatch('READY', {
+            'v': 6,
+            'user': BOT_USER,
+            'guilds': [{'id': g['id'], 'unavailable': True} for g in self.guilds],
+            'session_id': snowflake(),
+            'application': {'id': APPLICATION_ID, 'flags': 0},
+            'shard': identify.get('shard', [0, 1]),
+            'private_channels': [],
+            'relationships': [],
+        })
+        for guild in self.guilds:
+            await self.dispatch('GUILD_CREATE', dict(guild, unavailable=False))
+
+    async def _rest(self, request: web.Request) -> web.Response:
+        """Routes a REST request, recording it."""
+        path = '/' + request.match_info['path']
+        body = await request.json() if request.can_read_body else None
+        for method, pattern, handler in self._routes:
+            match = pattern.match(path)
+            if method == request.method and match:
+                response = await handler(*match.groups(), body=body)
+                break
+        else:
+            response = _json_response(
+                {'message': '404: Not Found', 'code': 0}, status=404)
+        recorded = RecordedRequest(request.method, path, body, self._clock(),
+                                   response.status)
+        self.requests.append(recorded)
+        if self.on_request is not None:
+            self.on_request(recorded)
+        return response
+
+    def _rate_limited(self, bucket: str) -> Optional[web.Response]:
+        """Returns the 429 response of a bucket which exceeded its limit."""
+        history = self._history.setdefault(bucket, deque())
+        now = time.monotonic()
+        while history and history[0] <= now - CHANNEL_RATE_PERIOD:
+            history.popleft()
+        if len(history) >= CHANNEL_RATE_LIMIT:
+            retry_after = history[0] + CHANNEL_RATE_PERIOD - now
+            return _json_response(
+                {'message': 'You are being rate limited.',
+                 'retry_after': retry_after, 'global': False},
+                status=429, headers={'Retry-After': '%.3f' % retry_after})
+        history.append(now)
+        return None
+
+    async def _get_user(self, body=None) -> web.Response:
+        return _json_response(BOT_USER)
+
+    async def _get_gateway(self, body=None) -> web.Response:
+        return _json_response(
+            {'url': 'ws://%s:%d/gateway' % (self._host, self._port)})
+
+    async def _get_application(self, body=None) -> web.Response:
+        return _json_response({
+            'id': APPLICATION_ID, 'name': 'Wowrganizer', 'description': '',
+            'icon': None, 'rpc_origins': None, 'bot_public': True,
+            'bot_require_code_grant': False, 'owner': OWNER_USER,
+            'summary': '', 'verify_key': '', 'team': None,
+        })
+
+    async def _put_commands(self, body=None) -> web.Response:
+        return _json_response(body)
+
+    async def _post_message(self, channel_id: str, body=None) -> web.Response:
+        limited = self._rate_limited(channel_id)
+        if limited is not None:
+            return limited
+        return _json_response(make_message(
+            channel_id, body.get('content') or '', BOT_USER))
+
+    async def _patch_message(self, channel_id: str, message_id: str,
+                             body=None) -> web.Response:
+        message = make_message(channel_id, body.get('content') or '', BOT_USER)
+        message['id'] = message_id
+        return _json_response(message)
+
+    async def _no_content(self, body=None) -> web.Response:
+        return web.Response(status=204)
+
+
+def point_discord_to(fake: FakeDiscord):
+    """Makes discord.py talk to the fake instead of Discord."""
+    discord.http.Route.BASE = fake.base_url
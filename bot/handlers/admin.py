@@ -0,0 +1,48 @@
+"""Implements the commands reserved to the owner of the bot."""
+
+from __future__ import annotations
+
+__LICENSE__ = """
+Copyright 2019 Google LLC
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    https://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+import argparse
+import discord
+
+from typing import TYPE_CHECKING
+
+from bot.handlers.base import CommandHandler
+
+if TYPE_CHECKING:
+    from bot.bot import WowrganizerBot
+
+
+class CommandStats(CommandHandler):
+    """Shows the latency and errors of the commands of this shard."""
+
+    COMMAND = 'stats'
+
+    def __init__(self, bot: WowrganizerBot):
+        self._bot = bot
+
+    async def handle(self, message: discord.Message, args: argparse.Namespace):
+        """Shows the latency and errors of the commands; bot owner only."""
+        if self._bot.owner_id is None or message.author.id != self._bot.owner_id:
+            await self.reply(message, 'Failed: only available to the bot owner')
+            return
+        lines = self._bot.metrics.summary()
+        lines.extend('%s: %s' % item for item in sorted(
+            self._bot.collect_gauges().items()))
+        await self.reply(message, '```\n%s\n```' % '\n'.join(lines))
@@ -1,5 +1,7 @@
 """A basic handler definition. Handlers must inherit from it."""
 
+from __future__ import annotations
+
 __LICENSE__ = """
 Copyright 2019 Google LLC
 
@@ -16,28 +18,207 @@ See the License for the specific language governing permissions and
 limitations under the License.
 """
 
+import argparse
 import discord
+import inspect
+import shlex
 
 from abc import ABC, abstractmethod
+from typing import (Any, Callable, Dict, Iterable, Mapping, NamedTuple,
+                    Optional, Tuple)
+
+from bot.messaging import MessageSender, split_message
+
+
+# Types of the slash command options, see
+# https://discord.com/developers/docs/interactions/slash-commands
+OPTION_STRING = 3
+OPTION_INTEGER = 4
+OPTION_BOOLEAN = 5
+
+# Discord rejects command descriptions longer than this.
+MAX_DESCRIPTION_LENGTH = 100
+
+
+class OptionError(ValueError):
+    """Raised when the arguments of a command are invalid.
+
+    The message is shown to the user.
+    """
+
+
+def _parse_bool(value: str) -> bool:
+    """Converts a boolean argument of a prefixed command."""
+    lowered = value.lower()
+    if lowered in ('yes', 'true', 'on', '1'):
+        return True
+    if lowered in ('no', 'false', 'off', '0'):
+        return False
+    raise ValueError(value)
+
+
+# Parser and slash command type of the supported option types.
+_OPTION_TYPES: Dict[type, Tuple[Callable[[str], Any], int]] = {
+    str: (str, OPTION_STRING),
+    int: (int, OPTION_INTEGER),
+    bool: (_parse_bool, OPTION_BOOLEAN),
+}
+
+
+class Option(NamedTuple):
+    """Declares an argument of a command.
+
+    :attr name: Name of the argument, as shown to the user.
+    :attr description: What the argument is, as shown to the user.
+    :attr type: One of str, int and bool.
+    :attr required: Whether the argument must be provided; optional ones
+        default to None.
+    :attr convert: Validates the typed value and returns the value passed to
+        the handler; raises OptionError when invalid.
+    """
+    name: str
+    description: str
+    type: type = str
+    required: bool = True
+    convert: Optional[Callable[[Any], Any]] = None
+
+
+class _ArgumentParser(argparse.ArgumentParser):
+    """Reports parsing errors to the user instead of exiting."""
+
+    def error(self, message):
+        raise OptionError(message)
+
+
+class CompiledCommand:
+    """What is derived from the options of a command, built once.
+
+    :attr command: Name of the command.
+    :attr guild_only: Whether the command is rejected in direct messages.
+    :attr usage: The command followed by its arguments.
+    :attr help_text: The entry of the command in the help.
+    :attr slash_command: The slash command registered to Discord.
+    """
+
+    def __init__(self, command: str, options: Tuple[Option, ...],
+                 documentation: Optional[str], guild_only: bool):
+        self.command = command
+        self.guild_only = guild_only
+        self._options = options
+
+        self._parser = _ArgumentParser(prog=command, add_help=False)
+        for option in options:
+            if option.type not in _OPTION_TYPES:
+                raise ValueError('Option %s of %s has unsupported type %r' % (
+                    option.name, command, option.type))
+            self._parser.add_argument(
+                option.name, type=_OPTION_TYPES[option.type][0],
+                nargs=None if option.required else '?')
+
+        self.usage = ' '.join([command] + [
+            '<%s>' % o.name if o.required else '[%s]' % o.name
+            for o in options])
+        doc = inspect.cleandoc(documentation or '')
+        self.help_text = ':: %s\n%s' % (self.usage, doc) if doc \
+            else ':: %s' % self.usage
+        self.slash_command: Dict[str, Any] = {
+            'name': command,
+            'description': (doc.splitlines()[0] if doc else command)[
+                :MAX_DESCRIPTION_LENGTH],
+        }
+        if options:
+            self.slash_command['options'] = [{
+                'type': _OPTION_TYPES[o.type][1],
+                'name': o.name,
+                'description': o.description[:MAX_DESCRIPTION_LENGTH],
+                'required': o.required,
+            } for o in options]
+
+    def _check_guild(self, in_guild: bool):
+        if self.guild_only and not in_guild:
+            raise OptionError('only available in a server')
+
+    def _convert(self, values: Mapping[str, Any]) -> argparse.Namespace:
+        args = argparse.Namespace()
+        for option in self._options:
+            value = values.get(option.name)
+            if value is not None and option.convert is not None:
+                value = option.convert(value)
+            setattr(args, option.name, value)
+        return args
+
+    def parse_message(self, message: discord.Message) -> argparse.Namespace:
+        """Parses the arguments following a prefixed command."""
+        self._check_guild(message.guild is not None)
+        try:
+            words = shlex.split(message.content)[1:]
+        except ValueError as e:
+            raise OptionError(str(e))
+        return self._convert(vars(self._parser.parse_args(words)))
+
+    def parse_options(self, options: Mapping[str, Any],
+                      in_guild: bool) -> argparse.Namespace:
+        """Reads the options of a slash command, already typed by Discord."""
+        self._check_guild(in_guild)
+        for option in self._options:
+            if option.required and option.name not in options:
+                raise OptionError('the following arguments are required: '
+                                  + option.name)
+        return self._convert(options)
 
 
 class CommandHandler(ABC):
-    """Handles a command."""
+    """Handles a command.
+
+    :attr COMMAND: Name of the command.
+    :attr OPTIONS: The arguments of the command, in order.
+    :attr GUILD_ONLY: Whether the command is only available in servers.
+    :attr compiled: Derived from the options, set by compile().
+    :attr messages: Sends the answers of the handler, set by the bot when
+        registering the handler.
+    """
 
     COMMAND = ''
+    OPTIONS: Tuple[Option, ...] = ()
+    GUILD_ONLY = False
+
+    compiled: Optional[CompiledCommand] = None
+    messages: Optional[MessageSender] = None
 
     @abstractmethod
-    async def handle(self, message: discord.Message):
+    async def handle(self, message: discord.Message, args: argparse.Namespace):
         """Handles the provided discord message.
 
+        The arguments are parsed and validated against OPTIONS, attributes of
+        args being named after the options.
+
         Note the documentation of this method constitutes your command
         documentation, i.e. it is user visible from Discord.
         """
         raise NotImplementedError()
 
-    def documentation(self):
+    def documentation(self) -> Optional[str]:
         """Returns the documentation of the command handler.
 
         This method may be overridden for documentation generation.
         """
         return self.handle.__doc__
+
+    def compile(self) -> CompiledCommand:
+        """Builds the parser, the help and the slash command of the handler."""
+        self.compiled = CompiledCommand(
+            self.COMMAND, tuple(self.OPTIONS), self.documentation(),
+            self.GUILD_ONLY)
+        return self.compiled
+
+    async def reply(self, message: discord.Message, content: Optional[str] = None,
+                    *, blocks: Optional[Iterable[str]] = None):
+        """Answers a message, split in several ones if too long.
+
+        See MessageSender.send for the arguments.
+        """
+        if self.messages is not None:
+            await self.messages.send(message.channel, content, blocks=blocks)
+            return
+        for text in split_message(blocks if blocks is not None else [content]):
+            await message.channel.send(text)
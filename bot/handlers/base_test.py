@@ -0,0 +1,153 @@
+from __future__ import annotations
+
+__LICENSE__ = """
+Copyright 2019 Google LLC
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+    https://www.apache.org/licenses/LICENSE-2.0
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+import asyncio
+import discord
+import unittest
+
+from pytz import timezone
+from types import SimpleNamespace
+
+from bot.handlers.base import CommandHandler, Option, OptionError
+from bot.handlers.settings import CommandSetPrefix, CommandSetTimezone
+
+
+class CommandRepeat(CommandHandler):
+    """A command with typed and optional arguments."""
+
+    COMMAND = 'repeat'
+    OPTIONS = (
+        Option('text', 'What to repeat'),
+        Option('times', 'How many times', type=int, required=False),
+        Option('loud', 'Whether to shout', type=bool, required=False),
+    )
+
+    async def handle(self, message, args):
+        """Repeats a text.
+
+        Mostly useful for testing.
+        """
+
+
+def message(content, guild=1234):
+    """Stands for a Discord message."""
+    return SimpleNamespace(content=content, guild=guild)
+
+
+class TestCompiledCommand(unittest.TestCase):
+
+    def setUp(self):
+        self.compiled = CommandRepeat().compile()
+
+    def test_parse_message(self):
+        """Ensure arguments are typed and optional ones default to None."""
+        args = self.compiled.parse_message(message('!repeat "hello you" 3 yes'))
+        self.assertEqual(vars(args), {'text': 'hello you', 'times': 3, 'loud': True})
+
+        args = self.compiled.parse_message(message('!repeat hello'))
+        self.assertEqual(vars(args), {'text': 'hello', 'times': None, 'loud': None})
+
+    def test_parse_message_errors(self):
+        """Ensure invalid arguments are reported instead of exiting."""
+        for content in ('!repeat', '!repeat hello many', '!repeat a 1 yes more',
+                        '!repeat "unclosed'):
+            with self.assertRaises(OptionError, msg=content):
+                self.compiled.parse_message(message(content))
+
+    def test_parse_options(self):
+        """Ensure slash command options go through the same validation."""
+        compiled = CommandSetTimezone(None, None).compile()
+        args = compiled.parse_options({'timezone': 'Europe/Paris'}, in_guild=True)
+        self.assertEqual(args.timezone, timezone('Europe/Paris'))
+
+        with self.assertRaisesRegex(OptionError, 'unknown timezone'):
+            compiled.parse_options({'timezone': 'Mars/Olympus'}, in_guild=True)
+        with self.assertRaisesRegex(OptionError, 'required'):
+            compiled.parse_options({}, in_guild=True)
+        with self.assertRaisesRegex(OptionError, 'only available in a server'):
+            compiled.parse_options({'timezone': 'Europe/Paris'}, in_guild=False)
+
+    def test_convert(self):
+        """Ensure options are validated by their converter."""
+        compiled = CommandSetPrefix(None, None).compile()
+        self.assertEqual(compiled.parse_message(message('!set_prefix ?')).prefix, '?')
+        with self.assertRaisesRegex(OptionError, 'at most 8 characters'):
+            compiled.parse_message(message('!set_prefix waytoolong'))
+        with self.assertRaisesRegex(OptionError, 'only available in a server'):
+            compiled.parse_message(message('!set_prefix ?', guild=None))
+
+    def test_documentation(self):
+        """Ensure the help and the slash command derive from the options."""
+        self.assertEqual(self.compiled.help_text,
+                         ':: repeat <text> [times] [loud]\n'
+                         'Repeats a text.\n\nMostly useful for testing.')
+        self.assertEqual(self.compiled.slash_command, {
+            'name': 'repeat',
+            'description': 'Repeats a text.',
+            'options': [
+                {'type': 3, 'name': 'text', 'description': 'What to repeat',
+                 'required': True},
+                {'type': 4, 'name': 'times', 'description': 'How many times',
+                 'required': False},
+                {'type': 5, 'name': 'loud', 'description': 'Whether to shout',
+                 'required': False},
+            ],
+        })
+
+
+class FakeDatabase:
+    """Records the jobs instead of running them."""
+
+    def __init__(self):
+        self.jobs = []
+
+    async def run(self, fn, *args, **kwargs):
+        self.jobs.append((fn, args, kwargs))
+
+
+class TestSettingsCommands(unittest.TestCase):
+
+    def setUp(self):
+        self.database = FakeDatabase()
+        self.settings = SimpleNamespace(update=lambda *args, **kwargs: None)
+        self.handler = CommandSetPrefix(self.database, self.settings)
+        self.replies = []
+
+    def message(self, permissions: discord.Permissions):
+        async def send(text):
+            self.replies.append(text)
+        return SimpleNamespace(
+            guild=SimpleNamespace(id=1234), channel=SimpleNamespace(send=send),
+            author=SimpleNamespace(guild_permissions=permissions))
+
+    def test_refused(self):
+        """Ensure members not managing the server cannot change settings."""
+        asyncio.run(self.handler.handle(
+            self.message(discord.Permissions.none()), SimpleNamespace(prefix='a')))
+        self.assertEqual(self.database.jobs, [])
+        self.assertIn('Failed', self.replies[0])
+
+    def test_allowed(self):
+        """Ensure members managing the server can change settings."""
+        asyncio.run(self.handler.handle(
+            self.message(discord.Permissions(manage_guild=True)),
+            SimpleNamespace(prefix='?')))
+        self.assertEqual(self.database.jobs, [
+            (self.settings.update, (1234,), {'prefix': '?'})])
+        self.assertIn('Done', self.replies[0])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -18,72 +18,105 @@ limitations under the License.
 
 import argparse
 import discord
-import shlex
-import sys
+import logging
 
 from datetime import datetime, timedelta
-from typing import Tuple
-from pytz import UTC, timezone, UnknownTimeZoneError
+from typing import Dict, List, Optional, Tuple
 
 from api.base import app
-from api.mod_event.event import Event
+from api.common.sharding import Shard
+from api.mod_event.event import Event, EventOccurrence
+from bot.board import render_board
+from bot.digest import WeeklyDigestCache
+from bot.executor import DatabaseExecutor
 from bot.handlers.base import CommandHandler
-
-
-DEFAULT_TIMEZONE = UTC
-
-
-class ArgumentParser(argparse.ArgumentParser):
-    def _get_action_from_name(self, name):
-        """Given a name, get the Action instance registered with this parser.
-        If only it were made available in the ArgumentError object. It is
-        passed as it's first arg...
-        """
-        container = self._actions
-        if name is None:
-            return None
-        for action in container:
-            if '/'.join(action.option_strings) == name:
-                return action
-            elif action.metavar == name:
-                return action
-            elif action.dest == name:
-                return action
-
-    def error(self, message):
-        exc = sys.exc_info()[1]
-        if exc:
-            exc.argument = self._get_action_from_name(exc.argument_name)
-            raise exc
-        super(ArgumentParser, self).error(message)
+from bot.settings import GuildSettingsCache
 
 
 class CommandWeekly(CommandHandler):
-    """Lists the events happening this week."""
+    """Lists the events happening this week.
+
+    :attr database: Runs the digest computation off the event loop.
+    :attr settings: The guilds settings, providing their timezone.
+    :attr cache: The digests already computed, per guild and week.
+    """
 
     COMMAND = 'weekly'
     DAY_FORMAT, TIME_FORMAT = "%a %d %b", "%H:%M (%Z)"
 
-    async def handle(self, message: discord.Message):
+    database: DatabaseExecutor
+    settings: GuildSettingsCache
+    cache: WeeklyDigestCache
+
+    def __init__(self, database: DatabaseExecutor, settings: GuildSettingsCache,
+                 cache: Optional[WeeklyDigestCache] = None):
+        self.database = database
+        self.settings = settings
+        self.cache = cache or WeeklyDigestCache()
+
+    async def handle(self, message: discord.Message, args: argparse.Namespace):
         """Lists the events happening this week."""
-        now = datetime.now()
-        year = now.year
-        week = now.isocalendar()[1]
-        start, end = CommandWeekly.week_time_range(year, week, DEFAULT_TIMEZONE)
-        # TODO(funkysayu): Implement visibility restriction when listing events.
-        with app.app_context():
-            results = Event.query.filter(
-                Event.date >= start,
-                Event.date < end).all()
-        events = [self.format_event(event) for event in results]
+        events = await self.current_digest(message.guild and str(message.guild.id))
         if not events:
-            await message.channel.send('No events this week!')
+            await self.reply(message, 'No events this week!')
         else:
-            await message.channel.send("\n\n".join(events))
+            await self.reply(message, blocks=events)
 
-    def format_event(self, event: Event) -> str:
-        """Formats an event to send it in a Discord message."""
-        date = event.date.astimezone(DEFAULT_TIMEZONE)
+    async def current_digest(self, guild_id: Optional[str]) -> List[str]:
+        """Returns the formatted events of the current week of a guild.
+
+        Computed through the database executor unless cached.
+        """
+        tz = self.settings.get(guild_id).timezone
+        year, week, _ = datetime.now(tz).isocalendar()
+        events = self.cache.get((guild_id, year, week, tz.zone))
+        if events is None:
+            events = await self.database.run(
+                self.compute_digest, guild_id, year, week, tz)
+        return events
+
+    def compute_digest(self, guild_id: Optional[str], year: int, week: int,
+                       tz: datetime.tzinfo) -> List[str]:
+        """Computes the formatted events of a guild week and caches them.
+
+        Blocks on the database: run it through the database executor when
+        called from the event loop.
+        """
+        generation = self.cache.generation(guild_id)
+        start, end = CommandWeekly.week_time_range(year, week, tz)
+        # TODO(funkysayu): Implement visibility restriction when listing events.
+        with app.app_context():
+            results = Event.occurrences_in_range(start, end, guild_id=guild_id)
+            events = [self.format_event(occurrence, tz)
+                      for occurrence in results if not occurrence.cancelled]
+        self.cache.put((guild_id, year, week, tz.zone), events, generation)
+        return events
+
+    def warm(self, guild_ids: List[str], year: int, week: int,
+             tz: datetime.tzinfo, shard: Optional[Shard] = None):
+        """Computes the digests of a week for many guilds at once.
+
+        Events of all guilds are loaded through a single query, rather than
+        one per guild, restricted to the guilds of the shard if any.
+        """
+        generations = {g: self.cache.generation(g) for g in guild_ids}
+        digests: Dict[str, List[str]] = {g: [] for g in guild_ids}
+        start, end = CommandWeekly.week_time_range(year, week, tz)
+        with app.app_context():
+            for occurrence in Event.occurrences_in_range(start, end, shard=shard):
+                guild_id = str(occurrence.event.guild_id)
+                if guild_id in digests and not occurrence.cancelled:
+                    digests[guild_id].append(self.format_event(occurrence, tz))
+        for guild_id, events in digests.items():
+            self.cache.put((guild_id, year, week, tz.zone), events,
+                           generations[guild_id])
+        self.cache.prune(year, week)
+
+    def format_event(self, occurrence: EventOccurrence,
+                     tz: datetime.tzinfo) -> str:
+        """Formats an event occurrence to send it in a Discord message."""
+        event = occurrence.event
+        date = occurrence.date.astimezone(tz)
         text = "%s %s: **%s**" % (date.strftime(self.DAY_FORMAT),
                                   date.strftime(self.TIME_FORMAT), event.title)
         if event.description is not None:
@@ -94,44 +127,52 @@ class CommandWeekly(CommandHandler):
     @staticmethod
     def week_time_range(year: int, week: int,
                         tz: datetime.tzinfo) -> Tuple[datetime, datetime]:
-        """Given a year and a week number, returns the time range corresponding.
+        """Given an ISO year and week number, returns the time range corresponding.
 
         Note the returned end date matches exactly the start date of the next week
         (i.e. end date should be considered exclusive).
         """
-        if not 1 <= week <= 52:
-            raise IndexError("%s is not within the week range [1, 52]" % week)
+        try:
+            start = datetime.fromisocalendar(year, week, 1)
+        except ValueError:
+            raise IndexError("%s is not a week of the year %s" % (week, year))
+        return tz.localize(start), tz.localize(start + timedelta(days=7))
 
-        start = tz.localize(
-            datetime.strptime(f"{year}-W{week - 1}-1", "%Y-W%W-%w"))
-        return start, start + timedelta(days=7)
 
+class CommandBoard(CommandHandler):
+    """Posts the events of the week in a message kept up to date.
 
-class CommandSetTimezone(CommandHandler):
-    """Sets the timezone for all events managed by this server."""
+    :attr weekly: Computes the events of the week, sharing its cache.
+    """
 
-    COMMAND = 'set_timezone'
+    COMMAND = 'board'
+    GUILD_ONLY = True
 
-    async def handle(self, message: discord.Message):
-        """Sets the timezone for all events managed by this server."""
-        # TODO(funkysayu): actually make it server dependent
-        parser = ArgumentParser()
-        parser.add_argument('timezone')
-        try:
-            args = parser.parse_args(shlex.split(message.content)[1:])
-        except argparse.ArgumentError as exc:
-            await message.channel.send("Failed: " + exc.message)
-            return
+    weekly: CommandWeekly
 
-        try:
-            tzinfo = timezone(args.timezone)
-        except UnknownTimeZoneError:
-            await message.channel.send(
-                f'Failed: unknown timezone "{args.timezone}"')
-            return
+    def __init__(self, weekly: CommandWeekly):
+        self.weekly = weekly
+
+    async def handle(self, message: discord.Message, args: argparse.Namespace):
+        """Posts the events of this week, in a message kept up to date.
 
-        global DEFAULT_TIMEZONE
-        DEFAULT_TIMEZONE = tzinfo
-        await message.channel.send("Done: timezone was modified to %s (%s)" % (
-            DEFAULT_TIMEZONE.zone,
-            datetime.now().astimezone(DEFAULT_TIMEZONE).strftime("UTC%z")))
+        The message is posted in this channel and pinned. It is edited as the
+        events change, replacing the previous board if any.
+        """
+        guild_id = str(message.guild.id)
+        channel = message.guild.get_channel(message.channel.id)
+        if channel is None:
+            await self.reply(message, 'Failed: unknown channel')
+            return
+        content = render_board(await self.weekly.current_digest(guild_id))
+        # Sent directly rather than queued: the message must not be merged
+        # with others, as it is edited later on.
+        board = await channel.send(content)
+        try:
+            await board.pin()
+        except discord.HTTPException:
+            logging.info('Could not pin the board of guild %s', guild_id)
+        await self.weekly.database.run(
+            self.weekly.settings.set_board, guild_id, str(channel.id),
+            str(board.id))
+        await self.reply(message, 'Done: the board will be kept up to date')
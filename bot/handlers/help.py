@@ -18,33 +18,30 @@ See the License for the specific language governing permissions and
 limitations under the License.
 """
 
-from typing import List, TYPE_CHECKING
-
+import argparse
 import discord
 
-from bot.handlers.base import CommandHandler
+from typing import Iterable, List, TYPE_CHECKING
+
+from bot.handlers.base import CommandHandler, CompiledCommand
 
 if TYPE_CHECKING:
     from bot.bot import WowrganizerBot
 
 
+def format_help(compiled: Iterable[CompiledCommand]) -> List[str]:
+    """Returns the help of the given commands, sorted by name."""
+    return [c.help_text for c in sorted(compiled, key=lambda c: c.command)]
+
+
 class CommandHelp(CommandHandler):
-    """Lists the events happening this week."""
+    """Lists the available commands."""
 
     COMMAND = 'help'
 
     def __init__(self, bot: WowrganizerBot):
         self._bot = bot
 
-    async def handle(self, message: discord.Message):
+    async def handle(self, message: discord.Message, args: argparse.Namespace):
         """Displays the list of commands available with the documentation."""
-        all_handlers = self._bot.handlers
-        commands = sorted(all_handlers.keys())
-        help_text: List[str] = []
-        for command in commands:
-            doc = all_handlers[command].documentation()
-            if doc is None:
-                help_text.append(':: %s' % command)
-            else:
-                help_text.append(':: %s\n%s' % (command, doc))
-        await message.channel.send("\n\n".join(help_text))
+        await self.reply(message, blocks=self._bot.help_blocks)
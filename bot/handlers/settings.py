@@ -0,0 +1,117 @@
+"""Implements the commands changing the settings of a guild."""
+
+__LICENSE__ = """
+Copyright 2019 Google LLC
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    https://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+import argparse
+import discord
+
+from datetime import datetime, tzinfo
+from pytz import timezone, UnknownTimeZoneError
+
+from bot.executor import DatabaseExecutor
+from bot.handlers.base import CommandHandler, Option, OptionError
+from bot.settings import GuildSettingsCache
+
+
+# Longest prefix accepted for the commands.
+MAX_PREFIX_LENGTH = 8
+
+
+def _convert_timezone(name: str) -> tzinfo:
+    """Returns the timezone of the given name."""
+    try:
+        return timezone(name)
+    except UnknownTimeZoneError:
+        raise OptionError(f'unknown timezone "{name}"')
+
+
+def _convert_prefix(prefix: str) -> str:
+    """Ensures a prefix can be used to trigger the commands."""
+    if not prefix or len(prefix) > MAX_PREFIX_LENGTH or any(
+            c.isspace() for c in prefix):
+        raise OptionError(f'the prefix must be at most {MAX_PREFIX_LENGTH} '
+                          'characters, without spaces')
+    return prefix
+
+
+class SettingsCommandHandler(CommandHandler):
+    """Base of the commands changing a setting of the guild.
+
+    Only members allowed to manage the guild can change its settings.
+
+    :attr database: Runs the settings writes off the event loop.
+    :attr settings: The guilds settings, updated in place.
+    """
+
+    GUILD_ONLY = True
+
+    database: DatabaseExecutor
+    settings: GuildSettingsCache
+
+    def __init__(self, database: DatabaseExecutor, settings: GuildSettingsCache):
+        self.database = database
+        self.settings = settings
+
+    async def check_permissions(self, message: discord.Message) -> bool:
+        """Returns whether the author can manage the guild, answering an
+        error otherwise.
+        """
+        permissions = getattr(message.author, 'guild_permissions', None)
+        if permissions is not None and (
+                permissions.manage_guild or permissions.administrator):
+            return True
+        await self.reply(message, 'Failed: only members allowed to manage '
+                                  'the server can change its settings')
+        return False
+
+
+class CommandSetTimezone(SettingsCommandHandler):
+    """Sets the timezone for all events managed by this server."""
+
+    COMMAND = 'set_timezone'
+    OPTIONS = (
+        Option('timezone', 'Name of the timezone, e.g. Europe/Paris',
+               convert=_convert_timezone),
+    )
+
+    async def handle(self, message: discord.Message, args: argparse.Namespace):
+        """Sets the timezone for all events managed by this server."""
+        if not await self.check_permissions(message):
+            return
+        await self.database.run(
+            self.settings.update, message.guild.id,
+            timezone_name=args.timezone.zone)
+        await self.reply(message, "Done: timezone was modified to %s (%s)" % (
+            args.timezone.zone, datetime.now(args.timezone).strftime("UTC%z")))
+
+
+class CommandSetPrefix(SettingsCommandHandler):
+    """Sets the prefix of the bot commands in this server."""
+
+    COMMAND = 'set_prefix'
+    OPTIONS = (
+        Option('prefix', 'The new prefix, e.g. !', convert=_convert_prefix),
+    )
+
+    async def handle(self, message: discord.Message, args: argparse.Namespace):
+        """Sets the prefix of the bot commands in this server."""
+        if not await self.check_permissions(message):
+            return
+        await self.database.run(
+            self.settings.update, message.guild.id, prefix=args.prefix)
+        await self.reply(
+            message, f'Done: commands are now prefixed by "{args.prefix}"')
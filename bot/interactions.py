@@ -0,0 +1,126 @@
+"""Registers the command handlers as slash commands and answers them."""
+
+from __future__ import annotations
+
+__LICENSE__ = """
+Copyright 2019 Google LLC
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    https://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+import discord
+
+from discord.http import HTTPClient, Route
+from typing import Any, Callable, Dict, Iterable, Optional
+
+from bot.handlers.base import CompiledCommand
+
+
+# Types of interactions and of their responses, see
+# https://discord.com/developers/docs/interactions/slash-commands
+INTERACTION_APPLICATION_COMMAND = 2
+RESPONSE_CHANNEL_MESSAGE = 4
+RESPONSE_DEFERRED_CHANNEL_MESSAGE = 5
+
+
+async def register_commands(http: HTTPClient, application_id: str,
+                            compiled: Iterable[CompiledCommand]):
+    """Replaces the global slash commands of the application."""
+    await http.request(
+        Route('PUT', '/applications/{application_id}/commands',
+              application_id=application_id),
+        json=[c.slash_command for c in compiled])
+
+
+class InteractionChannel:
+    """Sends the answers of a command to the interaction it comes from.
+
+    The first answer responds to the interaction, or replaces the "thinking"
+    message if the response was deferred. Later answers are follow-ups.
+    """
+
+    def __init__(self, http: HTTPClient, application_id: str,
+                 interaction_id: str, token: str,
+                 channel_id: Optional[str] = None):
+        self.id = int(channel_id) if channel_id else None
+        self.bucket = ('interaction', token)
+        self._http = http
+        self._application_id = application_id
+        self._interaction_id = interaction_id
+        self._token = token
+        self._deferred = False
+        self._answered = False
+
+    async def _callback(self, payload: Dict[str, Any]):
+        await self._http.request(
+            Route('POST', '/interactions/{interaction_id}/{token}/callback',
+                  interaction_id=self._interaction_id, token=self._token),
+            json=payload)
+
+    async def defer(self):
+        """Acknowledges the interaction; Discord shows the bot is thinking."""
+        await self._callback({'type': RESPONSE_DEFERRED_CHANNEL_MESSAGE})
+        self._deferred = True
+
+    async def send(self, content: Optional[str] = None, *,
+                   embed: Optional[discord.Embed] = None):
+        """Sends an answer, as discord.TextChannel.send does."""
+        data: Dict[str, Any] = {}
+        if content is not None:
+            data['content'] = str(content)
+        if embed is not None:
+            data['embeds'] = [embed.to_dict()]
+
+        if not self._deferred and not self._answered:
+            await self._callback({'type': RESPONSE_CHANNEL_MESSAGE, 'data': data})
+        elif not self._answered:
+            await self._http.request(
+                Route('PATCH',
+                      '/webhooks/{application_id}/{token}/messages/@original',
+                      application_id=self._application_id, token=self._token),
+                json=data)
+        else:
+            await self._http.request(
+                Route('POST', '/webhooks/{application_id}/{token}',
+                      application_id=self._application_id, token=self._token),
+                json=data)
+        self._answered = True
+
+
+class InteractionMessage:
+    """Presents a slash command interaction as the message of a command.
+
+    Handlers read the guild and the channel of the messages they handle; the
+    options are parsed by the compiled command instead of the content.
+    """
+
+    def __init__(self, payload: Dict[str, Any], http: HTTPClient,
+                 application_id: str,
+                 get_guild: Callable[[int], Optional[discord.Guild]]):
+        data = payload['data']
+        self.command = data['name']
+        self.options = {option['name']: option['value']
+                        for option in data.get('options', [])}
+        self.guild = get_guild(int(payload['guild_id'])) \
+            if payload.get('guild_id') else None
+        user = payload['member']['user'] if 'member' in payload else payload['user']
+        self.author = discord.Object(id=int(user['id']))
+        if 'member' in payload:
+            # Permissions of the member in the channel of the interaction.
+            self.author.guild_permissions = discord.Permissions(
+                int(payload['member'].get('permissions', 0)))
+        self.channel = InteractionChannel(
+            http, application_id, payload['id'], payload['token'],
+            payload.get('channel_id'))
+        self.content = '/' + self.command
+
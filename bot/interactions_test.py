@@ -0,0 +1,96 @@
+from __future__ import annotations
+
+__LICENSE__ = """
+Copyright 2019 Google LLC
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+    https://www.apache.org/licenses/LICENSE-2.0
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+import asyncio
+import unittest
+
+from bot.handlers.settings import CommandSetTimezone
+from bot.interactions import InteractionMessage, register_commands
+
+
+class FakeHTTP:
+    """Records the requests sent to Discord."""
+
+    def __init__(self):
+        self.requests = []
+
+    async def request(self, route, json=None):
+        self.requests.append((route.method, route.url.split('/v7', 1)[1], json))
+
+
+class TestInteractions(unittest.TestCase):
+
+    PAYLOAD = {
+        'id': '42',
+        'type': 2,
+        'token': 'tok',
+        'guild_id': '1234',
+        'channel_id': '5678',
+        'member': {'user': {'id': '99'}, 'permissions': '32'},
+        'data': {'name': 'set_timezone', 'options': [
+            {'name': 'timezone', 'type': 3, 'value': 'America/New York'}]},
+    }
+
+    def setUp(self):
+        self.http = FakeHTTP()
+        self.handler = CommandSetTimezone(None, None)
+
+    def test_register_commands(self):
+        """Ensure the compiled slash commands are registered at once."""
+        compiled = self.handler.compile()
+        asyncio.run(register_commands(self.http, '7', [compiled]))
+        self.assertEqual(self.http.requests, [
+            ('PUT', '/applications/7/commands', [compiled.slash_command])])
+
+    def test_message(self):
+        """Ensure interactions are read as the messages of a command."""
+        message = InteractionMessage(self.PAYLOAD, self.http, '7',
+                                     lambda guild_id: guild_id)
+        self.assertEqual(message.command, 'set_timezone')
+        self.assertEqual(message.guild, 1234)
+        self.assertEqual(message.author.id, 99)
+        self.assertTrue(message.author.guild_permissions.manage_guild)
+        self.assertEqual(message.options, {'timezone': 'America/New York'})
+
+    def test_send(self):
+        """Ensure answers respond to the interaction, then follow up."""
+        message = InteractionMessage(self.PAYLOAD, self.http, '7',
+                                     lambda guild_id: None)
+
+        async def answer():
+            await message.channel.defer()
+            await message.channel.send('First')
+            await message.channel.send('Second')
+
+        asyncio.run(answer())
+        self.assertEqual(self.http.requests, [
+            ('POST', '/interactions/42/tok/callback', {'type': 5}),
+            ('PATCH', '/webhooks/7/tok/messages/@original', {'content': 'First'}),
+            ('POST', '/webhooks/7/tok', {'content': 'Second'}),
+        ])
+
+    def test_send_without_defer(self):
+        """Ensure answers are sent with the response when not deferred."""
+        message = InteractionMessage(self.PAYLOAD, self.http, '7',
+                                     lambda guild_id: None)
+        asyncio.run(message.channel.send('Unknown command.'))
+        self.assertEqual(self.http.requests, [
+            ('POST', '/interactions/42/tok/callback',
+             {'type': 4, 'data': {'content': 'Unknown command.'}}),
+        ])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,214 @@
+"""Sends the messages of the bot within the Discord limits."""
+
+from __future__ import annotations
+
+__LICENSE__ = """
+Copyright 2019 Google LLC
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    https://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+import asyncio
+import discord
+import logging
+import time
+
+from collections import deque
+from typing import (Any, Awaitable, Callable, Deque, Dict, Hashable, Iterable,
+                    List, NamedTuple, Optional, Tuple)
+
+from bot.metrics import PHASE_DISCORD, timed
+
+
+# Discord rejects messages longer than this.
+MAX_MESSAGE_LENGTH = 2000
+
+# Discord allows 5 messages per 5 seconds in a channel.
+CHANNEL_RATE_LIMIT = 5
+CHANNEL_RATE_PERIOD = 5.
+
+# Separates the blocks of a message, and the messages coalesced together.
+BLOCK_SEPARATOR = '\n\n'
+
+
+def split_message(blocks: Iterable[str], separator: str = BLOCK_SEPARATOR,
+                  limit: int = MAX_MESSAGE_LENGTH) -> List[str]:
+    """Packs blocks of text in as few messages as possible.
+
+    Messages are only split between blocks. Blocks too long to fit in a
+    message are split between lines, and lines between characters as a last
+    resort.
+    """
+    messages: List[str] = []
+    current: Optional[str] = None
+    for block in blocks:
+        if len(block) <= limit:
+            parts = [block]
+        elif '\n' in block:
+            parts = split_message(block.split('\n'), '\n', limit)
+        else:
+            parts = [block[i:i + limit] for i in range(0, len(block), limit)]
+        for part in parts:
+            if current is None:
+                current = part
+            elif len(current) + len(separator) + len(part) <= limit:
+                current += separator + part
+            else:
+                messages.append(current)
+                current = part
+    if current is not None:
+        messages.append(current)
+    return messages
+
+
+def route_bucket(channel: Any) -> Hashable:
+    """Returns the Discord rate limit bucket of the messages of a channel."""
+    return getattr(channel, 'bucket', None) or ('channel', channel.id)
+
+
+class _PendingMessage(NamedTuple):
+    content: Optional[str]
+    embed: Optional[discord.Embed]
+    future: asyncio.Future
+
+
+class MessageSender:
+    """Sends the messages of the bot, one route bucket at a time.
+
+    Messages are queued per bucket and sent in order by a task which exits
+    once the queue is empty. Each bucket sends at most CHANNEL_RATE_LIMIT
+    messages per CHANNEL_RATE_PERIOD, so sends wait here rather than being
+    rejected by Discord. Text messages queued to the same channel while
+    waiting are coalesced, as long as they fit in a single message.
+
+    :attr sent: Amount of messages sent to Discord.
+    :attr coalesced: Amount of messages merged into a previous one.
+    :attr throttled: Amount of sends delayed by the rate limit.
+    """
+
+    def __init__(self, rate: int = CHANNEL_RATE_LIMIT,
+                 period: float = CHANNEL_RATE_PERIOD,
+                 clock: Callable[[], float] = time.monotonic,
+                 sleep: Callable[[float], Awaitable[None]] = asyncio.sleep):
+        self._rate = rate
+        self._period = period
+        self._clock = clock
+        self._sleep = sleep
+        self._queues: Dict[Hashable, Deque[_PendingMessage]] = {}
+        self._workers: Dict[Hashable, asyncio.Task] = {}
+        self._history: Dict[Hashable, Deque[float]] = {}
+        self.sent = 0
+        self.coalesced = 0
+        self.throttled = 0
+
+    async def send(self, channel: Any, content: Optional[str] = None, *,
+                   blocks: Optional[Iterable[str]] = None,
+                   embed: Optional[discord.Embed] = None):
+        """Sends text and/or an embed to a channel, once the limits allow it.
+
+        Text is either content or blocks, joined with BLOCK_SEPARATOR; it is
+        split on the block boundaries when longer than a message. Raises the
+        error of the first failed send.
+
+        The time spent, including waiting for the rate limit, is attributed
+        to the Discord phase of the running command.
+        """
+        if blocks is None:
+            blocks = [content] if content is not None else []
+        messages: List[Tuple[Optional[str], Optional[discord.Embed]]] = [
+            (text, None) for text in split_message(blocks)]
+        if embed is not None:
+            messages.append((None, embed))
+
+        bucket = route_bucket(channel)
+        queue = self._queues.setdefault(bucket, deque())
+        loop = asyncio.get_running_loop()
+        futures = []
+        for text, message_embed in messages:
+            future = loop.create_future()
+            queue.append(_PendingMessage(text, message_embed, future))
+            futures.append(future)
+        if bucket not in self._workers:
+            self._workers[bucket] = loop.create_task(
+                self._drain(bucket, channel))
+        with timed(PHASE_DISCORD):
+            await asyncio.gather(*futures)
+
+    def _next_batch(self, queue: Deque[_PendingMessage]) -> List[_PendingMessage]:
+        """Pops the next message, with the texts following it if they fit."""
+        batch = [queue.popleft()]
+        if batch[0].embed is not None:
+            return batch
+        length = len(batch[0].content)
+        while queue and queue[0].embed is None:
+            length += len(BLOCK_SEPARATOR) + len(queue[0].content)
+            if length > MAX_MESSAGE_LENGTH:
+                break
+            batch.append(queue.popleft())
+        return batch
+
+    async def _throttle(self, bucket: Hashable):
+        """Waits until the bucket may send another message."""
+        history = self._history.setdefault(bucket, deque())
+        while True:
+            now = self._clock()
+            while history and history[0] <= now - self._period:
+                history.popleft()
+            if len(history) < self._rate:
+                history.append(now)
+                return
+            self.throttled += 1
+            await self._sleep(history[0] + self._period - now)
+
+    async def _drain(self, bucket: Hashable, channel: Any):
+        """Sends the messages queued to a bucket until there are none left."""
+        queue = self._queues[bucket]
+        try:
+            while queue:
+                await self._throttle(bucket)
+                batch = self._next_batch(queue)
+                try:
+                    if batch[0].embed is not None:
+                        await channel.send(embed=batch[0].embed)
+                    else:
+                        await channel.send(BLOCK_SEPARATOR.join(
+                            pending.content for pending in batch))
+                except Exception as e:
+                    logging.warning('Failed to send a message to %r: %r',
+                                    bucket, e)
+                    for pending in batch:
+                        if not pending.future.done():
+                            pending.future.set_exception(e)
+                else:
+                    self.sent += 1
+                    self.coalesced += len(batch) - 1
+                    for pending in batch:
+                        if not pending.future.done():
+                            pending.future.set_result(None)
+        finally:
+            del self._queues[bucket]
+            del self._workers[bucket]
+            # Forget the sends which no longer limit the bucket.
+            history = self._history.get(bucket)
+            if history is not None and (
+                    not history or history[-1] <= self._clock() - self._period):
+                del self._history[bucket]
+
+    def metrics(self) -> Dict[str, float]:
+        """Returns the state of the sender, suitable for exporting."""
+        return {
+            'messages_sent': self.sent,
+            'messages_coalesced': self.coalesced,
+            'messages_throttled': self.throttled,
+            'messages_queued': sum(len(q) for q in self._queues.values()),
+        }
@@ -0,0 +1,113 @@
+from __future__ import annotations
+
+__LICENSE__ = """
+Copyright 2019 Google LLC
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+    https://www.apache.org/licenses/LICENSE-2.0
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+import asyncio
+import discord
+import unittest
+
+from bot.messaging import MAX_MESSAGE_LENGTH, MessageSender, split_message
+
+
+class FakeChannel:
+    """Records the messages sent to it."""
+
+    def __init__(self, channel_id=1, fail=False):
+        self.id = channel_id
+        self.fail = fail
+        self.sent = []
+
+    async def send(self, content=None, *, embed=None):
+        await asyncio.sleep(0)
+        if self.fail:
+            raise discord.DiscordException('Missing access')
+        self.sent.append(content if embed is None else embed)
+
+
+class TestSplitMessage(unittest.TestCase):
+
+    def test_fits(self):
+        """Ensure short blocks are kept in a single message."""
+        self.assertEqual(split_message(['a', 'b']), ['a\n\nb'])
+        self.assertEqual(split_message([]), [])
+
+    def test_split_on_blocks(self):
+        """Ensure long listings are split between events."""
+        events = ['event %03d: %s' % (i, 'x' * 90) for i in range(100)]
+        messages = split_message(events)
+
+        self.assertGreater(len(messages), 1)
+        self.assertTrue(all(len(m) <= MAX_MESSAGE_LENGTH for m in messages))
+        self.assertEqual('\n\n'.join(messages).split('\n\n'), events)
+
+    def test_split_long_block(self):
+        """Ensure blocks longer than a message are split on lines."""
+        block = '\n'.join(['y' * 1500, 'z' * 1500, 'w' * 4500])
+        messages = split_message([block], limit=2000)
+        self.assertEqual([len(m) for m in messages], [1500, 1500, 2000, 2000, 500])
+
+
+class TestMessageSender(unittest.TestCase):
+
+    def setUp(self):
+        self.now = 0.
+        self.sleeps = []
+
+        async def sleep(delay):
+            self.sleeps.append(delay)
+            self.now += delay
+
+        self.sender = MessageSender(rate=2, period=5., clock=lambda: self.now,
+                                    sleep=sleep)
+
+    def test_coalesce(self):
+        """Ensure bursts to a channel are merged in as few messages as possible."""
+        channel, other = FakeChannel(1), FakeChannel(2)
+
+        async def burst():
+            await asyncio.gather(*(
+                [self.sender.send(channel, 'Reminder %d' % i) for i in range(5)]
+                + [self.sender.send(other, 'Hello')]))
+
+        asyncio.run(burst())
+        self.assertEqual(channel.sent, [
+            '\n\n'.join('Reminder %d' % i for i in range(5))])
+        self.assertEqual(other.sent, ['Hello'])
+        self.assertEqual(self.sender.metrics()['messages_coalesced'], 4)
+        self.assertEqual(self.sender.metrics()['messages_queued'], 0)
+
+    def test_throttle(self):
+        """Ensure a bucket waits instead of exceeding its rate limit."""
+        channel = FakeChannel()
+        embed = discord.Embed(title='Raid')
+
+        async def send():
+            await self.sender.send(channel, blocks=['x' * 1500, 'y' * 1500],
+                                   embed=embed)
+
+        asyncio.run(send())
+        self.assertEqual(len(channel.sent), 3)
+        self.assertIs(channel.sent[2], embed)
+        self.assertEqual(self.sleeps, [5.])
+        self.assertEqual(self.sender.throttled, 1)
+
+    def test_failure(self):
+        """Ensure send errors are raised to the senders."""
+        with self.assertRaises(discord.DiscordException):
+            asyncio.run(self.sender.send(FakeChannel(fail=True), 'Hello'))
+        self.assertEqual(self.sender.sent, 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
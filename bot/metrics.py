@@ -0,0 +1,287 @@
+"""Measures the latency and the errors of the bot command handlers."""
+
+from __future__ import annotations
+
+__LICENSE__ = """
+Copyright 2019 Google LLC
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    https://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+import bisect
+import contextlib
+import contextvars
+import logging
+import os
+import time
+
+from typing import (AsyncIterator, Callable, Dict, Iterable, Iterator, List,
+                    Mapping, Optional, Tuple, Union)
+
+
+# Upper bounds of the latency histograms buckets, in seconds.
+LATENCY_BUCKETS = (.005, .01, .025, .05, .1, .25, .5, 1., 2.5, 5., 10.)
+
+# Delay between two writes of the metrics file.
+METRICS_WRITE_SECONDS = 15.
+
+# Latency above which a command is logged, along with its guild.
+SLOW_COMMAND_SECONDS = 2.
+
+# Amount of guilds, the busiest ones, whose latency is reported.
+TOP_GUILDS = 10
+
+# Phases of a command measured separately: the whole handling, the time
+# spent waiting on the database, and the time spent waiting on Discord.
+PHASE_TOTAL = 'total'
+PHASE_DATABASE = 'database'
+PHASE_DISCORD = 'discord'
+
+
+class Histogram:
+    """Counts observations in buckets of increasing upper bounds.
+
+    :attr counts: Amount of observations per bucket, the last one counting
+        the observations above all bounds.
+    :attr count: Amount of observations.
+    :attr sum: Sum of the observations.
+    """
+
+    def __init__(self, bounds: Tuple[float, ...] = LATENCY_BUCKETS):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.count = 0
+        self.sum = 0.
+
+    def observe(self, value: float):
+        """Records an observation."""
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def quantile(self, q: float) -> float:
+        """Returns the upper bound of the bucket holding the q-quantile."""
+        if not self.count:
+            return 0.
+        rank = q * self.count
+        cumulative = 0
+        for bound, count in zip(self.bounds, self.counts):
+            cumulative += count
+            if cumulative >= rank:
+                return bound
+        return float('inf')
+
+    def mean(self) -> float:
+        return self.sum / self.count if self.count else 0.
+
+
+class _Timings:
+    """Time spent waiting on each phase by the running command."""
+
+    def __init__(self):
+        self.phases: Dict[str, float] = {PHASE_DATABASE: 0., PHASE_DISCORD: 0.}
+
+
+_timings: contextvars.ContextVar[Optional[_Timings]] = contextvars.ContextVar(
+    'command_timings', default=None)
+
+
+@contextlib.contextmanager
+def timed(phase: str) -> Iterator[None]:
+    """Attributes the time spent in the block to a phase of the running
+    command, if any.
+    """
+    timings = _timings.get()
+    if timings is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings.phases[phase] += time.perf_counter() - start
+
+
+def _format_labels(labels: Mapping[str, str]) -> str:
+    return ','.join('%s="%s"' % (k, str(v).replace('"', '\\"'))
+                    for k, v in labels.items())
+
+
+def _render_histogram(name: str, labels: str, histogram: Histogram) -> List[str]:
+    """Renders the series of a histogram in the Prometheus text format."""
+    lines = []
+    cumulative = 0
+    for bound, count in zip(histogram.bounds + (float('inf'),), histogram.counts):
+        cumulative += count
+        lines.append('%s_bucket{%s,le="%s"} %d' % (
+            name, labels, '+Inf' if bound == float('inf') else bound, cumulative))
+    lines.append('%s_sum{%s} %f' % (name, labels, histogram.sum))
+    lines.append('%s_count{%s} %d' % (name, labels, histogram.count))
+    return lines
+
+
+class HandlerMetrics:
+    """Latency histograms and error counters of the command handlers.
+
+    Latencies are recorded per command and phase. The database and Discord
+    phases are measured by the database executor and the message sender
+    while a command is running. The total latency is also recorded per
+    guild, but only the TOP_GUILDS busiest guilds are reported, so the
+    metrics do not grow with the amount of guilds; slow commands are logged
+    along with their guild.
+
+    :attr guilds: Latency histogram of the commands, per guild.
+    :attr unknown_commands: Amount of commands matching no handler.
+    :attr invalid_commands: Amount of commands with invalid arguments, per
+        command.
+    :attr exceptions: Amount of commands which raised, per command.
+    """
+
+    def __init__(self, clock: Callable[[], float] = time.perf_counter):
+        self._clock = clock
+        self.histograms: Dict[Tuple[str, str], Histogram] = {}
+        self.guilds: Dict[str, Histogram] = {}
+        self.unknown_commands = 0
+        self.invalid_commands: Dict[str, int] = {}
+        self.exceptions: Dict[str, int] = {}
+
+    def observe(self, command: str, phase: str, seconds: float):
+        """Records the latency of a phase of a command."""
+        key = (command, phase)
+        histogram = self.histograms.get(key)
+        if histogram is None:
+            histogram = self.histograms[key] = Histogram()
+        histogram.observe(seconds)
+
+    @contextlib.asynccontextmanager
+    async def measure(self, command: str,
+                      guild_id: Optional[Union[int, str]]) -> AsyncIterator[None]:
+        """Measures the handling of a command, counting its exceptions."""
+        timings = _Timings()
+        token = _timings.set(timings)
+        start = self._clock()
+        try:
+            yield
+        except Exception:
+            self.exceptions[command] = self.exceptions.get(command, 0) + 1
+            raise
+        finally:
+            _timings.reset(token)
+            total = self._clock() - start
+            self.observe(command, PHASE_TOTAL, total)
+            for phase, seconds in timings.phases.items():
+                self.observe(command, phase, seconds)
+            if guild_id is not None:
+                histogram = self.guilds.get(str(guild_id))
+                if histogram is None:
+                    histogram = self.guilds[str(guild_id)] = Histogram()
+                histogram.observe(total)
+            if total > SLOW_COMMAND_SECONDS:
+                logging.warning('Command %s took %.1fs in %s', command, total,
+                                'DM' if guild_id is None else 'guild %s' % guild_id)
+
+    def count_unknown(self):
+        self.unknown_commands += 1
+
+    def count_invalid(self, command: str):
+        self.invalid_commands[command] = self.invalid_commands.get(command, 0) + 1
+
+    def per_command(self, phase: str = PHASE_TOTAL) -> Dict[str, Histogram]:
+        """Returns the histograms of a phase, per command."""
+        return {command: histogram
+                for (command, histogram_phase), histogram in self.histograms.items()
+                if histogram_phase == phase}
+
+    def top_guilds(self, count: Optional[int] = None) -> List[Tuple[str, Histogram]]:
+        """Returns the histograms of the guilds sending the most commands, by
+        default the TOP_GUILDS ones.
+        """
+        return sorted(self.guilds.items(), key=lambda item: (
+            -item[1].count, -item[1].sum))[:count or TOP_GUILDS]
+
+    def summary(self) -> List[str]:
+        """Describes the latency and errors of each command, for humans."""
+        totals = self.per_command()
+        database = self.per_command(PHASE_DATABASE)
+        discord = self.per_command(PHASE_DISCORD)
+        lines = ['%-14s %7s %8s %8s %8s %8s %6s' % (
+            'command', 'count', 'p50', 'p95', 'db', 'discord', 'errors')]
+        for command in sorted(totals):
+            total = totals[command]
+            lines.append('%-14s %7d %7.0fms %7.0fms %7.0fms %7.0fms %6d' % (
+                command, total.count, total.quantile(.5) * 1000,
+                total.quantile(.95) * 1000, database[command].mean() * 1000,
+                discord[command].mean() * 1000,
+                self.exceptions.get(command, 0)))
+        top_guilds = self.top_guilds()
+        if top_guilds:
+            lines.append('%-20s %7s %8s %8s' % ('busiest guilds', 'count', 'p50', 'p95'))
+        for guild_id, histogram in top_guilds:
+            lines.append('%-20s %7d %7.0fms %7.0fms' % (
+                guild_id, histogram.count, histogram.quantile(.5) * 1000,
+                histogram.quantile(.95) * 1000))
+        lines.append('unknown commands: %d, invalid arguments: %d' % (
+            self.unknown_commands, sum(self.invalid_commands.values())))
+        return lines
+
+    def render(self, gauges: Optional[Mapping[str, float]] = None,
+               labels: Optional[Mapping[str, str]] = None) -> str:
+        """Renders the metrics in the Prometheus text format.
+
+        Gauges are the metrics of the other bot components, named after
+        their keys. Labels are added to all the metrics, e.g. the shard.
+        """
+        labels = dict(labels or {})
+        prefix = _format_labels(labels)
+        prefix = prefix + ',' if prefix else ''
+        lines = ['# TYPE bot_command_seconds histogram']
+        for (command, phase), histogram in sorted(self.histograms.items()):
+            lines.extend(_render_histogram(
+                'bot_command_seconds',
+                '%scommand="%s",phase="%s"' % (prefix, command, phase), histogram))
+        lines.append('# TYPE bot_guild_command_seconds histogram')
+        for guild_id, histogram in self.top_guilds():
+            lines.extend(_render_histogram(
+                'bot_guild_command_seconds', '%sguild="%s"' % (prefix, guild_id),
+                histogram))
+
+        lines.append('# TYPE bot_unknown_commands_total counter')
+        lines.append('bot_unknown_commands_total{%s} %d' % (
+            prefix.rstrip(','), self.unknown_commands))
+        for name, counts in (('bot_invalid_commands_total', self.invalid_commands),
+                             ('bot_command_exceptions_total', self.exceptions)):
+            lines.append('# TYPE %s counter' % name)
+            for command, count in sorted(counts.items()):
+                lines.append('%s{%scommand="%s"} %d' % (name, prefix, command, count))
+
+        for name, value in sorted((gauges or {}).items()):
+            lines.append('# TYPE bot_%s gauge' % name)
+            lines.append('bot_%s{%s} %s' % (name, prefix.rstrip(','), float(value)))
+        return '\n'.join(lines) + '\n'
+
+    def write(self, path: str, gauges: Optional[Mapping[str, float]] = None,
+              labels: Optional[Mapping[str, str]] = None):
+        """Replaces the metrics file at path, atomically for its readers."""
+        temporary = path + '.tmp'
+        with open(temporary, 'w') as f:
+            f.write(self.render(gauges, labels))
+        os.replace(temporary, path)
+
+
+def collect_gauges(sources: Iterable[Callable[[], Mapping[str, float]]]
+                   ) -> Dict[str, float]:
+    """Merges the metrics of the bot components."""
+    gauges: Dict[str, float] = {}
+    for source in sources:
+        gauges.update(source())
+    return gauges
@@ -0,0 +1,155 @@
+from __future__ import annotations
+
+__LICENSE__ = """
+Copyright 2019 Google LLC
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+    https://www.apache.org/licenses/LICENSE-2.0
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+import asyncio
+import os
+import tempfile
+import time
+import unittest.mock
+
+from bot.executor import DatabaseExecutor
+from bot.messaging import MessageSender
+from bot.metrics import Histogram, HandlerMetrics
+
+
+class FakeChannel:
+    id = 1
+
+    async def send(self, content=None, *, embed=None):
+        await asyncio.sleep(0.02)
+
+
+class TestHistogram(unittest.TestCase):
+
+    def test_quantile(self):
+        """Ensure quantiles are estimated from the bucket bounds."""
+        histogram = Histogram((.1, 1., 10.))
+        for value in (.05, .05, .5, 5., 50.):
+            histogram.observe(value)
+
+        self.assertEqual(histogram.counts, [2, 1, 1, 1])
+        self.assertEqual(histogram.quantile(.4), .1)
+        self.assertEqual(histogram.quantile(.6), 1.)
+        self.assertEqual(histogram.quantile(1.), float('inf'))
+        self.assertAlmostEqual(histogram.mean(), 11.12)
+
+
+class TestHandlerMetrics(unittest.TestCase):
+
+    def setUp(self):
+        self.metrics = HandlerMetrics()
+        self.database = DatabaseExecutor(max_workers=1)
+        self.messages = MessageSender()
+
+    def tearDown(self):
+        self.database.shutdown()
+
+    def test_phases(self):
+        """Ensure database and Discord waits are measured separately."""
+        async def handle():
+            async with self.metrics.measure('weekly', 1234):
+                await self.database.run(time.sleep, 0.03)
+                await self.messages.send(FakeChannel(), 'Hello')
+            # Outside of a command, nothing is recorded.
+            await self.database.run(time.sleep, 0)
+
+        asyncio.run(handle())
+        histograms = self.metrics.histograms
+        self.assertEqual(len(histograms), 3)
+        database = histograms[('weekly', 'database')].sum
+        discord = histograms[('weekly', 'discord')].sum
+        total = histograms[('weekly', 'total')].sum
+        self.assertGreaterEqual(database, 0.03)
+        self.assertGreaterEqual(discord, 0.02)
+        self.assertGreaterEqual(total, database + discord)
+
+    def test_errors(self):
+        """Ensure exceptions, unknown and invalid commands are counted."""
+        async def handle():
+            async with self.metrics.measure('help', None):
+                raise ValueError()
+
+        with self.assertRaises(ValueError):
+            asyncio.run(handle())
+        self.metrics.count_unknown()
+        self.metrics.count_invalid('set_prefix')
+
+        self.assertEqual(self.metrics.exceptions, {'help': 1})
+        self.assertEqual(self.metrics.histograms[('help', 'total')].count, 1)
+        summary = self.metrics.summary()
+        self.assertTrue(summary[1].startswith('help'))
+        self.assertIn('unknown commands: 1, invalid arguments: 1', summary[-1])
+
+    def test_guilds_share_series(self):
+        """Ensure the command series do not grow with the amount of guilds,
+        slow commands being logged with their guild.
+        """
+        clock = iter([0., 0.1, 0., 3.])
+        metrics = HandlerMetrics(clock=lambda: next(clock))
+
+        async def handle():
+            for guild_id in (1234, 5678):
+                async with metrics.measure('weekly', guild_id):
+                    pass
+
+        with self.assertLogs(level='WARNING') as logs:
+            asyncio.run(handle())
+        self.assertEqual(len(metrics.histograms), 3)
+        self.assertEqual(metrics.histograms[('weekly', 'total')].count, 2)
+        self.assertEqual(len(logs.output), 1)
+        self.assertIn('guild 5678', logs.output[0])
+
+    def test_top_guilds(self):
+        """Ensure only the busiest guilds are reported."""
+        metrics = HandlerMetrics()
+
+        async def handle():
+            for guild_id in [1234] * 3 + [5678] * 2 + [9012] + [None]:
+                async with metrics.measure('weekly', guild_id):
+                    pass
+
+        asyncio.run(handle())
+        self.assertEqual([guild_id for guild_id, _ in metrics.top_guilds(2)],
+                         ['1234', '5678'])
+        summary = metrics.summary()
+        self.assertTrue(summary[-4].startswith('1234'))
+        lines = metrics.render().splitlines()
+        self.assertIn('bot_guild_command_seconds_count{guild="1234"} 3', lines)
+
+        with unittest.mock.patch('bot.metrics.TOP_GUILDS', 2):
+            lines = metrics.render().splitlines()
+        self.assertFalse(any('9012' in line for line in lines))
+
+    def test_write(self):
+        """Ensure metrics are written in the Prometheus text format."""
+        self.metrics.observe('weekly', 'total', 0.2)
+        self.metrics.count_unknown()
+
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'bot.prom')
+            self.metrics.write(path, {'database_saturations': 2}, {'shard': '0'})
+            with open(path) as f:
+                lines = f.read().splitlines()
+
+        self.assertIn('bot_command_seconds_bucket{shard="0",command="weekly",'
+                      'phase="total",le="0.25"} 1', lines)
+        self.assertIn('bot_command_seconds_count{shard="0",command="weekly",'
+                      'phase="total"} 1', lines)
+        self.assertIn('bot_unknown_commands_total{shard="0"} 1', lines)
+        self.assertIn('bot_database_saturations{shard="0"} 2.0', lines)
+
+
+if __name__ == '__main__':
+    unittest.main()
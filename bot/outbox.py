@@ -0,0 +1,147 @@
+"""Handles the work sent by the web application through the outbox."""
+
+from __future__ import annotations
+
+__LICENSE__ = """
+Copyright 2019 Google LLC
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    https://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+import asyncio
+import logging
+
+from dateutil.parser import isoparse
+from flask import Flask
+from typing import Any, Awaitable, Callable, Dict, List, NamedTuple, Optional
+
+from api.base import app as default_app, db
+from api.common.sharding import Shard
+from api.mod_outbox.outbox import OutboxMessage, OutboxMessageKind
+from bot.executor import DatabaseExecutor
+from bot.reminders import Reminder
+
+
+# Delay between two polls of the outbox when it is empty.
+OUTBOX_POLL_SECONDS = 1.
+
+# Amount of messages loaded at once.
+OUTBOX_BATCH_SIZE = 100
+
+
+class PendingMessage(NamedTuple):
+    """Copy of an outbox message, detached from the database session."""
+    id: int
+    guild_id: str
+    kind: OutboxMessageKind
+    data: Dict[str, Any]
+
+
+class OutboxHandlers(NamedTuple):
+    """The bot coroutines handling each kind of message."""
+    announce: Callable[[str, str, Optional[str]], Awaitable[None]]
+    remind: Callable[[Reminder], Awaitable[None]]
+    events_changed: Callable[[str], None]
+
+
+class OutboxConsumer:
+    """Polls the outbox messages of the bot guilds and handles them.
+
+    Messages are handled in order. Several events_changed messages of the
+    same guild in a batch are handled once.
+    """
+
+    def __init__(self, handlers: OutboxHandlers, database: DatabaseExecutor,
+                 app: Flask = default_app, shard: Optional[Shard] = None,
+                 interval: float = OUTBOX_POLL_SECONDS,
+                 batch_size: int = OUTBOX_BATCH_SIZE):
+        self._handlers = handlers
+        self._database = database
+        self._app = app
+        self._shard = shard
+        self._interval = interval
+        self._batch_size = batch_size
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self, loop: asyncio.AbstractEventLoop):
+        """Starts polling; does nothing if already started."""
+        if self._task is None or self._task.done():
+            self._task = loop.create_task(self.run(), name='Outbox consumer')
+
+    def stop(self):
+        """Stops polling."""
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    def _fetch(self) -> List[PendingMessage]:
+        """Loads the oldest pending messages."""
+        with self._app.app_context():
+            return [PendingMessage(m.id, m.guild_id, m.kind, m.data)
+                    for m in OutboxMessage.pending(self._batch_size, self._shard)]
+
+    def _complete(self, handled: List[int], failed: Dict[int, str]):
+        """Stores the outcome of the handled messages."""
+        with self._app.app_context():
+            OutboxMessage.complete(handled, failed)
+            db.session.commit()
+
+    async def _handle(self, message: PendingMessage):
+        """Runs the handler of a message."""
+        data = message.data
+        if message.kind == OutboxMessageKind.announcement:
+            await self._handlers.announce(
+                message.guild_id, data['content'], data.get('channel_id'))
+        elif message.kind == OutboxMessageKind.reminder:
+            date = isoparse(data['date'])
+            await self._handlers.remind(Reminder(
+                date, message.guild_id, data['event_id'], data['position'],
+                data['title'], date))
+        elif message.kind == OutboxMessageKind.events_changed:
+            self._handlers.events_changed(message.guild_id)
+        else:
+            raise NotImplementedError('Unknown message kind %r' % message.kind)
+
+    async def poll(self) -> int:
+        """Handles a batch of messages. Returns the amount of messages."""
+        messages = await self._database.run(self._fetch)
+        handled: List[int] = []
+        failed: Dict[int, str] = {}
+        changed = set()
+        for message in messages:
+            if message.kind == OutboxMessageKind.events_changed:
+                if message.guild_id in changed:
+                    handled.append(message.id)
+                    continue
+                changed.add(message.guild_id)
+            try:
+                await self._handle(message)
+            except Exception as e:
+                logging.exception('Failed to handle %r', message)
+                failed[message.id] = repr(e)
+            else:
+                handled.append(message.id)
+        if messages:
+            await self._database.run(self._complete, handled, failed)
+        return len(messages)
+
+    async def run(self):
+        """Handles the messages until cancelled."""
+        while True:
+            try:
+                count = await self.poll()
+            except Exception:
+                logging.exception('Failed to poll the outbox')
+                count = 0
+            if count < self._batch_size:
+                await asyncio.sleep(self._interval)
@@ -0,0 +1,84 @@
+from __future__ import annotations
+
+__LICENSE__ = """
+Copyright 2019 Google LLC
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+    https://www.apache.org/licenses/LICENSE-2.0
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+import asyncio
+import unittest
+
+from api.common.testing import DatabaseTestFixture
+from api.mod_outbox.outbox import OutboxMessage, OutboxMessageKind
+from bot.executor import DatabaseExecutor
+from bot.outbox import OutboxConsumer, OutboxHandlers
+
+
+class TestOutboxConsumer(DatabaseTestFixture, unittest.TestCase):
+
+    def setUp(self):
+        """Set up a consumer recording the work it handles."""
+        super().setUp()
+        self.calls = []
+
+        async def announce(guild_id, content, channel_id):
+            if content == 'fail':
+                raise ValueError('No channel')
+            self.calls.append(('announce', guild_id, content, channel_id))
+
+        async def remind(reminder):
+            self.calls.append(('remind', reminder.guild_id, reminder.title))
+
+        def events_changed(guild_id):
+            self.calls.append(('events_changed', guild_id))
+
+        self.executor = DatabaseExecutor(max_workers=1)
+        self.consumer = OutboxConsumer(
+            OutboxHandlers(announce, remind, events_changed), self.executor,
+            app=self.app)
+
+    def tearDown(self):
+        self.executor.shutdown()
+        super().tearDown()
+
+    def post(self, guild_id, kind, payload=None):
+        self.db.session.add(OutboxMessage(guild_id, kind, payload))
+        self.db.session.commit()
+
+    def test_poll(self):
+        """Ensure messages are handled in order, then deleted."""
+        self.post('1', OutboxMessageKind.events_changed)
+        self.post('1', OutboxMessageKind.announcement, {'content': 'Hello'})
+        self.post('1', OutboxMessageKind.events_changed)
+        self.post('2', OutboxMessageKind.reminder, {
+            'event_id': 3, 'position': 0, 'title': 'Raid',
+            'date': '2020-10-10T21:00:00+02:00'})
+
+        self.assertEqual(asyncio.run(self.consumer.poll()), 4)
+        self.assertEqual(self.calls, [
+            ('events_changed', '1'),
+            ('announce', '1', 'Hello', None),
+            ('remind', '2', 'Raid'),
+        ])
+        self.assertEqual(OutboxMessage.query.count(), 0)
+
+    def test_poll_failure(self):
+        """Ensure failing messages are kept for a retry."""
+        self.post('1', OutboxMessageKind.announcement, {'content': 'fail'})
+
+        asyncio.run(self.consumer.poll())
+        message = OutboxMessage.query.one()
+        self.assertEqual(message.attempts, 1)
+        self.assertIn('No channel', message.error)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,265 @@
+"""Schedules reminders of the upcoming events from the bot event loop."""
+
+from __future__ import annotations
+
+__LICENSE__ = """
+Copyright 2019 Google LLC
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    https://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+import asyncio
+import heapq
+import logging
+import time
+
+from datetime import datetime, timedelta
+from flask import Flask
+from pytz import utc
+from typing import (Awaitable, Callable, Dict, List, NamedTuple, Optional,
+                    Set, Tuple)
+
+from api.base import app as default_app
+from api.common.sharding import Shard
+from api.mod_event.event import Event
+from api.mod_event.signals import events_changed
+from bot.executor import DatabaseExecutor
+
+
+# How long before an event its reminder is sent.
+REMINDER_ADVANCE = timedelta(minutes=15)
+
+# Span of the reminders loaded at once from the database.
+REMINDER_WINDOW = timedelta(minutes=30)
+
+# Lag after which a reminder is reported as late.
+LAG_WARNING_SECONDS = 5.
+
+
+class Reminder(NamedTuple):
+    """A reminder to send for an occurrence of an event.
+
+    Holds a copy of the event data, so reminders do not keep the database
+    objects loaded by the scheduler alive.
+    """
+    deadline: datetime
+    guild_id: str
+    event_id: int
+    position: int
+    title: str
+    date: datetime
+
+
+class ReminderScheduler:
+    """Fires reminders at their deadlines from an asyncio event loop.
+
+    Only the reminders due within a sliding window are loaded from the
+    database, through a single range query over all guilds run by the
+    database executor, off the event loop. They are kept in
+    a heap ordered by deadline, and the next window is loaded before the
+    current one runs out.
+
+    Writes to the events of a guild (see api.mod_event.signals) reload the
+    pending reminders of this guild only. Reminders made obsolete by a reload
+    are dropped lazily, when they reach the top of the heap.
+
+    When running in a bot shard, only the reminders of the guilds of this
+    shard are loaded.
+
+    :attr lag_count: Amount of reminders fired.
+    :attr lag_total: Sum of the reminders lag, in seconds.
+    :attr lag_max: Highest lag of a reminder, in seconds.
+    :attr window_loads: Amount of windows loaded since the start.
+    """
+
+    lag_count: int
+    lag_total: float
+    lag_max: float
+    window_loads: int
+
+    def __init__(self, remind: Callable[[Reminder], Awaitable[None]],
+                 database: DatabaseExecutor,
+                 loop: Optional[asyncio.AbstractEventLoop] = None,
+                 app: Flask = default_app,
+                 shard: Optional[Shard] = None,
+                 window: timedelta = REMINDER_WINDOW,
+                 advance: timedelta = REMINDER_ADVANCE,
+                 clock: Callable[[], datetime] = lambda: datetime.now(utc)):
+        self._remind = remind
+        self._database = database
+        self._loop = loop or asyncio.get_event_loop()
+        self._app = app
+        self._shard = shard
+        self._window = window
+        self._advance = advance
+        self._clock = clock
+
+        self._heap: List[Tuple[datetime, int, int, Reminder]] = []
+        self._generations: Dict[str, int] = {}
+        self._sequence = 0
+        self._loaded_until: Optional[datetime] = None
+        self._dirty: Set[str] = set()
+        self._wakeup = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+
+        self.lag_count = 0
+        self.lag_total = 0.
+        self.lag_max = 0.
+        self.window_loads = 0
+
+    @property
+    def running(self) -> bool:
+        """Whether the scheduler is running."""
+        return self._task is not None and not self._task.done()
+
+    def start(self):
+        """Starts firing reminders; does nothing if already started."""
+        if self.running:
+            return
+        events_changed.connect(self._on_events_changed)
+        self._task = self._loop.create_task(self.run(), name='Reminders')
+
+    def stop(self):
+        """Stops firing reminders."""
+        events_changed.disconnect(self._on_events_changed)
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    def _on_events_changed(self, guild_id: str):
+        """Receives the events_changed signal, possibly from another thread."""
+        self._loop.call_soon_threadsafe(self.notify_changed, guild_id)
+
+    def notify_changed(self, guild_id: str):
+        """Reloads the pending reminders of a guild, from the event loop."""
+        if self._shard is not None and not self._shard.owns(guild_id):
+            return
+        self._dirty.add(str(guild_id))
+        self._wakeup.set()
+
+    def _load(self, start: datetime, end: datetime,
+              guild_id: Optional[str] = None) -> List[Reminder]:
+        """Loads the reminders due within [start, end)."""
+        with self._app.app_context():
+            occurrences = Event.occurrences_in_range(
+                start + self._advance, end + self._advance, guild_id=guild_id,
+                shard=self._shard)
+            # Dates are sent in the event timezone.
+            return [Reminder(o.date - self._advance, str(o.event.guild_id),
+                             o.event.id, o.position, o.event.title,
+                             o.date.astimezone(o.event.timezone))
+                    for o in occurrences if not o.cancelled]
+
+    def _push(self, reminders: List[Reminder]):
+        """Adds reminders to the heap."""
+        for reminder in reminders:
+            generation = self._generations.get(reminder.guild_id, 0)
+            self._sequence += 1
+            heapq.heappush(self._heap, (reminder.deadline, self._sequence,
+                                        generation, reminder))
+
+    async def _load_next_window(self):
+        """Loads the reminders of the window following the loaded ones."""
+        start = self._loaded_until
+        end = start + self._window
+        self._push(await self._database.run(self._load, start, end))
+        self._loaded_until = end
+        self.window_loads += 1
+
+    async def _reload_dirty_guilds(self, now: datetime):
+        """Replaces the pending reminders of the guilds whose events changed.
+
+        Reminders due before now were already fired and are not reloaded.
+        Guilds changing again while reloading are reloaded on the next tick.
+        """
+        start = now + timedelta(microseconds=1)
+        dirty, self._dirty = self._dirty, set()
+        for guild_id in dirty:
+            self._generations[guild_id] = self._generations.get(guild_id, 0) + 1
+            if start < self._loaded_until:
+                self._push(await self._database.run(
+                    self._load, start, self._loaded_until, guild_id))
+
+    def _pop_due(self, now: datetime) -> List[Reminder]:
+        """Pops the reminders due at this time, skipping the obsolete ones."""
+        due: List[Reminder] = []
+        while self._heap and self._heap[0][0] <= now:
+            _, _, generation, reminder = heapq.heappop(self._heap)
+            if generation == self._generations.get(reminder.guild_id, 0):
+                due.append(reminder)
+        return due
+
+    async def _fire(self, reminder: Reminder):
+        """Runs the reminder coroutine, logging its failures."""
+        try:
+            await self._remind(reminder)
+        except Exception:
+            logging.exception('Failed to send reminder %r', reminder)
+
+    def _record_lag(self, reminder: Reminder, now: datetime):
+        """Records how late a reminder was fired."""
+        lag = max((now - reminder.deadline).total_seconds(), 0.)
+        self.lag_count += 1
+        self.lag_total += lag
+        self.lag_max = max(self.lag_max, lag)
+        if lag > LAG_WARNING_SECONDS:
+            logging.warning('Reminder for event %d fired %.1fs late',
+                            reminder.event_id, lag)
+
+    async def tick(self) -> float:
+        """Fires the due reminders and loads the upcoming ones.
+
+        Returns the amount of seconds until the next tick is needed.
+        """
+        now = self._clock()
+        if self._loaded_until is None:
+            self._loaded_until = now
+        for reminder in self._pop_due(now):
+            self._record_lag(reminder, now)
+            self._loop.create_task(self._fire(reminder))
+        if self._dirty:
+            await self._reload_dirty_guilds(now)
+        # Keep half a window ahead, so the heap never runs dry.
+        while self._loaded_until - now <= self._window / 2:
+            started = time.monotonic()
+            await self._load_next_window()
+            logging.debug('Loaded reminders window in %.3fs',
+                          time.monotonic() - started)
+
+        next_tick = self._loaded_until - self._window / 2
+        if self._heap:
+            next_tick = min(next_tick, self._heap[0][0])
+        return max((next_tick - now).total_seconds(), 0.)
+
+    async def run(self):
+        """Fires reminders until cancelled."""
+        while True:
+            # Cleared before the tick, so guilds changing while it awaits the
+            # database wake the next one up.
+            self._wakeup.clear()
+            delay = await self.tick()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=delay)
+            except asyncio.TimeoutError:
+                pass
+
+    def metrics(self) -> Dict[str, float]:
+        """Returns the scheduler metrics, suitable for exporting."""
+        return {
+            'reminders_pending': len(self._heap),
+            'reminders_fired': self.lag_count,
+            'reminders_lag_mean_seconds': (
+                self.lag_total / self.lag_count if self.lag_count else 0.),
+            'reminders_lag_max_seconds': self.lag_max,
+            'reminders_window_loads': self.window_loads,
+        }
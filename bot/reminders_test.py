@@ -0,0 +1,138 @@
+from __future__ import annotations
+
+__LICENSE__ = """
+Copyright 2019 Google LLC
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+    https://www.apache.org/licenses/LICENSE-2.0
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+import asyncio
+import unittest
+
+from datetime import datetime, timedelta
+from pytz import utc
+
+from api.common.testing import DatabaseTestFixture
+from api.mod_event.event import Event
+from api.mod_guild.guild import Guild
+from bot.executor import DatabaseExecutor
+from bot.reminders import ReminderScheduler
+
+
+NOW = datetime(2020, 10, 10, 20, 0, tzinfo=utc)
+
+
+class TestReminderScheduler(DatabaseTestFixture, unittest.TestCase):
+
+    def setUp(self):
+        """Add some events and a scheduler with a controlled clock."""
+        super().setUp()
+        self.guild = Guild('12345')
+        self.db.session.add(self.guild)
+        for title, minutes in (('Soon', 20), ('Later', 40), ('Tomorrow', 1440)):
+            self.db.session.add(Event(
+                self.guild, title, NOW + timedelta(minutes=minutes)))
+        self.db.session.commit()
+
+        self.now = NOW
+        self.sent = []
+        self.loop = asyncio.new_event_loop()
+
+        async def remind(reminder):
+            self.sent.append(reminder)
+
+        self.database = DatabaseExecutor(max_workers=1)
+        self.scheduler = ReminderScheduler(
+            remind, self.database, loop=self.loop, app=self.app,
+            clock=lambda: self.now)
+
+    def tearDown(self):
+        self.database.shutdown()
+        self.loop.close()
+        super().tearDown()
+
+    def tick(self, minutes: int) -> float:
+        """Moves the clock and runs the scheduler, including reminders."""
+        self.now = NOW + timedelta(minutes=minutes)
+        delay = self.loop.run_until_complete(self.scheduler.tick())
+        self.loop.run_until_complete(asyncio.sleep(0))
+        return delay
+
+    def test_loads_window(self):
+        """Ensure only the reminders within the window are loaded."""
+        delay = self.tick(0)
+
+        self.assertEqual(self.scheduler.metrics()['reminders_pending'], 2)
+        # The first reminder is due 15 minutes before the event.
+        self.assertEqual(delay, 5 * 60)
+
+    def test_fires_at_deadline(self):
+        """Ensure reminders fire once, at their deadline."""
+        self.tick(0)
+        self.tick(4)
+        self.assertEqual(self.sent, [])
+
+        self.tick(6)
+        self.tick(7)
+        self.assertEqual([r.title for r in self.sent], ['Soon'])
+        self.assertEqual(self.sent[0].date, NOW + timedelta(minutes=20))
+        metrics = self.scheduler.metrics()
+        self.assertEqual(metrics['reminders_fired'], 1)
+        self.assertEqual(metrics['reminders_lag_max_seconds'], 60)
+
+    def test_slides_window(self):
+        """Ensure the next window is loaded before the current one ends."""
+        self.tick(0)
+        self.tick(16)
+
+        self.assertEqual(self.scheduler.window_loads, 2)
+        self.tick(26)
+        self.assertEqual([r.title for r in self.sent], ['Soon', 'Later'])
+
+    def test_reloads_changed_guild(self):
+        """Ensure event writes replace the pending reminders of the guild."""
+        self.tick(0)
+        soon = Event.query.filter_by(title='Soon').one()
+        soon.date = NOW + timedelta(minutes=25)
+        self.db.session.commit()
+        self.scheduler.notify_changed('12345')
+
+        self.tick(1)
+        self.tick(6)
+        self.assertEqual(self.sent, [])
+        self.tick(10)
+        self.assertEqual([r.title for r in self.sent], ['Soon'])
+
+    def test_reloads_guild_changed_while_loading(self):
+        """Ensure a guild changing while reminders load is reloaded right away."""
+        load = self.scheduler._load
+        guild_ids = []
+
+        def notifying_load(start, end, guild_id=None):
+            if not guild_ids:
+                self.loop.call_soon_threadsafe(self.scheduler.notify_changed, '12345')
+            guild_ids.append(guild_id)
+            return load(start, end, guild_id)
+
+        self.scheduler._load = notifying_load
+        task = self.loop.create_task(self.scheduler.run())
+
+        async def reloaded():
+            while '12345' not in guild_ids:
+                await asyncio.sleep(.01)
+
+        self.loop.run_until_complete(asyncio.wait_for(reloaded(), timeout=1))
+        task.cancel()
+        self.loop.run_until_complete(asyncio.gather(task, return_exceptions=True))
+        self.assertEqual(guild_ids, [None, '12345'])
+
+
+if __name__ == '__main__':
+    unittest.main()
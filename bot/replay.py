@@ -0,0 +1,356 @@
+"""Replays a scenario of Discord traffic against the bot, through the fake
+Discord, and measures how fast the bot handles it.
+"""
+
+from __future__ import annotations
+
+__LICENSE__ = """
+Copyright 2019 Google LLC
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    https://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+import asyncio
+import json
+import logging
+import os
+import random
+import tempfile
+import threading
+import time
+
+from collections import deque
+from datetime import datetime, timedelta
+from pytz import utc
+from types import SimpleNamespace
+from typing import Any, Deque, Dict, List, NamedTuple, Optional
+
+import discord
+
+from api.app import app, db
+from api.mod_event.event import Event
+from api.mod_guild.guild import Guild
+from bot.bot import WowrganizerBot
+from bot.fake_discord import (OWNER_USER, FakeDiscord, RecordedRequest,
+                              make_guild, make_message, point_discord_to)
+
+
+# Delay without new guilds after which discord.py considers the bot ready.
+GUILD_READY_TIMEOUT_SECONDS = 0.5
+
+# Longest wait for the bot to handle the replayed traffic once sent.
+DRAIN_TIMEOUT_SECONDS = 30.
+
+# Guild IDs are Discord snowflakes; this one is in 2020.
+FIRST_GUILD_ID = 10 ** 17
+
+CHAT_LINES = (
+    'Who is up for a raid tonight?',
+    'gg',
+    'I will be late, start without me',
+    '!not_a_command',
+    'Does anyone have the new mount?',
+)
+
+
+class Scenario(NamedTuple):
+    """Traffic replayed against the bot.
+
+    :attr name: Describes the scenario.
+    :attr seed: Seeds the random generator, for reproducible traffic.
+    :attr guilds: Amount of guilds the bot is in when starting.
+    :attr events_per_guild: Amount of events of each guild this week.
+    :attr messages_per_second: Rate of the messages sent in the guilds.
+    :attr duration_seconds: How long messages are sent.
+    :attr command_ratio: Ratio of the messages which are bot commands.
+    :attr commands: Commands picked at random, with their arguments.
+    :attr guild_joins_per_second: Rate of the guilds the bot joins.
+    """
+    name: str
+    seed: int
+    guilds: int
+    events_per_guild: int
+    messages_per_second: float
+    duration_seconds: float
+    command_ratio: float
+    commands: List[str]
+    guild_joins_per_second: float
+
+    @classmethod
+    def load(cls, path: str) -> Scenario:
+        """Reads a scenario from a JSON file."""
+        with open(path) as f:
+            return cls(**json.load(f))
+
+    def scaled(self, rate: float) -> Scenario:
+        """Returns the scenario with its rates multiplied by rate."""
+        return self._replace(
+            messages_per_second=self.messages_per_second * rate,
+            guild_joins_per_second=self.guild_joins_per_second * rate)
+
+
+class LatencyStats:
+    """Latencies of an event, in seconds."""
+
+    def __init__(self):
+        self.values: List[float] = []
+
+    def add(self, seconds: float):
+        self.values.append(seconds)
+
+    def percentile(self, p: float) -> float:
+        if not self.values:
+            return 0.
+        ordered = sorted(self.values)
+        return ordered[min(int(p * len(ordered)), len(ordered) - 1)]
+
+    def row(self, name: str, elapsed: Optional[float] = None) -> List[Any]:
+        """Returns count, throughput and latency percentiles in ms."""
+        return [name, len(self.values),
+                len(self.values) / elapsed if elapsed else None,
+                self.percentile(.5) * 1000, self.percentile(.95) * 1000,
+                self.percentile(.99) * 1000,
+                max(self.values, default=0.) * 1000]
+
+
+REPORT_HEADERS = ('event', 'count', 'per second', 'p50 (ms)', 'p95 (ms)',
+                  'p99 (ms)', 'max (ms)')
+
+
+class ReplayReport:
+    """What was measured while replaying a scenario.
+
+    Latencies start when the fake Discord sends the event, and end when the
+    bot handler returns, or when the answer of the bot reaches Discord.
+
+    :attr ready: From the identification to the end of on_ready.
+    :attr ready_handler: Time spent in on_ready itself.
+    :attr messages: Handling of all messages, commands or not.
+    :attr commands: Handling of the command messages.
+    :attr replies: From a command message to its answer.
+    :attr guild_joins: Handling of the guilds joined.
+    :attr sent: Amount of messages sent to the bot.
+    :attr send_seconds: How long sending the messages took.
+    :attr handle_seconds: From the first message sent to the last handled.
+    :attr rate_limited: Amount of requests of the bot rejected with a 429.
+    :attr requests: Amount of REST requests of the bot.
+    """
+
+    def __init__(self, scenario: Scenario):
+        self.scenario = scenario
+        self.ready = LatencyStats()
+        self.ready_handler = LatencyStats()
+        self.messages = LatencyStats()
+        self.commands = LatencyStats()
+        self.replies = LatencyStats()
+        self.guild_joins = LatencyStats()
+        self.sent = 0
+        self.send_seconds = 0.
+        self.handle_seconds = 0.
+        self.rate_limited = 0
+        self.requests = 0
+
+    def rows(self) -> List[List[Any]]:
+        return [
+            self.ready.row('on_ready (from identify)'),
+            self.ready_handler.row('on_ready (handler)'),
+            self.messages.row('on_message', self.handle_seconds),
+            self.commands.row('on_message (commands)', self.handle_seconds),
+            self.replies.row('command answers', self.handle_seconds),
+            self.guild_joins.row('on_guild_join', self.handle_seconds),
+        ]
+
+
+class _Traffic:
+    """Book-keeping of the events sent, shared by the fake and the bot."""
+
+    def __init__(self):
+        self.message_sent_at: Dict[int, float] = {}
+        self.command_ids = set()
+        self.join_sent_at: Dict[int, float] = {}
+        self.pending_commands: Dict[str, Deque[float]] = {}
+        self.handled = 0
+        self.ready = threading.Event()
+        self.first_sent_at: Optional[float] = None
+        self.last_handled_at = 0.
+
+
+def _seed_database(scenario: Scenario, guilds: List[Dict[str, Any]]):
+    """Stores the guilds and their events of this week."""
+    now = datetime.now(utc)
+    with app.app_context():
+        db.create_all()
+        Guild.bulk_resync_from_discord_guilds([
+            SimpleNamespace(id=int(g['id']), name=g['name'], icon_url='')
+            for g in guilds])
+        Event.bulk_write([{
+            'guild_id': int(g['id']),
+            'title': 'Raid %d' % index,
+            'description': None,
+            '_date_utc': now + timedelta(days=index % 7, hours=index),
+            'timezone_name': 'UTC',
+            'repetition': None,
+        } for g in guilds for index in range(scenario.events_per_guild)])
+        db.session.commit()
+
+
+def _instrument(bot: WowrganizerBot, fake: FakeDiscord, traffic: _Traffic,
+                report: ReplayReport):
+    """Wraps the bot handlers to record when they are done."""
+    on_ready, on_message = bot.on_ready, bot.on_message
+    on_guild_join = bot.on_guild_join
+    clock = time.perf_counter
+
+    async def timed_on_ready():
+        start = clock()
+        await on_ready()
+        report.ready_handler.add(clock() - start)
+        report.ready.add(clock() - fake.identified_at)
+        traffic.ready.set()
+
+    async def timed_on_message(message: discord.Message):
+        await on_message(message)
+        sent_at = traffic.message_sent_at.pop(message.id, None)
+        if sent_at is None:
+            return
+        now = clock()
+        report.messages.add(now - sent_at)
+        if message.id in traffic.command_ids:
+            report.commands.add(now - sent_at)
+        traffic.handled += 1
+        traffic.last_handled_at = now
+
+    async def timed_on_guild_join(guild: discord.Guild):
+        await on_guild_join(guild)
+        sent_at = traffic.join_sent_at.pop(guild.id, None)
+        if sent_at is not None:
+            report.guild_joins.add(clock() - sent_at)
+
+    bot.on_ready = timed_on_ready
+    bot.on_message = timed_on_message
+    bot.on_guild_join = timed_on_guild_join
+
+    def on_request(request: RecordedRequest):
+        report.requests += 1
+        if request.status == 429:
+            report.rate_limited += 1
+            return
+        if request.method == 'POST' and request.path.startswith('/channels/'):
+            pending = traffic.pending_commands.get(request.path.split('/')[2])
+            if pending:
+                report.replies.add(request.received_at - pending.popleft())
+
+    fake.on_request = on_request
+
+
+async def _send_traffic(scenario: Scenario, fake: FakeDiscord,
+                        traffic: _Traffic, report: ReplayReport):
+    """Sends the messages and guild joins at the scenario rates."""
+    rng = random.Random(scenario.seed)
+    clock = time.perf_counter
+    total_messages = int(scenario.messages_per_second * scenario.duration_seconds)
+    total_joins = int(scenario.guild_joins_per_second * scenario.duration_seconds)
+    authors = [{'id': str(900000000000000000 + i), 'username': 'Player %d' % i,
+                'discriminator': '%04d' % i, 'avatar': None} for i in range(100)]
+    messages, joins = 0, 0
+    start = clock()
+    traffic.first_sent_at = start
+    while messages < total_messages or joins < total_joins:
+        elapsed = clock() - start
+        due_messages = min(int(elapsed * scenario.messages_per_second) + 1,
+                           total_messages)
+        while messages < due_messages:
+            guild_id = FIRST_GUILD_ID + rng.randrange(scenario.guilds)
+            channel_id = str(guild_id + 1)
+            is_command = rng.random() < scenario.command_ratio
+            content = '!' + rng.choice(scenario.commands) if is_command \
+                else rng.choice(CHAT_LINES)
+            author = rng.choice(authors)
+            # Settings commands are only allowed to the guild managers.
+            if is_command:
+                author = OWNER_USER
+            message = make_message(channel_id, content, author, str(guild_id))
+            message_id = int(message['id'])
+            if is_command:
+                traffic.command_ids.add(message_id)
+            traffic.message_sent_at[message_id] = clock()
+            sent_at = await fake.dispatch('MESSAGE_CREATE', message)
+            if is_command:
+                traffic.pending_commands.setdefault(
+                    channel_id, deque()).append(sent_at)
+            messages += 1
+        due_joins = min(int(elapsed * scenario.guild_joins_per_second),
+                        total_joins)
+        while joins < due_joins:
+            guild_id = FIRST_GUILD_ID + scenario.guilds + joins
+            traffic.join_sent_at[guild_id] = clock()
+            await fake.dispatch('GUILD_CREATE', make_guild(
+                guild_id, 'Joined guild %d' % joins))
+            joins += 1
+        await asyncio.sleep(0.001)
+    report.sent = messages
+    report.send_seconds = clock() - start
+
+
+def run_scenario(scenario: Scenario,
+                 drain_timeout: float = DRAIN_TIMEOUT_SECONDS) -> ReplayReport:
+    """Replays a scenario against a bot using a temporary database.
+
+    While replaying, the bot application and discord.py are pointed to the
+    temporary database and the fake Discord; both are restored afterwards.
+    """
+    report = ReplayReport(scenario)
+    traffic = _Traffic()
+    guilds = [make_guild(FIRST_GUILD_ID + index, 'Guild %d' % index)
+              for index in range(scenario.guilds)]
+
+    handle, path = tempfile.mkstemp(suffix='.db')
+    database_uri = app.config['SQLALCHEMY_DATABASE_URI']
+    discord_base = discord.http.Route.BASE
+    app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///%s' % path
+    _seed_database(scenario, guilds)
+
+    fake = FakeDiscord(guilds)
+    fake.start()
+    point_discord_to(fake)
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    bot = WowrganizerBot(loop=loop, guild_ready_timeout=GUILD_READY_TIMEOUT_SECONDS)
+    _instrument(bot, fake, traffic, report)
+
+    async def replay():
+        bot_task = loop.create_task(bot.start('fake-token'))
+        await loop.run_in_executor(None, traffic.ready.wait)
+        await asyncio.wrap_future(fake.call(
+            _send_traffic(scenario, fake, traffic, report)))
+        deadline = time.perf_counter() + drain_timeout
+        while traffic.handled < report.sent and time.perf_counter() < deadline:
+            await asyncio.sleep(0.05)
+        if traffic.handled < report.sent:
+            logging.warning('Only %d messages out of %d were handled',
+                            traffic.handled, report.sent)
+        report.handle_seconds = traffic.last_handled_at - traffic.first_sent_at
+        await bot.close()
+        await bot_task
+
+    try:
+        loop.run_until_complete(replay())
+    finally:
+        loop.close()
+        asyncio.set_event_loop(None)
+        fake.stop()
+        discord.http.Route.BASE = discord_base
+        app.config['SQLALCHEMY_DATABASE_URI'] = database_uri
+        os.close(handle)
+        os.remove(path)
+    return report
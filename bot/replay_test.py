@@ -0,0 +1,52 @@
+from __future__ import annotations
+
+__LICENSE__ = """
+Copyright 2019 Google LLC
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+    https://www.apache.org/licenses/LICENSE-2.0
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+import os
+import unittest
+
+from bot.replay import Scenario, run_scenario
+
+
+class TestReplay(unittest.TestCase):
+
+    def test_scenarios_load(self):
+        """Ensure the checked-in scenarios are valid."""
+        directory = os.path.join(os.path.dirname(__file__), 'scenarios')
+        for name in os.listdir(directory):
+            scenario = Scenario.load(os.path.join(directory, name))
+            self.assertGreater(scenario.messages_per_second, 0)
+            self.assertEqual(scenario.scaled(2).messages_per_second,
+                             2 * scenario.messages_per_second)
+
+    def test_replay(self):
+        """Ensure the bot connects to the fake Discord and answers commands."""
+        scenario = Scenario(
+            name='test', seed=1, guilds=5, events_per_guild=2,
+            messages_per_second=20, duration_seconds=1, command_ratio=1.,
+            commands=['weekly', 'help'], guild_joins_per_second=2)
+
+        report = run_scenario(scenario, drain_timeout=5)
+
+        self.assertEqual(len(report.ready.values), 1)
+        self.assertEqual(report.sent, 20)
+        self.assertEqual(len(report.messages.values), 20)
+        self.assertEqual(len(report.commands.values), 20)
+        self.assertGreater(len(report.replies.values), 0)
+        self.assertEqual(len(report.guild_joins.values), 2)
+        self.assertEqual(report.rate_limited, 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,126 @@
+"""Keeps the settings of the guilds in memory."""
+
+from __future__ import annotations
+
+__LICENSE__ = """
+Copyright 2019 Google LLC
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    https://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+from datetime import tzinfo
+from flask import Flask
+from pytz import timezone
+from typing import Dict, Iterable, List, NamedTuple, Optional
+
+from api.base import app as default_app, db
+from api.common.sharding import Shard
+from api.mod_guild.guild import GuildSettings
+
+
+class Settings(NamedTuple):
+    """Settings of a guild, as used by the bot."""
+    timezone: tzinfo
+    prefix: str
+    board_channel_id: Optional[str] = None
+    board_message_id: Optional[str] = None
+
+    @classmethod
+    def from_model(cls, model: GuildSettings) -> Settings:
+        """Converts the stored settings."""
+        return cls(timezone(model.timezone_name), model.prefix,
+                   model.board_channel_id, model.board_message_id)
+
+
+DEFAULT_SETTINGS = Settings(timezone(GuildSettings.DEFAULT_TIMEZONE_NAME),
+                            GuildSettings.DEFAULT_PREFIX)
+
+
+class GuildSettingsCache:
+    """Settings of all the guilds of the bot, loaded at once on startup.
+
+    Reading settings never hits the database, so they can be read for each
+    message. Changes go through update(), which writes them to the database
+    and replaces the cached settings in place.
+    """
+
+    def __init__(self, app: Flask = default_app):
+        self._app = app
+        self._settings: Dict[str, Settings] = {}
+
+    def get(self, guild_id: Optional[str]) -> Settings:
+        """Returns the settings of a guild, the default ones for DMs."""
+        if guild_id is None:
+            return DEFAULT_SETTINGS
+        return self._settings.get(str(guild_id), DEFAULT_SETTINGS)
+
+    def load(self, shard: Optional[Shard] = None):
+        """Loads the settings of all the guilds, or of the guilds of a shard.
+
+        Blocks on the database.
+        """
+        with self._app.app_context():
+            query = GuildSettings.query
+            if shard is not None:
+                query = query.filter(shard.filter(GuildSettings.guild_id))
+            self._settings = {model.guild_id: Settings.from_model(model)
+                              for model in query}
+
+    def _write(self, guild_id: str, **columns) -> Settings:
+        """Stores the given columns of the settings of a guild."""
+        guild_id = str(guild_id)
+        with self._app.app_context():
+            model = GuildSettings.query.get(guild_id)
+            if model is None:
+                model = GuildSettings(guild_id)
+                db.session.add(model)
+            for name, value in columns.items():
+                setattr(model, name, value)
+            db.session.commit()
+            settings = Settings.from_model(model)
+        self._settings[guild_id] = settings
+        return settings
+
+    def update(self, guild_id: str, timezone_name: Optional[str] = None,
+               prefix: Optional[str] = None) -> Settings:
+        """Changes the settings of a guild and returns the new ones.
+
+        Blocks on the database.
+        """
+        columns = {}
+        if timezone_name is not None:
+            columns['timezone_name'] = timezone_name
+        if prefix is not None:
+            columns['prefix'] = prefix
+        return self._write(guild_id, **columns)
+
+    def set_board(self, guild_id: str, channel_id: Optional[str],
+                  message_id: Optional[str]) -> Settings:
+        """Changes the message listing the events of a guild, or removes it.
+
+        Blocks on the database.
+        """
+        return self._write(guild_id, board_channel_id=channel_id,
+                           board_message_id=message_id)
+
+    def guilds_with_board(self) -> List[str]:
+        """Returns the guilds having a message listing their events."""
+        return [guild_id for guild_id, settings in self._settings.items()
+                if settings.board_message_id is not None]
+
+    def guilds_by_timezone(self, guild_ids: Iterable[str]) -> Dict[str, List[str]]:
+        """Groups guilds by the name of their timezone."""
+        groups: Dict[str, List[str]] = {}
+        for guild_id in guild_ids:
+            groups.setdefault(self.get(guild_id).timezone.zone, []).append(guild_id)
+        return groups
@@ -0,0 +1,88 @@
+from __future__ import annotations
+
+__LICENSE__ = """
+Copyright 2019 Google LLC
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+    https://www.apache.org/licenses/LICENSE-2.0
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+import unittest
+
+from api.common.sharding import Shard
+from api.common.testing import DatabaseTestFixture
+from api.mod_guild.guild import Guild, GuildSettings
+from bot.settings import DEFAULT_SETTINGS, GuildSettingsCache
+
+
+class TestGuildSettingsCache(DatabaseTestFixture, unittest.TestCase):
+
+    GUILD_IDS = [str((index << 22) + 12345) for index in range(2)]
+
+    def setUp(self):
+        """Store the settings of two guilds."""
+        super().setUp()
+        for guild_id, prefix in zip(self.GUILD_IDS, ('?', '$')):
+            self.db.session.add(Guild(guild_id))
+            settings = GuildSettings(guild_id)
+            settings.timezone_name = 'Europe/Paris'
+            settings.prefix = prefix
+            self.db.session.add(settings)
+        self.db.session.commit()
+        self.cache = GuildSettingsCache(self.app)
+
+    def test_load(self):
+        """Ensure the settings of all guilds are loaded at once."""
+        self.cache.load()
+
+        settings = self.cache.get(self.GUILD_IDS[1])
+        self.assertEqual(settings.prefix, '$')
+        self.assertEqual(settings.timezone.zone, 'Europe/Paris')
+        self.assertEqual(self.cache.get('54321'), DEFAULT_SETTINGS)
+        self.assertEqual(self.cache.get(None), DEFAULT_SETTINGS)
+
+    def test_load_shard(self):
+        """Ensure shards only load the settings of their guilds."""
+        self.cache.load(Shard(1, 2))
+
+        self.assertEqual(self.cache.get(self.GUILD_IDS[0]), DEFAULT_SETTINGS)
+        self.assertEqual(self.cache.get(self.GUILD_IDS[1]).prefix, '$')
+
+    def test_update(self):
+        """Ensure changes are stored and applied to the cache in place."""
+        self.cache.load()
+        self.cache.update('54321', timezone_name='America/New_York')
+        self.cache.update(self.GUILD_IDS[0], prefix='!!')
+
+        self.assertEqual(self.cache.get('54321').timezone.zone, 'America/New_York')
+        self.assertEqual(self.cache.get('54321').prefix, '!')
+        self.assertEqual(self.cache.get(self.GUILD_IDS[0]).prefix, '!!')
+        self.assertEqual(GuildSettings.query.get('54321').timezone_name,
+                         'America/New_York')
+        self.assertEqual(
+            self.cache.guilds_by_timezone(['54321', self.GUILD_IDS[0], '1']),
+            {'America/New_York': ['54321'], 'Europe/Paris': [self.GUILD_IDS[0]],
+             'UTC': ['1']})
+
+    def test_set_board(self):
+        """Ensure boards are stored, listed, then removed."""
+        self.cache.load()
+        self.cache.set_board(self.GUILD_IDS[0], '10', '20')
+
+        self.assertEqual(self.cache.get(self.GUILD_IDS[0]).board_message_id, '20')
+        self.assertEqual(self.cache.get(self.GUILD_IDS[0]).prefix, '?')
+        self.assertEqual(self.cache.guilds_with_board(), [self.GUILD_IDS[0]])
+
+        self.cache.set_board(self.GUILD_IDS[0], None, None)
+        self.assertEqual(self.cache.guilds_with_board(), [])
+        self.assertIsNone(GuildSettings.query.get(self.GUILD_IDS[0]).board_channel_id)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,162 @@
+"""Runs the bot shards in their own processes and keeps them alive."""
+
+from __future__ import annotations
+
+__LICENSE__ = """
+Copyright 2019 Google LLC
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    https://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+import asyncio
+import logging
+import multiprocessing
+import time
+
+from typing import Callable, Dict, List, Optional
+
+
+# Discord rejects shards identifying less than 5 seconds apart.
+IDENTIFY_DELAY_SECONDS = 5.
+
+# Bounds of the delay before restarting a shard which stopped.
+MIN_RESTART_DELAY_SECONDS = 1.
+MAX_RESTART_DELAY_SECONDS = 60.
+
+# A shard running this long is considered healthy: its next failure is
+# restarted after the minimum delay again.
+HEALTHY_UPTIME_SECONDS = 300.
+
+
+def run_shard(token: str, shard_id: int, shard_count: int):
+    """Runs a single shard of the bot until it stops; process entry point."""
+    # Imported here so the supervisor process does not set up the bot.
+    from api.app import app  # noqa: F401, configures the models.
+    from bot.bot import make_bot_instance
+    from config.discord import metrics_dir
+
+    logging.root.setLevel(logging.INFO)
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    bot = make_bot_instance(loop=loop, shard_id=shard_id,
+                            shard_count=shard_count, metrics_dir=metrics_dir)
+    try:
+        loop.run_until_complete(bot.start(token))
+    finally:
+        loop.run_until_complete(bot.close())
+        loop.close()
+
+
+class ShardProcess:
+    """Book-keeping of the process running a shard.
+
+    :attr shard_id: The shard run by the process.
+    :attr process: The current process, None until started.
+    :attr started_at: When the current process was started.
+    :attr restarts: Amount of consecutive restarts of the shard.
+    :attr next_start: When the shard should be (re)started.
+    """
+
+    def __init__(self, shard_id: int, next_start: float):
+        self.shard_id = shard_id
+        self.process: Optional[multiprocessing.Process] = None
+        self.started_at = 0.
+        self.restarts = 0
+        self.next_start = next_start
+
+
+class ShardSupervisor:
+    """Starts one process per shard and restarts the ones which stop.
+
+    Shards are started IDENTIFY_DELAY_SECONDS apart, as requested by Discord.
+    Shards stopping are restarted after an exponential backoff, reset once
+    they ran for HEALTHY_UPTIME_SECONDS.
+    """
+
+    def __init__(self, token: str, shard_count: int,
+                 process_factory: Optional[Callable[..., multiprocessing.Process]] = None,
+                 clock: Callable[[], float] = time.monotonic):
+        self._token = token
+        self._shard_count = shard_count
+        self._clock = clock
+        self._process_factory = process_factory or multiprocessing.get_context(
+            'spawn').Process
+        now = clock()
+        self.shards: List[ShardProcess] = [
+            ShardProcess(shard_id, now + shard_id * IDENTIFY_DELAY_SECONDS)
+            for shard_id in range(shard_count)]
+        self._stopping = False
+
+    def _start(self, shard: ShardProcess):
+        """Starts the process of a shard."""
+        logging.info('Starting shard %d/%d', shard.shard_id, self._shard_count)
+        shard.process = self._process_factory(
+            target=run_shard, name='Shard %d' % shard.shard_id,
+            args=(self._token, shard.shard_id, self._shard_count))
+        shard.process.start()
+        shard.started_at = self._clock()
+
+    def check(self):
+        """Starts the shards due, and schedules the restart of dead ones."""
+        if self._stopping:
+            return
+        now = self._clock()
+        for shard in self.shards:
+            if shard.process is not None and shard.process.is_alive():
+                continue
+            if shard.process is not None:
+                uptime = now - shard.started_at
+                if uptime >= HEALTHY_UPTIME_SECONDS:
+                    shard.restarts = 0
+                delay = min(MIN_RESTART_DELAY_SECONDS * 2 ** shard.restarts,
+                            MAX_RESTART_DELAY_SECONDS)
+                logging.warning(
+                    'Shard %d stopped with code %s after %.0fs; restarting '
+                    'in %.0fs', shard.shard_id, shard.process.exitcode,
+                    uptime, delay)
+                shard.restarts += 1
+                shard.process = None
+                shard.next_start = now + delay
+            if now >= shard.next_start:
+                self._start(shard)
+
+    def status(self) -> Dict[int, Dict[str, float]]:
+        """Returns the state of each shard, suitable for exporting."""
+        now = self._clock()
+        return {
+            shard.shard_id: {
+                'alive': bool(shard.process and shard.process.is_alive()),
+                'uptime_seconds': (now - shard.started_at
+                                   if shard.process else 0.),
+                'restarts': shard.restarts,
+            }
+            for shard in self.shards
+        }
+
+    def stop(self):
+        """Stops all the shards."""
+        self._stopping = True
+        processes = [s.process for s in self.shards if s.process is not None]
+        for process in processes:
+            process.terminate()
+        for process in processes:
+            process.join()
+
+    def run(self, interval: float = 1.):
+        """Supervises the shards until stopped."""
+        try:
+            while not self._stopping:
+                self.check()
+                time.sleep(interval)
+        finally:
+            self.stop()
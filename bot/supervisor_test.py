@@ -0,0 +1,126 @@
+from __future__ import annotations
+
+__LICENSE__ = """
+Copyright 2019 Google LLC
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+    https://www.apache.org/licenses/LICENSE-2.0
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+import unittest
+
+from datetime import datetime
+from pytz import utc
+
+from api.common.sharding import Shard
+from api.common.testing import DatabaseTestFixture
+from api.mod_event.event import Event
+from api.mod_guild.guild import Guild
+from bot.supervisor import ShardSupervisor
+
+
+class FakeProcess:
+    """Stands for a shard process, without starting anything."""
+
+    def __init__(self, target, name, args):
+        self.args = args
+        self.alive = False
+        self.exitcode = None
+
+    def start(self):
+        self.alive = True
+
+    def is_alive(self):
+        return self.alive
+
+    def terminate(self):
+        self.alive = False
+
+    def join(self):
+        pass
+
+
+class TestShardSupervisor(unittest.TestCase):
+
+    def setUp(self):
+        self.now = 0.
+        self.processes = []
+
+        def factory(**kwargs):
+            process = FakeProcess(**kwargs)
+            self.processes.append(process)
+            return process
+
+        self.supervisor = ShardSupervisor(
+            'token', 3, process_factory=factory, clock=lambda: self.now)
+
+    def test_staggered_start(self):
+        """Ensure shards identify a few seconds apart."""
+        self.supervisor.check()
+        self.assertEqual([p.args[1:] for p in self.processes], [(0, 3)])
+
+        self.now = 10.
+        self.supervisor.check()
+        self.assertEqual([p.args[1:] for p in self.processes],
+                         [(0, 3), (1, 3), (2, 3)])
+
+    def test_restart_with_backoff(self):
+        """Ensure dead shards are restarted, later each time."""
+        self.now = 10.
+        self.supervisor.check()
+        for delay in (1., 2., 4.):
+            self.processes[-1].alive = False
+            self.supervisor.check()
+            self.now += delay - 0.5
+            self.supervisor.check()
+            self.assertFalse(self.supervisor.status()[2]['alive'])
+            self.now += 0.5
+            self.supervisor.check()
+            self.assertTrue(self.supervisor.status()[2]['alive'])
+        self.assertEqual(self.supervisor.status()[2]['restarts'], 3)
+        self.assertEqual(len(self.processes), 6)
+
+    def test_stop(self):
+        """Ensure stopping terminates all shards."""
+        self.now = 10.
+        self.supervisor.check()
+        self.supervisor.stop()
+        self.assertFalse(any(p.alive for p in self.processes))
+
+
+class TestShard(DatabaseTestFixture, unittest.TestCase):
+
+    # Guild IDs are Discord snowflakes; the shard depends on bits 22 and up.
+    GUILD_IDS = [(index << 22) + 12345 for index in range(4)]
+
+    def test_owns(self):
+        """Ensure guilds are split as Discord does."""
+        shard = Shard(1, 2)
+        self.assertEqual([shard.owns(g) for g in self.GUILD_IDS],
+                         [False, True, False, True])
+        self.assertTrue(shard.owns(str(self.GUILD_IDS[1])))
+
+    def test_occurrences_of_shard(self):
+        """Ensure events are filtered on the shard in database."""
+        for guild_id in self.GUILD_IDS:
+            guild = Guild(str(guild_id))
+            self.db.session.add(guild)
+            self.db.session.add(Event(
+                guild, 'Raid', datetime(2020, 10, 10, tzinfo=utc)))
+        self.db.session.commit()
+
+        occurrences = Event.occurrences_in_range(
+            datetime(2020, 10, 1, tzinfo=utc), datetime(2020, 11, 1, tzinfo=utc),
+            shard=Shard(1, 2))
+        self.assertEqual(sorted(o.event.guild_id for o in occurrences),
+                         self.GUILD_IDS[1::2])
+
+
+if __name__ == '__main__':
+    unittest.main()
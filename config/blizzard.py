@@ -20,6 +20,8 @@ limitations under the License.
 
 from wowapi import WowApi
 
+from api.mod_wow.cache import CachedWowApi, ResponseStore
+from api.mod_wow.quota import QuotaManager, REQUESTS_PER_HOUR, REQUESTS_PER_SECOND
 from config.base import config, ConfigurationError
 
 if 'blizzard' not in config:
@@ -41,6 +43,20 @@ if 'client_secret' not in config[USER_SECTION]:
 client_id = config[USER_SECTION]['client_id']
 client_secret = config[USER_SECTION]['client_secret']
 
+# SQLite file keeping the API responses across restarts; responses are only
+# cached in memory if left unset.
+cache_file = config.get(USER_SECTION, 'cache_file', fallback=None) or None
+
+# Rate limits of the OAuth2 client.
+requests_per_second = config.getint(
+    USER_SECTION, 'requests_per_second', fallback=REQUESTS_PER_SECOND)
+requests_per_hour = config.getint(
+    USER_SECTION, 'requests_per_hour', fallback=REQUESTS_PER_HOUR)
+
+# SQLite file sharing the rate limits budget between the processes using the
+# client; each process has a budget of its own if left unset.
+quota_file = config.get(USER_SECTION, 'quota_file', fallback=None) or None
+
 _service = None
 
 
@@ -50,5 +66,7 @@ def get_wow_handler() -> WowApi:
     if _service is not None:
         return _service
 
-    _service = WowApi(client_id, client_secret)
+    store = ResponseStore(cache_file) if cache_file is not None else None
+    quota = QuotaManager(requests_per_second, requests_per_hour, quota_file)
+    _service = CachedWowApi(client_id, client_secret, store, quota=quota)
     return _service
@@ -50,3 +50,6 @@ if 'bot_token' not in config[USER_SECTION]:
 oauth2_client_id = config[USER_SECTION]['oauth2_client_id']
 oauth2_client_secret = config[USER_SECTION]['oauth2_client_secret']
 bot_token = config[USER_SECTION]['bot_token']
+
+# Directory where each bot shard writes its metrics, if set.
+metrics_dir = config.get(USER_SECTION, 'metrics_dir', fallback=None) or None
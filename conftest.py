@@ -0,0 +1,27 @@
+"""Prepares the configuration the tests need, without any real key."""
+
+from __future__ import annotations
+
+__LICENSE__ = """
+Copyright 2019 Google LLC
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    https://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+import os
+import shutil
+
+# The configuration refuses to load without a secrets file, which is never
+# committed; the tests run with the blank one.
+if not os.path.exists('secrets.cfg'):
+    shutil.copyfile('secrets.sample.cfg', 'secrets.cfg')